@@ -0,0 +1,94 @@
+# bench_answer_store.py
+#
+# Measures how quickly a restarted bot gets its answers back from the
+# persistent answer store: opening the file, the first lookup (served from
+# disk before warming finishes), warming the in-memory cache, and point
+# lookups against a store of --entries answers.
+#
+#   python benchmarks/bench_answer_store.py --entries 100000
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from answer_cache import AnswerCache
+from answer_store import SqliteAnswerStore
+
+ANSWER = "Full-time employees accrue 20 vacation days per year, prorated in the first year. " * 4
+
+
+def populate(path, entries):
+    store = SqliteAnswerStore(path, max_entries=entries)
+    started = time.perf_counter()
+    for i in range(entries):
+        store.put(f"question number {i} about policy", ANSWER)
+        if i % 5000 == 4999:
+            # Keep the bounded write queue from overflowing
+            store.flush()
+    store.flush()
+    return time.perf_counter() - started, store.dropped_writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent answer store startup benchmark")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--cache-entries", type=int, default=1000, help="ANSWER_CACHE_MAX_ENTRIES for warming")
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "answers.sqlite3")
+        populate_seconds, dropped = populate(path, args.entries)
+
+        started = time.perf_counter()
+        cache = AnswerCache(max_entries=args.cache_entries, store=SqliteAnswerStore(path, max_entries=args.entries))
+        open_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first = cache.get("question number 7 about policy")
+        first_lookup_seconds = time.perf_counter() - started
+        assert first == ANSWER
+
+        started = time.perf_counter()
+        warmed = cache.warm()
+        warm_seconds = time.perf_counter() - started
+
+        keys = [f"question number {random.randrange(args.entries)} about policy" for _ in range(args.lookups)]
+        started = time.perf_counter()
+        for key in keys:
+            cache.store.get(key)
+        store_lookup_us = (time.perf_counter() - started) / args.lookups * 1e6
+
+        full = AnswerCache(max_entries=args.entries, store=SqliteAnswerStore(path, max_entries=args.entries))
+        started = time.perf_counter()
+        full.warm()
+        full_warm_seconds = time.perf_counter() - started
+        file_mb = os.path.getsize(path) / 1e6
+
+    results = {
+        "entries": args.entries,
+        "populate_seconds": populate_seconds,
+        "dropped_writes": dropped,
+        "file_mb": file_mb,
+        "open_seconds": open_seconds,
+        "first_lookup_ms": first_lookup_seconds * 1000,
+        "warm_entries": warmed,
+        "warm_seconds": warm_seconds,
+        "full_warm_seconds": full_warm_seconds,
+        "store_lookup_us": store_lookup_us,
+    }
+    print(f"{args.entries} entries ({file_mb:.1f} MB): open {open_seconds * 1000:.1f}ms, "
+          f"first lookup {first_lookup_seconds * 1000:.2f}ms, warm {warmed} in {warm_seconds * 1000:.1f}ms, "
+          f"warm all in {full_warm_seconds * 1000:.0f}ms, store lookup {store_lookup_us:.1f}us")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# bench_logging.py
+#
+# Measures the logging cost a request thread pays on the message path, before
+# and after moving to queued, lazily formatted and sampled logging.
+#
+# "eager" replays the old log calls: the full question, KB answer and an
+# indented dump of the raw Bedrock response, formatted and written to the
+# stream on the calling thread. "queued" replays the current calls through
+# log_setup.configure_logging(). Output goes to a temporary file so the write
+# cost is real but the terminal is not flooded.
+#
+#   python benchmarks/bench_logging.py --requests 20000
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import log_setup
+from log_setup import configure_logging, shutdown_logging, bind_request_id, log_payload, LazyJson
+
+QUESTION = "How many vacation days do I get in my first year, and do unused days roll over?"
+ANSWER = ("Full-time employees accrue 20 vacation days per year, prorated in the first year. "
+          "Up to five unused days roll over into the first quarter of the following year. ") * 3
+RESPONSE_BODY = {
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": "anthropic.claude-3-haiku-20240307-v1:0",
+    "content": [{"type": "text", "text": ANSWER}],
+    "stop_reason": "end_turn",
+    "usage": {"input_tokens": 812, "output_tokens": 164},
+}
+
+
+def eager_request(log):
+    log.info(f"Received message: {QUESTION}")
+    log.info(f"Raw response from Bedrock: {json.dumps(RESPONSE_BODY, indent=2)}")
+    log.info(f"Claude route=fast reason=simple_prompt max_tokens=1024 latency={412.0:.0f}ms "
+             f"tokens={812}/{164} cost=${0.00041:.5f}")
+    log.info(f"Knowledge base response: {ANSWER}")
+    log.info(f"Responding with knowledge base answer: {ANSWER}")
+
+
+def queued_request(log):
+    bind_request_id()
+    log_payload(log, "Received message: %s", QUESTION)
+    log_payload(log, "Raw response from Bedrock: %s", LazyJson(RESPONSE_BODY, indent=2))
+    log.info("Claude route=%s reason=%s max_tokens=%d latency=%.0fms tokens=%d/%d cost=$%.5f",
+             "fast", "simple_prompt", 1024, 412.0, 812, 164, 0.00041)
+    log_payload(log, "Knowledge base response: %s", ANSWER)
+    log.info("Responding with knowledge base answer")
+
+
+def run(request_fn, log, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        request_fn(log)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request-path logging cost benchmark")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=0.01, help="LOG_PAYLOAD_SAMPLE_RATE for the queued run")
+    parser.add_argument("--format", choices=("console", "json"), default="json")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    log = logging.getLogger("bench.logging")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "eager.log"), "w") as stream:
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            root = logging.getLogger()
+            for existing in list(root.handlers):
+                root.removeHandler(existing)
+            root.addHandler(handler)
+            root.setLevel(logging.INFO)
+            eager = run(eager_request, log, args.requests)
+            root.removeHandler(handler)
+
+        log_setup.PAYLOAD_SAMPLE_RATE = args.sample_rate
+        with open(os.path.join(tmp, "queued.log"), "w") as stream:
+            configure_logging(level="INFO", fmt=args.format, stream=stream, queue_size=args.requests * 5)
+            queued = run(queued_request, log, args.requests)
+            drain_started = time.perf_counter()
+            shutdown_logging()
+            drain = time.perf_counter() - drain_started
+
+    eager_us = eager / args.requests * 1e6
+    queued_us = queued / args.requests * 1e6
+    results = {
+        "requests": args.requests,
+        "sample_rate": args.sample_rate,
+        "eager_us_per_request": eager_us,
+        "queued_us_per_request": queued_us,
+        "saved_us_per_request": eager_us - queued_us,
+        "writer_drain_seconds": drain,
+    }
+    print(f"eager: {eager_us:.1f}us per request, queued: {queued_us:.1f}us per request, "
+          f"saved {eager_us - queued_us:.1f}us on the request thread "
+          f"(writer drained the backlog in {drain:.2f}s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# bench_qa_index.py
+#
+# Measures Q&A index build time, memory per entry and query latency.
+#
+#   python benchmarks/bench_qa_index.py --sizes 10000 100000
+
+import os
+import sys
+import json
+import random
+import time
+import tracemalloc
+import argparse
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from qa_index import QAIndex
+
+VOCABULARY_SIZE = 20000
+
+
+def make_vocabulary(rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 10))) for _ in range(VOCABULARY_SIZE)]
+
+
+def make_entries(count, rng):
+    # Word frequencies follow a Zipf-like distribution, as in real question text
+    vocabulary = make_vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+    entries = []
+    for i in range(count):
+        words = rng.choices(vocabulary, weights=weights, k=rng.randint(6, 14))
+        entries.append({"question": " ".join(words) + "?", "answer": f"Answer {i}"})
+    return entries
+
+
+def make_query(entry, rng):
+    # Paraphrase a stored question by dropping one word
+    words = entry["question"].rstrip("?").split()
+    del words[rng.randrange(len(words))]
+    return " ".join(words)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(size, queries, rng):
+    entries = make_entries(size, rng)
+    started = time.perf_counter()
+    index = QAIndex()
+    index.build(entries)
+    build_seconds = time.perf_counter() - started
+
+    # tracemalloc slows allocation down a lot, so memory is measured on a separate build
+    tracemalloc.start()
+    measured = QAIndex()
+    measured.build(entries)
+    memory_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del measured
+
+    latencies = []
+    for _ in range(queries):
+        query = make_query(rng.choice(entries), rng)
+        started = time.perf_counter()
+        index.lookup(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "entries": size,
+        "build_seconds": build_seconds,
+        "memory_bytes_per_entry": memory_bytes / size,
+        "query_ms_p50": percentile(latencies, 50),
+        "query_ms_p95": percentile(latencies, 95),
+        "query_ms_p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Q&A index benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = [run(size, args.queries, rng) for size in args.sizes]
+    for r in results:
+        print(f"{r['entries']:>7} entries: build {r['build_seconds']:.2f}s, "
+              f"{r['memory_bytes_per_entry']:.0f} B/entry, "
+              f"query p50 {r['query_ms_p50']:.3f}ms p95 {r['query_ms_p95']:.3f}ms p99 {r['query_ms_p99']:.3f}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# bench_workers.py
+#
+# Offline scaling benchmark for the multi-process deployment: runs the load
+# test in 1..N worker processes under WorkerSupervisor. Each worker takes an
+# equal share of the requests and the offered rate, like Slack spreading
+# events across Socket Mode connections, and workers share de-duplication and
+# the answer store through SQLite files as the real workers do.
+#
+#   python benchmarks/bench_workers.py --workers 1,2,4 --rate 1600 --requests 8000
+#
+# The offered rate should be above what one process can handle, otherwise
+# every worker count just keeps up with it. Speedup cannot exceed the number
+# of CPU cores.
+
+import os
+import sys
+import json
+import logging
+import argparse
+import subprocess
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from supervisor import WorkerSupervisor, worker_environment
+
+LOADTEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest.py")
+
+
+def run_workers(workers, args):
+    """
+    :return: Aggregated results for one worker count
+    """
+    tmp = tempfile.mkdtemp(prefix="slackbot-workers-")
+    base_env = dict(os.environ)
+    base_env.update({
+        "DEDUPE_BACKEND": "sqlite",
+        "DEDUPE_SQLITE_PATH": os.path.join(tmp, "dedupe.sqlite3"),
+        "ANSWER_STORE_PATH": os.path.join(tmp, "answers.sqlite3"),
+        "METRICS_PORT": "0",
+        # Measure the bot, not Slack's rate limits
+        "SLACK_OUTBOX_METHOD_LIMITS": "{}",
+        "SLACK_OUTBOX_CHANNEL_RATE": "100000",
+        "SLACK_OUTBOX_CHANNEL_BURST": "100000",
+    })
+    outputs = [os.path.join(tmp, f"worker-{index}.json") for index in range(workers)]
+
+    def spawn(index):
+        command = [
+            sys.executable, LOADTEST_PATH,
+            "--rate", str(args.rate / workers),
+            "--requests", str(args.requests // workers),
+            "--seed", str(args.seed + index),
+            "--unique-questions", str(args.unique_questions),
+            "--channels", str(args.channels),
+            "--bedrock-latency-ms", str(args.bedrock_latency_ms),
+            "--claude-latency-ms", str(args.claude_latency_ms),
+            "--slack-latency-ms", str(args.slack_latency_ms),
+            "--output", outputs[index],
+        ]
+        if args.no_cache:
+            command.append("--no-cache")
+        return subprocess.Popen(command, env=worker_environment(index, base_env),
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    supervisor = WorkerSupervisor(spawn, workers=workers, restart_clean_exits=False, shutdown_timeout=5)
+    started = time.perf_counter()
+    supervisor.run()
+    wall_seconds = time.perf_counter() - started
+
+    results = []
+    for path in outputs:
+        with open(path) as f:
+            results.append(json.load(f))
+    duration = max(r["duration_seconds"] for r in results)
+    completed = sum(r["completed"] for r in results)
+    return {
+        "workers": workers,
+        "completed": completed,
+        "rejected": sum(r["rejected"] for r in results),
+        "throughput_per_second": completed / duration if duration else 0.0,
+        "p95_latency_ms": max(r["latency_ms"]["p95"] or 0 for r in results),
+        "wall_seconds": wall_seconds,
+        "crashes": supervisor.stats()["crashes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process scaling benchmark")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to compare")
+    parser.add_argument("--rate", type=float, default=1600, help="Total offered requests per second")
+    parser.add_argument("--requests", type=int, default=8000, help="Total requests, split across workers")
+    parser.add_argument("--unique-questions", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--bedrock-latency-ms", type=float, default=20)
+    parser.add_argument("--claude-latency-ms", type=float, default=20)
+    parser.add_argument("--slack-latency-ms", type=float, default=2)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the answer cache")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    runs = [run_workers(int(count), args) for count in args.workers.split(",")]
+    base = runs[0]["throughput_per_second"] or 1.0
+    print(f"{os.cpu_count()} CPUs, offered {args.rate:.0f} req/s, {args.requests} requests")
+    for result in runs:
+        print(f"  {result['workers']:>2} workers: {result['throughput_per_second']:7.1f} req/s "
+              f"(x{result['throughput_per_second'] / base:.2f})  completed {result['completed']}  "
+              f"rejected {result['rejected']}  p95 {result['p95_latency_ms']:.0f}ms  crashes {result['crashes']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cpus": os.cpu_count(), "config": vars(args), "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+# fakes.py
+#
+# Offline stand-ins for Slack and Bedrock used by the load-test harness.
+
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from botocore.exceptions import ClientError
+from slack_sdk import WebClient
+
+UNANSWERABLE = "Sorry, I am unable to assist you with this request."
+
+
+class LatencyModel:
+    """
+    Log-normal service latency with a configurable median and spread.
+    """
+
+    def __init__(self, median_ms, sigma=0.3, rng=None):
+        self.median_seconds = median_ms / 1000
+        self.sigma = sigma
+        self.rng = rng or random.Random()
+
+    def sleep(self):
+        if self.median_seconds > 0:
+            time.sleep(self.median_seconds * self.rng.lognormvariate(0, self.sigma))
+
+
+class FakeServiceLimits:
+    """
+    Simulates Bedrock throttling: a random throttle rate plus an optional concurrency ceiling.
+    """
+
+    def __init__(self, throttle_rate=0.0, max_concurrency=0, rng=None):
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+
+    def enter(self, operation):
+        with self._lock:
+            self.calls += 1
+            over_limit = self.max_concurrency and self._in_flight >= self.max_concurrency
+            if over_limit or self.rng.random() < self.throttle_rate:
+                self.throttled += 1
+                raise ClientError(
+                    {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"},
+                     "ResponseMetadata": {"HTTPStatusCode": 429}},
+                    operation
+                )
+            self._in_flight += 1
+
+    def exit(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+class FakeAgentRuntime:
+    def __init__(self, latency, limits, unanswerable_rate=0.0, rng=None):
+        self.latency = latency
+        self.limits = limits
+        self.unanswerable_rate = unanswerable_rate
+        self.rng = rng or random.Random()
+
+    def _call(self, operation, result):
+        self.limits.enter(operation)
+        try:
+            self.latency.sleep()
+            return result()
+        finally:
+            self.limits.exit()
+
+    def retrieve_and_generate(self, input, retrieveAndGenerateConfiguration, sessionId=None, **kwargs):
+        def result():
+            text = UNANSWERABLE if self.rng.random() < self.unanswerable_rate else f"Answer to: {input['text']}"
+            return {"output": {"text": text}, "sessionId": sessionId or uuid.uuid4().hex, "citations": []}
+        return self._call("RetrieveAndGenerate", result)
+
+    def retrieve(self, knowledgeBaseId, retrievalQuery, retrievalConfiguration=None, **kwargs):
+        def result():
+            return {"retrievalResults": [{
+                "content": {"text": f"Policy text about {retrievalQuery['text']}"},
+                "location": {"s3Location": {"uri": "s3://fake/policy.json"}},
+                "score": 0.8,
+            }]}
+        return self._call("Retrieve", result)
+
+
+class FakeRuntime:
+    def __init__(self, latency, limits, stream_chunks=20):
+        self.latency = latency
+        self.limits = limits
+        self.stream_chunks = stream_chunks
+
+    @staticmethod
+    def _prompt(body):
+        messages = json.loads(body)["messages"]
+        return messages[-1]["content"] if messages else ""
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.limits.enter("InvokeModel")
+        try:
+            self.latency.sleep()
+            prompt = self._prompt(body)
+            payload = {
+                "content": [{"type": "text", "text": f"Claude says: {prompt[:200]}"}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": max(1, len(body) // 4), "output_tokens": 50},
+            }
+            return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+        finally:
+            self.limits.exit()
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        self.limits.enter("InvokeModelWithResponseStream")
+        prompt = self._prompt(body)
+
+        def events():
+            try:
+                per_chunk = self.latency.median_seconds / self.stream_chunks
+                for i in range(self.stream_chunks):
+                    time.sleep(per_chunk)
+                    delta = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": f"token{i} "}}
+                    yield {"chunk": {"bytes": json.dumps(delta).encode("utf-8")}}
+                yield {"chunk": {"bytes": json.dumps({"type": "message_stop"}).encode("utf-8")}}
+            finally:
+                self.limits.exit()
+
+        return {"body": events(), "contentType": "application/json", "prompt": prompt}
+
+
+class FakeAgent:
+    def start_ingestion_job(self, **kwargs):
+        return {"ingestionJob": {"ingestionJobId": uuid.uuid4().hex, "status": "STARTING"}}
+
+    def get_ingestion_job(self, **kwargs):
+        return {"ingestionJob": {"ingestionJobId": kwargs.get("ingestionJobId"), "status": "COMPLETE"}}
+
+
+class FakeStsClient:
+    def get_caller_identity(self):
+        return {"Account": "123456789012", "Arn": "arn:aws:sts::123456789012:assumed-role/Fake/bench"}
+
+
+class FakeAwsSession:
+    """
+    Quacks like a boto3 session for the services the bot uses.
+    """
+
+    region_name = "us-east-1"
+
+    def __init__(self, bedrock_latency_ms=800, claude_latency_ms=1500, throttle_rate=0.0,
+                 max_concurrency=0, unanswerable_rate=0.0, seed=None):
+        rng = random.Random(seed)
+        self.limits = FakeServiceLimits(throttle_rate, max_concurrency, rng)
+        self._clients = {
+            "bedrock-agent-runtime": FakeAgentRuntime(LatencyModel(bedrock_latency_ms, rng=rng), self.limits,
+                                                      unanswerable_rate, rng),
+            "bedrock-runtime": FakeRuntime(LatencyModel(claude_latency_ms, rng=rng), self.limits),
+            "bedrock-agent": FakeAgent(),
+            "sts": FakeStsClient(),
+        }
+
+    def client(self, service_name, config=None, **kwargs):
+        return self._clients[service_name]
+
+
+class FakeSlackApi:
+    """
+    Local HTTP server standing in for the Slack Web API and slash command response_urls.
+
+    Bolt builds a fresh WebClient for every request from the app client's
+    base_url, so pointing base_url here (see web_client()) routes every call
+    the bot makes through this server.
+    """
+
+    def __init__(self, latency_ms=50, on_post=None, on_response=None, post_rate_limit=0):
+        api = self
+        self.latency = LatencyModel(latency_ms, sigma=0.2)
+        self.on_post = on_post
+        self.on_response = on_response
+        self.post_rate_limit = post_rate_limit
+        self._lock = threading.Lock()
+        self._recent_posts = deque()
+        self.calls = {}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length).decode("utf-8")
+                method = self.path.rsplit("/", 1)[-1]
+                status = 200
+                if self.path.startswith("/respond/"):
+                    body = api.handle_response(method, raw)
+                elif method == "chat.postMessage" and api.rate_limited():
+                    status, body = 429, {"ok": False, "error": "ratelimited"}
+                else:
+                    body = api.handle_api_call(method, raw, self.headers.get("Content-Type", ""))
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                # Read methods such as conversations.replies, which Bolt's say uses in assistant threads
+                path, _, query = self.path.partition("?")
+                payload = json.dumps(api.handle_api_call(path.rsplit("/", 1)[-1], query, "")).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-slack", daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def web_client(self):
+        return WebClient(token="xoxb-fake", base_url=f"{self.base_url}/api/")
+
+    def url_for(self, request_id):
+        return f"{self.base_url}/respond/{request_id}"
+
+    def rate_limited(self):
+        """
+        Sliding one-second window over chat.postMessage calls, like Slack's per-workspace limit.
+        """
+        if not self.post_rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_posts and self._recent_posts[0] <= now - 1:
+                self._recent_posts.popleft()
+            if len(self._recent_posts) >= self.post_rate_limit:
+                self.calls["ratelimited"] = self.calls.get("ratelimited", 0) + 1
+                return True
+            self._recent_posts.append(now)
+            return False
+
+    def _count(self, method):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+    def handle_api_call(self, method, raw, content_type):
+        self._count(method)
+        if "json" in content_type:
+            args = json.loads(raw or "{}")
+        else:
+            args = {key: values[0] for key, values in parse_qs(raw).items()}
+        self.latency.sleep()
+        if method == "auth.test":
+            return {"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "TBENCH", "user": "bot"}
+        if method in ("chat.postMessage", "chat.update"):
+            if self.on_post:
+                self.on_post(method, args)
+            return {"ok": True, "channel": args.get("channel"), "ts": args.get("ts") or f"{time.time():.6f}"}
+        return {"ok": True}
+
+    def handle_response(self, request_id, raw):
+        self._count("response_url")
+        self.latency.sleep()
+        if self.on_response:
+            self.on_response(request_id, raw)
+        return {"ok": True}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
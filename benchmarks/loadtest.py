@@ -0,0 +1,377 @@
+# loadtest.py
+#
+# Offline load test: drives SlackHandler with synthetic app_mention, DM and
+# /use_claude payloads against fake Slack and Bedrock services.
+#
+#   python benchmarks/loadtest.py --rate 20 --requests 500 --output results.json
+#   python benchmarks/loadtest.py --rate 20 --requests 500 --baseline results.json
+
+import os
+import sys
+import json
+import random
+import logging
+import argparse
+import asyncio
+import tempfile
+import threading
+import subprocess
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+
+def configure_environment(args):
+    # Bot modules read their configuration at import time, so this runs before importing them
+    os.environ.setdefault("BEDROCK_KB_ID", "kb-bench")
+    os.environ.setdefault("BEDROCK_DATA_SOURCE_ID", "ds-bench")
+    os.environ.setdefault("BEDROCK_MODEL_ARN", "arn:aws:bedrock:us-east-1::foundation-model/fake")
+    os.environ.setdefault("HR_CHANNEL_ID", "CHR")
+    os.environ["KB_STORAGE_BACKEND"] = "local"
+    os.environ["KB_LOCAL_DIR"] = tempfile.mkdtemp(prefix="slackbot-bench-")
+    os.environ["CLAUDE_STREAMING"] = "false"
+    os.environ["KB_QUERY_MODE"] = args.kb_mode
+    if args.no_cache:
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+    logging.basicConfig(level=logging.WARNING)
+
+
+def percentiles(samples):
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": ordered[-1]}
+
+
+class RequestTracker:
+    """
+    Records send, start and completion times for every synthetic request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+
+    def sent(self, request_id, kind):
+        with self._lock:
+            if request_id in self.requests:
+                # A simulated redelivery keeps the original send time
+                return
+            self.requests[request_id] = {"kind": kind, "sent": time.perf_counter(), "started": None, "done": None,
+                                         "rejected": False}
+
+    def started(self, request_id):
+        with self._lock:
+            record = self.requests.get(request_id)
+            if record and record["started"] is None:
+                record["started"] = time.perf_counter()
+
+    def done(self, request_id):
+        with self._lock:
+            record = self.requests.get(request_id)
+            if record and record["done"] is None:
+                record["done"] = time.perf_counter()
+
+    def rejected(self, request_id):
+        with self._lock:
+            record = self.requests.get(request_id)
+            if record:
+                record["rejected"] = True
+
+    def outstanding(self):
+        with self._lock:
+            return sum(1 for r in self.requests.values() if r["done"] is None and not r["rejected"])
+
+
+def build_handler(tracker, slack_api, session, loop=None):
+    """
+    :param loop: Running event loop to build an AsyncSlackHandler on instead of a SlackHandler
+    """
+    if loop is None:
+        from slack_handler import SlackHandler as base
+    else:
+        from async_slack_handler import AsyncSlackHandler as base
+
+    local = threading.local()
+
+    class BenchSlackHandler(base):
+        def handle_message(self, event, say):
+            request_id = event.get("client_msg_id")
+            tracker.started(request_id)
+            local.futures = []
+            try:
+                super().handle_message(event, say)
+            finally:
+                # Replies go out through the outbox, so the request is done when the last one is delivered
+                if local.futures:
+                    local.futures[-1].add_done_callback(lambda _: tracker.done(request_id))
+                else:
+                    tracker.done(request_id)
+
+        def queued_say(self, say, channel, thread_ts=None, merge_key=None):
+            send = super().queued_say(say, channel, thread_ts, merge_key)
+
+            def tracked(text):
+                future = send(text)
+                local.futures.append(future)
+                return future
+            return tracked
+
+    if loop is None:
+        handler = BenchSlackHandler("xoxb-fake", "xapp-fake", client=slack_api.web_client())
+    else:
+        from slack_sdk.web.async_client import AsyncWebClient
+
+        async def create():
+            client = AsyncWebClient(token="xoxb-fake", base_url=f"{slack_api.base_url}/api/")
+            handler = BenchSlackHandler("xoxb-fake", "xapp-fake", client=client)
+            handler.loop = loop
+            return handler
+        handler = asyncio.run_coroutine_threadsafe(create(), loop).result()
+    submit = handler.dispatcher.submit
+
+    def tracked_submit(user, channel, fn, dedupe_key, event, say):
+        accepted = submit(user, channel, fn, dedupe_key, event, say)
+        if not accepted:
+            tracker.rejected(event.get("client_msg_id"))
+        return accepted
+    handler.dispatcher.submit = tracked_submit
+    handler.set_aws_session(session)
+    return handler
+
+
+def make_questions(count, rng):
+    topics = ["vacation days", "sick leave", "parental leave", "remote work", "travel expenses",
+              "health insurance", "pension plan", "overtime pay", "public holidays", "training budget"]
+    return [f"What is the policy on {rng.choice(topics)} for team {i}?" for i in range(count)]
+
+
+def make_payload(kind, request_id, question, user, channel, slack_api, thread=None):
+    if kind == "use_claude":
+        return {
+            "command": "/use_claude", "text": question, "channel_id": channel, "user_id": user,
+            "team_id": "TBENCH", "api_app_id": "ABENCH", "trigger_id": request_id,
+            "response_url": slack_api.url_for(request_id),
+        }
+    event = {
+        "type": "app_mention" if kind == "mention" else "message",
+        "text": f"<@UBOT> {question}" if kind == "mention" else question,
+        "user": user, "channel": channel, "ts": f"{time.time():.6f}", "client_msg_id": request_id,
+    }
+    if thread is not None:
+        # A follow-up in the thread of an earlier question
+        event["channel"], event["thread_ts"] = thread
+    if kind == "dm":
+        event["channel_type"] = "im"
+    return {
+        "type": "event_callback", "team_id": "TBENCH", "api_app_id": "ABENCH",
+        "event": event, "event_id": f"Ev{request_id}", "event_time": int(time.time()),
+    }
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        kind, weight = part.split("=")
+        if kind not in ("mention", "dm", "use_claude"):
+            raise ValueError(f"Unknown request kind: {kind}")
+        weights[kind] = float(weight)
+    return weights
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(args):
+    configure_environment(args)
+    from slack_bolt.request import BoltRequest
+    from fakes import FakeAwsSession, FakeSlackApi
+    from answer_cache import answer_cache, retrieval_cache
+    from singleflight import kb_flight
+    from bedrock_limiter import bedrock_limiter
+
+    rng = random.Random(args.seed)
+    tracker = RequestTracker()
+    slack_api = FakeSlackApi(latency_ms=args.slack_latency_ms, post_rate_limit=args.slack_rate_limit,
+                             on_response=lambda request_id, payload: tracker.done(request_id))
+    session = FakeAwsSession(
+        bedrock_latency_ms=args.bedrock_latency_ms, claude_latency_ms=args.claude_latency_ms,
+        throttle_rate=args.throttle_rate, max_concurrency=args.bedrock_max_concurrency,
+        unanswerable_rate=args.unanswerable_rate, seed=args.seed
+    )
+    if args.mode == "async":
+        from slack_bolt.request.async_request import AsyncBoltRequest
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name="bench-loop", daemon=True).start()
+        handler = build_handler(tracker, slack_api, session, loop)
+
+        def dispatch(payload):
+            request = AsyncBoltRequest(body=payload, mode="socket_mode")
+            asyncio.run_coroutine_threadsafe(handler.app.async_dispatch(request), loop).result()
+    else:
+        handler = build_handler(tracker, slack_api, session)
+
+        def dispatch(payload):
+            handler.app.dispatch(BoltRequest(body=payload, mode="socket_mode"))
+
+    mix = parse_mix(args.mix)
+    kinds, weights = list(mix), list(mix.values())
+    questions = make_questions(args.unique_questions, rng)
+    question_weights = [1 / (rank + 1) for rank in range(len(questions))]
+    users = [f"U{i:04d}" for i in range(args.users)]
+    channels = [f"C{i:03d}" for i in range(args.channels)]
+
+    def send(payload, request_id, kind, scheduled_at):
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        tracker.sent(request_id, kind)
+        if kind == "use_claude":
+            # Slash commands are handled on Bolt's listener pool, so record the start here
+            tracker.started(request_id)
+        dispatch(payload)
+
+    duplicates = 0
+    threads = []
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="driver") as driver:
+        for i in range(args.requests):
+            kind = rng.choices(kinds, weights)[0]
+            request_id = uuid.uuid4().hex
+            question = rng.choices(questions, question_weights)[0]
+            thread = None
+            if kind != "use_claude" and threads and rng.random() < args.follow_up_rate:
+                thread = rng.choice(threads)
+                question = f"And what about part-timers on {question.split(' on ', 1)[-1]}"
+            payload = make_payload(kind, request_id, question, rng.choice(users), rng.choice(channels), slack_api, thread)
+            if kind != "use_claude" and thread is None:
+                threads.append((payload["event"]["channel"], payload["event"]["ts"]))
+                del threads[:-200]
+            driver.submit(send, payload, request_id, kind, started_at + i / args.rate)
+            if kind != "use_claude" and rng.random() < args.duplicate_rate:
+                # Slack redelivers events it thinks were not acknowledged in time
+                duplicates += 1
+                driver.submit(send, payload, request_id, kind, started_at + i / args.rate + args.duplicate_delay)
+
+    deadline = time.perf_counter() + args.drain_timeout
+    while tracker.outstanding() and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    finished_at = time.perf_counter()
+    slack_api.close()
+
+    records = list(tracker.requests.values())
+    completed = [r for r in records if r["done"] is not None]
+    latencies = [(r["done"] - r["sent"]) * 1000 for r in completed]
+    queue_delays = [(r["started"] - r["sent"]) * 1000 for r in records if r["started"] is not None and r["kind"] != "use_claude"]
+    last_done = max((r["done"] for r in completed), default=finished_at)
+
+    results = {
+        "revision": git_revision(),
+        "config": vars(args),
+        "sent": len(records),
+        "duplicates_sent": duplicates,
+        "completed": len(completed),
+        "rejected": sum(1 for r in records if r["rejected"]),
+        "incomplete": sum(1 for r in records if r["done"] is None and not r["rejected"]),
+        "duration_seconds": last_done - started_at,
+        "throughput_per_second": len(completed) / (last_done - started_at) if completed else 0.0,
+        "latency_ms": percentiles(latencies),
+        "queue_delay_ms": percentiles(queue_delays),
+        "latency_ms_by_kind": {
+            kind: percentiles([(r["done"] - r["sent"]) * 1000 for r in completed if r["kind"] == kind])
+            for kind in kinds
+        },
+        "bedrock": {"calls": session.limits.calls, "throttled": session.limits.throttled},
+        "slack_api_calls": dict(slack_api.calls),
+        "dispatch": handler.dispatcher.stats(),
+        "answer_cache": answer_cache.stats(),
+        "retrieval_cache": retrieval_cache.stats(),
+        "kb_singleflight": kb_flight.stats(),
+        "bedrock_limiter": bedrock_limiter.stats(),
+        "event_dedupe": handler.deduplicator.stats(),
+        "slack_outbox": handler.outbox.stats(),
+        "conversations": handler.conversations.stats(),
+        "answer_warmer": handler.answer_warmer.stats() if handler.answer_warmer else None,
+    }
+    handler.dispatcher.shutdown(wait=False)
+    return results
+
+
+def print_summary(results, baseline=None):
+    latency = results["latency_ms"]
+    queue = results["queue_delay_ms"]
+
+    def fmt(value):
+        return "n/a" if value is None else f"{value:.0f}"
+    print(f"revision {results['revision']}: {results['completed']}/{results['sent']} completed "
+          f"({results['rejected']} rejected), "
+          f"{results['throughput_per_second']:.1f} req/s")
+    print(f"  latency ms   p50 {fmt(latency['p50'])}  p95 {fmt(latency['p95'])}  p99 {fmt(latency['p99'])}")
+    print(f"  queueing ms  p50 {fmt(queue['p50'])}  p95 {fmt(queue['p95'])}  p99 {fmt(queue['p99'])}")
+    print(f"  bedrock calls {results['bedrock']['calls']} (throttled {results['bedrock']['throttled']}), "
+          f"dispatch rejected {results['dispatch']['rejected']}")
+    if baseline:
+        base = baseline["latency_ms"]
+        print(f"  vs {baseline.get('revision')}: throughput "
+              f"{results['throughput_per_second'] - baseline['throughput_per_second']:+.1f} req/s, " +
+              ", ".join(
+                  f"{pct} {latency[pct] - base[pct]:+.0f}ms"
+                  for pct in ("p50", "p95", "p99") if latency[pct] is not None and base.get(pct) is not None
+              ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline Slack bot load test")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="Drive SlackHandler or AsyncSlackHandler")
+    parser.add_argument("--rate", type=float, default=10, help="Requests per second (open loop)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32, help="Driver threads sending requests")
+    parser.add_argument("--mix", default="mention=0.6,dm=0.3,use_claude=0.1")
+    parser.add_argument("--unique-questions", type=int, default=100)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--bedrock-latency-ms", type=float, default=800)
+    parser.add_argument("--claude-latency-ms", type=float, default=1500)
+    parser.add_argument("--slack-latency-ms", type=float, default=50)
+    parser.add_argument("--slack-rate-limit", type=float, default=0,
+                        help="chat.postMessage calls per second the fake Slack accepts before answering 429; 0 means unlimited")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--bedrock-max-concurrency", type=int, default=0, help="0 means unlimited")
+    parser.add_argument("--unanswerable-rate", type=float, default=0.05)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of events delivered twice")
+    parser.add_argument("--duplicate-delay", type=float, default=0.5, help="Seconds between an event and its redelivery")
+    parser.add_argument("--follow-up-rate", type=float, default=0.0,
+                        help="Fraction of events sent as follow-ups in the thread of an earlier question")
+    parser.add_argument("--kb-mode", choices=["retrieve_and_generate", "retrieve_then_generate"],
+                        default="retrieve_and_generate", help="KB_QUERY_MODE for the bot")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the answer cache")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON")
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_summary(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# answer_cache.py
+
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+import kb_events
+from answer_store import SqliteAnswerStore
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of knowledge base answers with a per-entry TTL.
+
+    Keys are normalized questions (see normalize.normalize_question). The
+    cache is thread-safe and is cleared whenever the knowledge base changes.
+    A caller that takes generation() before a slow KB query and passes it to
+    put() has its answer dropped if the cache was cleared in the meantime, so
+    an answer from before a KB change is not written back after it. The token
+    carries the store's generation too, so the store drops the write if
+    another process sharing it has started a new generation.
+
+    With a store (see answer_store.SqliteAnswerStore) every answer is also
+    written through to disk, and memory misses fall back to it, so answers
+    survive restarts. warm() preloads the most recent stored answers.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, clock=time.monotonic, store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.store_hits = 0
+        self.stale_puts = 0
+        self._generation = 0
+
+    @classmethod
+    def from_env(cls):
+        ttl_seconds = float(os.getenv('ANSWER_CACHE_TTL_SECONDS', '3600'))
+        return cls(
+            max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '1000')),
+            ttl_seconds=ttl_seconds,
+            store=SqliteAnswerStore.from_env(ttl_seconds=ttl_seconds),
+        )
+
+    def get(self, key):
+        """
+        Returns the cached answer for the key, or None if missing or expired.
+        """
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return answer
+                del self._entries[key]
+                self.expirations += 1
+        if self.store is not None:
+            answer = self.store.get(key)
+            if answer is not None:
+                with self._lock:
+                    self.store_hits += 1
+                    self.hits += 1
+                self._put_memory(key, answer)
+                return answer
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def contains(self, key):
+        """
+        Checks for a live answer without counting a hit or miss; a stored answer is loaded into memory.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self._clock():
+                return True
+        if self.store is not None:
+            answer = self.store.get(key)
+            if answer is not None:
+                self._put_memory(key, answer)
+                return True
+        return False
+
+    def generation(self):
+        """
+        :return: A token for put(), taken before the lookup whose answer will be cached
+        """
+        return self._generation, self.store.generation if self.store is not None else None
+
+    def put(self, key, answer, generation=None):
+        """
+        :param generation: The generation() taken before the answer was looked up; the put is dropped if it is stale
+        """
+        if not key or self.max_entries <= 0:
+            return
+        local_generation, store_generation = generation if generation is not None else (None, None)
+        if not self._put_memory(key, answer, local_generation):
+            return
+        if self.store is not None:
+            self.store.put(key, answer, store_generation)
+
+    def _put_memory(self, key, answer, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.stale_puts += 1
+                return False
+            self._entries[key] = (answer, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def warm(self):
+        """
+        Loads the most recently stored answers into memory, up to max_entries.
+
+        Meant to run in the background at startup; lookups fall back to the
+        store in the meantime.
+
+        :return: The number of answers loaded
+        """
+        if self.store is None or self.max_entries <= 0:
+            return 0
+        started = time.monotonic()
+        rows = self.store.recent(self.max_entries)
+        # Oldest first so the most recent end up at the LRU's fresh end
+        for key, answer in reversed(rows):
+            self._put_memory(key, answer)
+        logger.info("Loaded %s stored answers in %.0fms", len(rows), (time.monotonic() - started) * 1000)
+        return len(rows)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, new_generation=True):
+        """
+        Drops every cached answer; with new_generation the stored answers are retired too.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+            self._generation += 1
+        if self.store is not None and new_generation:
+            self.store.new_generation()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "store_hits": self.store_hits,
+                "stale_puts": self.stale_puts,
+            }
+
+
+answer_cache = AnswerCache.from_env()
+
+# Chunks returned by the KB retrieve call, keyed on qa_index-style query terms (see bedrock_kb_handler)
+retrieval_cache = AnswerCache(
+    max_entries=int(os.getenv('RETRIEVAL_CACHE_MAX_ENTRIES', '2000')),
+    ttl_seconds=float(os.getenv('RETRIEVAL_CACHE_TTL_SECONDS', '3600')),
+)
+
+# Normalized questions the KB answered with "unable to assist"; errors and throttles never land here
+unanswerable_cache = AnswerCache(
+    max_entries=int(os.getenv('UNANSWERABLE_CACHE_MAX_ENTRIES', '2000')),
+    ttl_seconds=float(os.getenv('UNANSWERABLE_CACHE_TTL_SECONDS', '3600')),
+)
+
+
+PEER_CHANGE = "peer_change"
+
+
+def _on_kb_change(reason):
+    logger.info("Knowledge base changed (%s), clearing answer, retrieval and unanswerable caches", reason)
+    # On a peer_change another process has already started the new generation in the shared store
+    answer_cache.clear(new_generation=reason != PEER_CHANGE)
+    retrieval_cache.clear()
+    unanswerable_cache.clear()
+
+
+kb_events.subscribe(_on_kb_change)
+
+
+def watch_peer_changes(interval_seconds=None):
+    """
+    Polls the answer store for KB changes made by other bot processes sharing it and
+    publishes each one locally as a 'peer_change' event.
+
+    :param interval_seconds: Poll interval, defaults to ANSWER_STORE_POLL_SECONDS
+    :return: The watcher thread, or None without a store
+    """
+    if answer_cache.store is None:
+        return None
+    if interval_seconds is None:
+        interval_seconds = float(os.getenv('ANSWER_STORE_POLL_SECONDS', '2'))
+    store = answer_cache.store
+
+    def run():
+        while True:
+            time.sleep(interval_seconds)
+            if store.poll_generation():
+                kb_events.publish(PEER_CHANGE)
+
+    thread = threading.Thread(target=run, name="answer-store-watch", daemon=True)
+    thread.start()
+    return thread
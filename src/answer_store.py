@@ -0,0 +1,252 @@
+# answer_store.py
+
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteAnswerStore:
+    """
+    On-disk copy of the answer cache so a restarted bot starts warm.
+
+    Entries are tagged with the KB generation they were answered under, which
+    the caller takes before the KB query. A KB change bumps the generation,
+    which hides every older entry at once; the rows themselves are deleted in
+    the background, and writes tagged with an older generation are dropped. Writes are queued and
+    applied in batches by a writer thread so request threads never wait on
+    disk. The table is capped at max_entries, dropping the least recently
+    written entries first.
+    """
+
+    BATCH_SIZE = 500
+    EVICT_EVERY = 1000
+    # Other processes sharing the file may have moved the generation on, so reads check the table
+    _CURRENT_GENERATION = "(SELECT value FROM answer_store_meta WHERE name = 'generation')"
+
+    def __init__(self, path, max_entries=100000, ttl_seconds=None, queue_size=10000, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._local = threading.local()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writes_since_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.dropped_writes = 0
+        self.stale_writes = 0
+        self.evictions = 0
+        self.errors = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, generation INTEGER NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_updated ON answers (updated_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS answer_store_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO answer_store_meta (name, value) VALUES ('generation', 0)")
+        self.generation = self._read_generation()
+        self._known_generation = self.generation
+
+    @classmethod
+    def from_env(cls, ttl_seconds=None):
+        """
+        :return: A store at ANSWER_STORE_PATH, or None when the variable is unset
+        """
+        path = os.getenv('ANSWER_STORE_PATH')
+        if not path:
+            return None
+        return cls(
+            path,
+            max_entries=int(os.getenv('ANSWER_STORE_MAX_ENTRIES', '100000')),
+            ttl_seconds=ttl_seconds,
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _read_generation(self):
+        row = self._connect().execute("SELECT value FROM answer_store_meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def _oldest_live(self):
+        return self.clock() - self.ttl_seconds if self.ttl_seconds else 0.0
+
+    def get(self, key):
+        """
+        :return: The stored answer for the current KB generation, or None
+        """
+        try:
+            row = self._connect().execute(
+                f"SELECT answer FROM answers WHERE key = ? AND generation = {self._CURRENT_GENERATION} "
+                f"AND updated_at > ?",
+                (key, self._oldest_live())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error("Answer store read failed: %s", e)
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, answer, generation=None):
+        """
+        Queues a write; returns immediately. Writes are dropped if the writer falls behind.
+
+        :param generation: The generation seen before the answer was looked up, defaults to the current one;
+            the write is dropped if the store has moved past it
+        """
+        if generation is None:
+            generation = self.generation
+        elif generation < self.generation:
+            self.stale_writes += 1
+            return
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(("put", key, answer, generation, self.clock()))
+        except queue.Full:
+            self.dropped_writes += 1
+
+    def recent(self, limit):
+        """
+        :return: Up to limit (key, answer) pairs from the current generation, most recently written first
+        """
+        return self._connect().execute(
+            f"SELECT key, answer FROM answers WHERE generation = {self._CURRENT_GENERATION} AND updated_at > ? "
+            f"ORDER BY updated_at DESC LIMIT ?",
+            (self._oldest_live(), limit)
+        ).fetchall()
+
+    def new_generation(self):
+        """
+        Starts a new KB generation, hiding every stored answer, and queues deletion of the old rows.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("UPDATE answer_store_meta SET value = value + 1 WHERE name = 'generation'")
+            self.generation = self._read_generation()
+            self._known_generation = self.generation
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(("purge", self.generation))
+        except queue.Full:
+            pass
+        return self.generation
+
+    def poll_generation(self):
+        """
+        :return: True if another process sharing the file started a new generation since the last check
+        """
+        try:
+            current = self._read_generation()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error("Answer store read failed: %s", e)
+            return False
+        if current == self._known_generation:
+            return False
+        self._known_generation = current
+        self.generation = current
+        return True
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="answer-store-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Answer store write failed: %s", e, exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _apply(self, batch):
+        conn = self._connect()
+        purges = [op[1] for op in batch if op[0] == "purge"]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Read inside the transaction so a new generation cannot start before the rows land
+            self.generation = self._read_generation()
+            puts = [op[1:] for op in batch if op[0] == "put" and op[3] >= self.generation]
+            self.stale_writes += sum(1 for op in batch if op[0] == "put") - len(puts)
+            if puts:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO answers (key, answer, generation, updated_at) VALUES (?, ?, ?, ?)", puts
+                )
+            if purges:
+                conn.execute("DELETE FROM answers WHERE generation < ?", (max(purges),))
+            self.writes += len(puts)
+            self._writes_since_evict += len(puts)
+            if self._writes_since_evict >= self.EVICT_EVERY:
+                self._writes_since_evict = 0
+                self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn):
+        excess = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY updated_at LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+    def flush(self):
+        """
+        Blocks until every queued write has been applied.
+        """
+        if self._writer is not None:
+            self._queue.join()
+
+    def size(self):
+        return self._connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "pending_writes": self._queue.qsize(),
+            "dropped_writes": self.dropped_writes,
+            "stale_writes": self.stale_writes,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
@@ -0,0 +1,338 @@
+# answer_warmer.py
+
+import os
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import kb_events
+from bedrock_kb_handler import query_bedrock_kb, UNABLE_TO_ASSIST
+from model_router import estimate_tokens
+from singleflight import kb_flight
+from metrics import timer
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionLog:
+    """
+    Frequency-ranked log of normalized questions.
+
+    Counts decay by decay_factor after every warm-up run so the ranking
+    follows what people ask now rather than all-time totals. When the log
+    grows past max_entries the least asked half is dropped.
+    """
+
+    def __init__(self, max_entries=5000, decay_factor=0.5):
+        self.max_entries = max_entries
+        self.decay_factor = decay_factor
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.dirty = False
+
+    def record(self, key, question):
+        if not key:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [1.0, question]
+                if len(self._entries) > self.max_entries:
+                    self._trim()
+            else:
+                entry[0] += 1
+            self.dirty = True
+
+    def _trim(self):
+        ranked = sorted(self._entries.items(), key=lambda item: item[1][0], reverse=True)
+        self._entries = dict(ranked[:self.max_entries // 2])
+
+    def top(self, n):
+        """
+        :return: Up to n (key, question, count) tuples, most asked first
+        """
+        with self._lock:
+            ranked = sorted(self._entries.items(), key=lambda item: item[1][0], reverse=True)[:n]
+        return [(key, question, count) for key, (count, question) in ranked]
+
+    def decay(self):
+        with self._lock:
+            for key in list(self._entries):
+                entry = self._entries[key]
+                entry[0] *= self.decay_factor
+                if entry[0] < 0.1:
+                    del self._entries[key]
+
+    def save(self, path):
+        with self._lock:
+            snapshot = dict(self._entries)
+            self.dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load question log from %s: %s", path, e)
+            return 0
+        with self._lock:
+            for key, (count, question) in snapshot.items():
+                self._entries[key] = [float(count), question]
+        return len(snapshot)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AnswerWarmer:
+    """
+    Re-answers the most frequently asked questions in the background so their
+    answers are cached before anyone asks again.
+
+    A run is requested after every successful ingestion, at startup and,
+    optionally, every interval_seconds. Each run takes the top_n questions
+    from the question log, skips those already cached or known to be
+    unanswerable, and answers the rest with at most `concurrency` KB calls at
+    a time until the run's estimated token_budget is spent. Each call is
+    charged context_tokens for the retrieved passages and prompt that
+    retrieve_and_generate adds, which are most of its input and are not
+    reported back, plus the question and answer. Calls share the KB
+    single-flight with user requests, so a warm-up never duplicates a question
+    being asked right now.
+
+    To report the latency saved, each warmed question remembers how long its
+    warm-up call took; the first user who then gets it from the cache is
+    counted as having saved that much.
+    """
+
+    def __init__(self, session, cache, top_n=50, concurrency=2, token_budget=50000, interval_seconds=0,
+                 log_path=None, save_interval_seconds=60, question_log=None, answer_fn=None,
+                 context_tokens=2000, unanswerable=None):
+        """
+        :param unanswerable: Cache of questions the KB could not answer; they are skipped and added to it
+        """
+        self.session = session
+        self.cache = cache
+        self.unanswerable_cache = unanswerable
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.token_budget = token_budget
+        self.context_tokens = context_tokens
+        self.interval_seconds = interval_seconds
+        self.log_path = log_path
+        self.save_interval_seconds = save_interval_seconds
+        self.question_log = question_log or QuestionLog()
+        self.answer_fn = answer_fn or (lambda key, question: kb_flight.do(key, query_bedrock_kb, self.session, question))
+        self._cond = threading.Condition()
+        self._requested = None
+        self._stopped = False
+        self._thread = None
+        self._warmed = {}
+        self.runs = 0
+        self.warmed = 0
+        self.skipped_cached = 0
+        self.skipped_unanswerable = 0
+        self.unanswerable = 0
+        self.failed = 0
+        self.budget_exhausted_runs = 0
+        self.tokens_spent = 0
+        self.warm_hits = 0
+        self.latency_saved_seconds = 0.0
+        if log_path:
+            loaded = self.question_log.load(log_path)
+            if loaded:
+                logger.info("Loaded %s questions for answer pre-warming from %s", loaded, log_path)
+        kb_events.subscribe(self._on_kb_change)
+
+    @classmethod
+    def from_env(cls, session, cache, unanswerable=None):
+        return cls(
+            session,
+            cache,
+            top_n=int(os.getenv('PREWARM_TOP_N', '50')),
+            concurrency=int(os.getenv('PREWARM_CONCURRENCY', '2')),
+            token_budget=int(os.getenv('PREWARM_TOKEN_BUDGET', '50000')),
+            context_tokens=int(os.getenv('PREWARM_CONTEXT_TOKENS', '2000')),
+            unanswerable=unanswerable,
+            interval_seconds=float(os.getenv('PREWARM_INTERVAL_SECONDS', '0')),
+            log_path=os.getenv('PREWARM_LOG_PATH') or None,
+            question_log=QuestionLog(
+                max_entries=int(os.getenv('PREWARM_LOG_MAX_ENTRIES', '5000')),
+                decay_factor=float(os.getenv('PREWARM_DECAY', '0.5')),
+            ),
+        )
+
+    @property
+    def enabled(self):
+        return self.top_n > 0
+
+    def observe(self, key, question, cached):
+        """
+        Records a question that reached the answer cache and credits a warm-up if it was served from it.
+
+        :param key: The normalized question
+        :param question: The question as asked
+        :param cached: Whether the answer came from the cache
+        """
+        if not self.enabled:
+            return
+        self.question_log.record(key, question)
+        if cached:
+            with self._cond:
+                saved = self._warmed.pop(key, None)
+                if saved is not None:
+                    self.warm_hits += 1
+                    self.latency_saved_seconds += saved
+
+    def _on_kb_change(self, reason):
+        # The answer cache was just cleared, so earlier warm-ups can no longer save anyone time
+        with self._cond:
+            self._warmed.clear()
+        if reason == "ingestion_complete":
+            self.request_warm(reason)
+
+    def request_warm(self, reason):
+        if not self.enabled:
+            return
+        with self._cond:
+            self._requested = reason
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="answer-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        kb_events.unsubscribe(self._on_kb_change)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _next_wait(self, last_run):
+        waits = [self.save_interval_seconds] if self.log_path else []
+        if self.interval_seconds > 0:
+            waits.append(max(0.0, last_run + self.interval_seconds - time.monotonic()))
+        return min(waits) if waits else None
+
+    def _run(self):
+        last_run = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._stopped and self._requested is None:
+                    if self.interval_seconds > 0 and time.monotonic() - last_run >= self.interval_seconds:
+                        self._requested = "interval"
+                        break
+                    self._cond.wait(self._next_wait(last_run))
+                    self._save_log()
+                if self._stopped:
+                    self._save_log()
+                    return
+                reason, self._requested = self._requested, None
+            try:
+                self.warm_once(reason)
+            except Exception as e:
+                logger.error("Answer pre-warming run failed: %s", e, exc_info=True)
+            last_run = time.monotonic()
+            self._save_log()
+
+    def _save_log(self):
+        if not self.log_path or not self.question_log.dirty:
+            return
+        try:
+            self.question_log.save(self.log_path)
+        except OSError as e:
+            logger.warning("Could not save question log to %s: %s", self.log_path, e)
+
+    def warm_once(self, reason="manual"):
+        """
+        Answers the top questions that are not cached yet.
+
+        :return: The number of answers cached
+        """
+        candidates = []
+        for key, question, _ in self.question_log.top(self.top_n):
+            if self.cache.contains(key):
+                self.skipped_cached += 1
+            elif self.unanswerable_cache is not None and self.unanswerable_cache.contains(key):
+                self.skipped_unanswerable += 1
+            else:
+                candidates.append((key, question))
+        self.runs += 1
+        self.question_log.decay()
+        if not candidates or self.session is None:
+            return 0
+
+        started = time.monotonic()
+        budget_left = [self.token_budget]
+        budget_lock = threading.Lock()
+        warmed = []
+
+        def warm(key, question):
+            # The input side is reserved up front so concurrent calls cannot overrun the budget
+            reserved = self.context_tokens + estimate_tokens(question)
+            with budget_lock:
+                if budget_left[0] < reserved:
+                    return False
+                budget_left[0] -= reserved
+                self.tokens_spent += reserved
+            generation = self.cache.generation()
+            unanswerable_generation = self.unanswerable_cache.generation() if self.unanswerable_cache is not None else None
+            call_started = time.monotonic()
+            try:
+                with timer("prewarm.answer"):
+                    answer, valid = self.answer_fn(key, question)
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Pre-warming failed for a question: %s", e)
+                return True
+            seconds = time.monotonic() - call_started
+            with budget_lock:
+                spent = estimate_tokens(answer or "")
+                budget_left[0] -= spent
+                self.tokens_spent += spent
+            if not valid or not answer.strip() or answer == UNABLE_TO_ASSIST:
+                self.unanswerable += 1
+                if valid and self.unanswerable_cache is not None:
+                    self.unanswerable_cache.put(key, True, unanswerable_generation)
+                return True
+            self.cache.put(key, answer, generation)
+            with self._cond:
+                self._warmed[key] = seconds
+            warmed.append(key)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="answer-warmer") as pool:
+            finished = list(pool.map(lambda candidate: warm(*candidate), candidates))
+        if not all(finished):
+            self.budget_exhausted_runs += 1
+        self.warmed += len(warmed)
+        logger.info("Pre-warmed %s/%s answers (%s) in %.1fs, %s tokens", len(warmed), len(candidates), reason,
+                    time.monotonic() - started, self.token_budget - max(budget_left[0], 0))
+        return len(warmed)
+
+    def stats(self):
+        with self._cond:
+            pending_credit = len(self._warmed)
+        return {
+            "tracked_questions": len(self.question_log),
+            "runs": self.runs,
+            "warmed": self.warmed,
+            "skipped_cached": self.skipped_cached,
+            "skipped_unanswerable": self.skipped_unanswerable,
+            "unanswerable": self.unanswerable,
+            "failed": self.failed,
+            "budget_exhausted_runs": self.budget_exhausted_runs,
+            "tokens_spent": self.tokens_spent,
+            "warmed_unused": pending_credit,
+            "warm_hits": self.warm_hits,
+            "latency_saved_seconds": self.latency_saved_seconds,
+        }
@@ -1,74 +1,268 @@
 # assume_role.py
 
+import os
 import boto3
+import botocore.session
 import logging
+import threading
 import time
-from botocore.exceptions import ClientError, NoCredentialsError  
+from datetime import datetime, timezone
+from botocore.credentials import CredentialProvider, RefreshableCredentials
+from botocore.exceptions import ClientError, NoCredentialsError
+from metrics import observe
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_session(max_retries=5, initial_delay=1):
+# botocore starts refreshing credentials this long before they expire
+BOTOCORE_ADVISORY_REFRESH_SECONDS = 900
+MIN_REFRESH_LEAD_SECONDS = BOTOCORE_ADVISORY_REFRESH_SECONDS + 60
+
+
+def _get_session_with_identity(max_retries=5, initial_delay=1):
+    """
+    :return: (session, caller identity), or (None, None) after max_retries failures
+    """
     for attempt in range(max_retries):
         try:
             session = boto3.Session()
             sts = session.client('sts')
-            sts.get_caller_identity()
-            logger.info(f"Successfully created session on attempt {attempt + 1}")
-            return session
+            identity = sts.get_caller_identity()
+            logger.info("Successfully created session on attempt %s", attempt + 1)
+            return session, identity
         except ClientError as e:
-            logger.warning(f"Attempt {attempt + 1} failed: {e}")
+            logger.warning("Attempt %s failed: %s", attempt + 1, e)
             if attempt == max_retries - 1:
                 logger.error("Failed to create session after maximum retries")
-                return None
+                return None, None
             time.sleep(initial_delay * (2 ** attempt))  # Exponential backoff
 
+
+def get_session(max_retries=5, initial_delay=1):
+    return _get_session_with_identity(max_retries, initial_delay)[0]
+
+class RoleCredentialProvider(CredentialProvider):
+    """
+    Supplies auto-refreshing credentials for an assumed IAM role.
+
+    A daemon thread assumes the role again ahead of expiry and parks the new
+    credentials. When botocore decides the current credentials need
+    refreshing, it calls refresh() which hands over the parked credentials
+    without an STS round trip. STS is only called on the request path if the
+    background refresh has failed.
+
+    The prefetch has to land before botocore's own refresh window opens, so
+    refresh_lead_seconds is raised to MIN_REFRESH_LEAD_SECONDS if it is not
+    longer than BOTOCORE_ADVISORY_REFRESH_SECONDS. It is also capped at half
+    of duration_seconds, so credentials are used for a while before the next
+    prefetch, and successful refreshes are at least MIN_REFRESH_INTERVAL_SECONDS apart.
+    """
+
+    METHOD = 'sts-assume-role-background'
+    CANONICAL_NAME = 'custom-sts-assume-role'
+    MIN_REFRESH_INTERVAL_SECONDS = 60
+
+    def __init__(self, sts_client, role_arn, session_name="LocalDevelopmentSession",
+                 duration_seconds=3600, refresh_lead_seconds=1200):
+        super().__init__()
+        self._sts = sts_client
+        self.role_arn = role_arn
+        self.session_name = session_name
+        self.duration_seconds = duration_seconds
+        if refresh_lead_seconds <= BOTOCORE_ADVISORY_REFRESH_SECONDS:
+            logger.warning("Credential refresh lead of %ss is inside botocore's %ss refresh window, using %ss",
+                           refresh_lead_seconds, BOTOCORE_ADVISORY_REFRESH_SECONDS, MIN_REFRESH_LEAD_SECONDS)
+            refresh_lead_seconds = MIN_REFRESH_LEAD_SECONDS
+        if refresh_lead_seconds > duration_seconds / 2:
+            logger.warning("Credential refresh lead of %ss is more than half the %ss credential lifetime, using %.0fs",
+                           refresh_lead_seconds, duration_seconds, duration_seconds / 2)
+            refresh_lead_seconds = duration_seconds / 2
+            if refresh_lead_seconds <= BOTOCORE_ADVISORY_REFRESH_SECONDS:
+                logger.warning("Credentials this short-lived are refreshed by botocore before the prefetch; "
+                               "some refreshes will call STS on the request path")
+        self.refresh_lead_seconds = refresh_lead_seconds
+        self._lock = threading.Lock()
+        self._prefetched = None
+        self._current_expiry = None
+        self._latest_expiry = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh_count = 0
+        self.refresh_failures = 0
+        self.blocking_refreshes = 0
+        self.last_refresh_latency = None
+
+    def _assume(self):
+        started = time.monotonic()
+        response = self._sts.assume_role(
+            RoleArn=self.role_arn,
+            RoleSessionName=self.session_name,
+            DurationSeconds=self.duration_seconds
+        )
+        self.last_refresh_latency = time.monotonic() - started
+        observe("sts.assume_role", self.last_refresh_latency)
+        self.refresh_count += 1
+        credentials = response['Credentials']
+        expiration = credentials['Expiration']
+        with self._lock:
+            self._latest_expiry = expiration
+        logger.info("Assumed role %s in %.0fms, credentials expire at %s", self.role_arn, self.last_refresh_latency * 1000, expiration.isoformat())
+        return {
+            'access_key': credentials['AccessKeyId'],
+            'secret_key': credentials['SecretAccessKey'],
+            'token': credentials['SessionToken'],
+            'expiry_time': expiration.isoformat(),
+            '_expiration': expiration,
+        }
+
+    def refresh(self):
+        """
+        Returns fresh credential metadata for botocore, preferring the background prefetch.
+        """
+        with self._lock:
+            metadata = self._prefetched
+            self._prefetched = None
+        if metadata is None:
+            self.blocking_refreshes += 1
+            logger.warning("No prefetched credentials available, assuming role on the request path")
+            metadata = self._assume()
+        with self._lock:
+            self._current_expiry = metadata['_expiration']
+        return metadata
+
+    def load(self):
+        metadata = self._assume()
+        with self._lock:
+            self._current_expiry = metadata['_expiration']
+        return RefreshableCredentials.create_from_metadata(
+            metadata=metadata,
+            refresh_using=self.refresh,
+            method=self.METHOD
+        )
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name="credential-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _seconds_until_prefetch(self):
+        with self._lock:
+            expiry = self._latest_expiry
+        if expiry is None:
+            return 0
+        return (expiry - datetime.now(timezone.utc)).total_seconds() - self.refresh_lead_seconds
+
+    def _refresh_loop(self):
+        delay = 1
+        refreshed = False
+        while not self._stop.is_set():
+            wait = self._seconds_until_prefetch()
+            if refreshed:
+                wait = max(wait, self.MIN_REFRESH_INTERVAL_SECONDS)
+            if wait > 0 and self._stop.wait(wait):
+                return
+            try:
+                metadata = self._assume()
+                with self._lock:
+                    self._prefetched = metadata
+                delay = 1
+                refreshed = True
+            except Exception as e:
+                refreshed = False
+                self.refresh_failures += 1
+                logger.warning("Background credential refresh failed, retrying in %ss: %s", delay, e)
+                if self._stop.wait(delay):
+                    return
+                delay = min(delay * 2, 60)
+
+    def stats(self):
+        with self._lock:
+            expiry = self._current_expiry
+        time_to_expiry = (expiry - datetime.now(timezone.utc)).total_seconds() if expiry else None
+        return {
+            "time_to_expiry_seconds": time_to_expiry,
+            "last_refresh_latency_seconds": self.last_refresh_latency,
+            "refresh_count": self.refresh_count,
+            "refresh_failures": self.refresh_failures,
+            "blocking_refreshes": self.blocking_refreshes,
+        }
+
+
+_active_provider = None
+
+
+def get_credential_stats():
+    """
+    Returns refresh statistics for the credentials handed out by assume_role, or None.
+    """
+    return _active_provider.stats() if _active_provider else None
+
+
 def assume_role(max_retries=5, initial_delay=1):
+    """
+    Assumes the development role and returns a session whose credentials renew themselves.
+
+    The caller identity from the session check supplies the account ID, and
+    the STS client is shared across retries and with the background refresher.
+
+    :return: A boto3 session backed by a RoleCredentialProvider
+    """
+    global _active_provider
+
+    session, identity = _get_session_with_identity()
+    if not session:
+        raise NoCredentialsError()
+
+    sts_client = session.client('sts')
+    role_arn = os.getenv('ASSUME_ROLE_ARN')
+    if not role_arn:
+        account_id = identity["Account"]
+        role_arn = f"arn:aws:iam::{account_id}:role/BedrokLocalDevelopmentRoleTeam5"
+
+    provider = RoleCredentialProvider(
+        sts_client,
+        role_arn,
+        duration_seconds=int(os.getenv('ASSUME_ROLE_DURATION_SECONDS', '3600')),
+        refresh_lead_seconds=int(os.getenv('CREDENTIAL_REFRESH_LEAD_SECONDS', '1200'))
+    )
+
     for attempt in range(max_retries):
         try:
-            session = get_session()
-            if not session:
-                raise NoCredentialsError("Unable to locate valid credentials")
-
-            sts_client = session.client('sts')
-            account_id = sts_client.get_caller_identity()["Account"]
-            role_arn = f"arn:aws:iam::{account_id}:role/BedrokLocalDevelopmentRoleTeam5"
-            
-            logger.info(f"Attempting to assume role: {role_arn}")
-            
-            assumed_role_object = sts_client.assume_role(
-                RoleArn=role_arn,
-                RoleSessionName="LocalDevelopmentSession"
-            )
-            
-            credentials = assumed_role_object['Credentials']
-            
+            logger.info("Attempting to assume role: %s", role_arn)
+
+            botocore_session = botocore.session.get_session()
+            botocore_session.get_component('credential_provider').insert_before('env', provider)
             new_session = boto3.Session(
-                aws_access_key_id=credentials['AccessKeyId'],
-                aws_secret_access_key=credentials['SecretAccessKey'],
-                aws_session_token=credentials['SessionToken']
+                botocore_session=botocore_session,
+                region_name=session.region_name
             )
-            
-            logger.info(f"Role assumed successfully on attempt {attempt + 1}")
+            # Resolve credentials now so failures surface here rather than on the first request
+            new_session.get_credentials()
+
+            provider.start()
+            _active_provider = provider
+            logger.info("Role assumed successfully on attempt %s", attempt + 1)
             return new_session
         except ClientError as e:
-            logger.warning(f"Attempt {attempt + 1} failed: {e}")
+            logger.warning("Attempt %s failed: %s", attempt + 1, e)
             if attempt == max_retries - 1:
                 logger.error("Failed to assume role after maximum retries")
                 raise
             time.sleep(initial_delay * (2 ** attempt))  # Exponential backoff
         except Exception as e:
-            logger.error(f"An unexpected error occurred: {e}")
+            logger.error("An unexpected error occurred: %s", e)
             raise
 
 def check_assumed_role(session):
     try:
         sts_client = session.client('sts')
         identity = sts_client.get_caller_identity()
-        logger.info(f"Assumed role identity: {identity['Arn']}")
+        logger.info("Assumed role identity: %s", identity['Arn'])
         return True
     except Exception as e:
-        logger.error(f"Error checking assumed role: {e}")
+        logger.error("Error checking assumed role: %s", e)
         return False
 
 if __name__ == "__main__":
@@ -79,4 +273,4 @@ if __name__ == "__main__":
         else:
             logger.error("Failed to assume role or role is not valid.")
     except Exception as e:
-        logger.error(f"Failed to assume role: {e}")
\ No newline at end of file
+        logger.error("Failed to assume role: %s", e)
\ No newline at end of file
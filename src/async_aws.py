@@ -0,0 +1,73 @@
+# async_aws.py
+
+import os
+import asyncio
+import logging
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bedrock_kb_handler import query_bedrock_kb, save_answer_to_s3, sync_knowledge_base
+from bedrock_handler import query_claude
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the bounded thread pool that runs blocking boto3 calls for the async bot.
+
+    Sized by ASYNC_AWS_WORKERS, defaulting to AWS_MAX_POOL_CONNECTIONS so every
+    worker can hold a pooled connection.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.getenv('ASYNC_AWS_WORKERS', os.getenv('AWS_MAX_POOL_CONNECTIONS', '50')))
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aws-io")
+            logger.info("Started AWS executor with %s workers", workers)
+        return _executor
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Runs a blocking call on the AWS executor without blocking the event loop.
+
+    The time spent queued for a worker is recorded as the 'async.executor_wait' stage.
+    """
+    submitted = time.perf_counter()
+    # run_in_executor does not carry contextvars over, so the request ID is copied explicitly
+    context = contextvars.copy_context()
+
+    def call():
+        observe("async.executor_wait", time.perf_counter() - submitted)
+        return context.run(fn, *args, **kwargs)
+
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+async def query_bedrock_kb_async(session, query):
+    return await run_blocking(query_bedrock_kb, session, query)
+
+
+async def query_claude_async(session, messages):
+    return await run_blocking(query_claude, session, messages)
+
+
+async def save_answer_to_s3_async(question, answer, session):
+    return await run_blocking(save_answer_to_s3, question, answer, session)
+
+
+async def sync_knowledge_base_async(session):
+    return await run_blocking(sync_knowledge_base, session)
+
+
+def executor_stats():
+    executor = _executor
+    if executor is None:
+        return {"workers": 0, "queued": 0}
+    return {"workers": executor._max_workers, "queued": executor._work_queue.qsize()}
@@ -0,0 +1,151 @@
+# async_slack_handler.py
+import asyncio
+import logging
+from slack_bolt import BoltResponse
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_sdk import WebClient
+from async_aws import run_blocking
+from event_dedupe import dedupe_key
+from slack_handler import SlackHandler, SLACK_SEND_TIMEOUT_SECONDS
+from metrics import timer
+from log_setup import bind_request_id, request_id_from_body
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSlackHandler(SlackHandler):
+    """
+    SlackHandler with an asyncio Slack front end (AsyncApp and AsyncSocketModeHandler).
+
+    Only receiving from Slack is async. Every listener hands its payload to
+    the SlackHandler method the sync front end calls, on the async_aws
+    executor, so messages still go through the dispatcher and conversations,
+    thread replies and shutdown behave the same in both modes. boto3 is
+    blocking, so the number of questions answered at once is bounded by the
+    dispatcher's workers here too; what the event loop adds is a Socket Mode
+    connection that keeps acking while every worker is busy.
+
+    Experimental: SlackHandler with `--mode sync` is the supported setup.
+    """
+
+    def __init__(self, slack_bot_token, slack_app_token, client=None):
+        """
+        :param client: Optional preconfigured AsyncWebClient, e.g. from the benchmarks
+        """
+        if client is not None:
+            self.app = AsyncApp(client=client)
+        else:
+            self.app = AsyncApp(token=slack_bot_token)
+        self.socket_mode_handler = AsyncSocketModeHandler(self.app, slack_app_token)
+        # Worker and background threads post with a blocking client rather than going through the loop
+        self.client = WebClient(token=self.app.client.token, base_url=self.app.client.base_url)
+        self.bot_user_id = None
+        self.loop = None
+        self.init_request_handling()
+        self.setup_listeners()
+
+    async def resolve_bot_user_id(self):
+        try:
+            response = await self.app.client.auth_test()
+            self.bot_user_id = response['user_id']
+            return self.bot_user_id
+        except Exception as e:
+            logger.error("Failed to authenticate with Slack API: %s", e, exc_info=True)
+            raise
+
+    def setup_listeners(self):
+        self.app.use(self.bind_request_context)
+        self.app.use(self.deduplicate_events)
+        self.app.error(self.handle_listener_error)
+
+        @self.app.event("app_mention")
+        async def handle_app_mention(event, say, context):
+            bind_request_id(context.get("request_id"))
+            await run_blocking(self.dispatch_message, event, self._call_on_loop(say), context.get("dedupe_key"))
+
+        @self.app.event("message")
+        async def handle_message_event(event, say, context):
+            bind_request_id(context.get("request_id"))
+            await run_blocking(self.handle_message_event, event, self._call_on_loop(say), context.get("dedupe_key"))
+
+        @self.app.command("/use_claude")
+        async def handle_use_claude_command(ack, respond, command, context):
+            bind_request_id(context.get("request_id"))
+            with timer("slack.ack"):
+                await ack()
+            await run_blocking(self.use_claude, command, self._call_on_loop(respond))
+
+        @self.app.command("/add_answer")
+        async def handle_add_answer(ack, respond, command, context):
+            bind_request_id(context.get("request_id"))
+            with timer("slack.ack"):
+                await ack()
+            await run_blocking(self.add_answer, command, self._call_on_loop(respond))
+
+    async def bind_request_context(self, body, context, next):
+        context["request_id"] = bind_request_id(request_id_from_body(body))
+        return await next()
+
+    async def deduplicate_events(self, body, context, next):
+        """
+        Async counterpart of SlackHandler.deduplicate_events.
+
+        The deduplicator can be SQLite shared with other workers, so every call runs on the executor.
+        """
+        key = dedupe_key(body)
+        if key is None:
+            return await next()
+        if not await run_blocking(self.deduplicator.claim, key):
+            logger.info("Ignoring duplicate Slack delivery %s", key)
+            return BoltResponse(status=200, body="")
+        context["dedupe_key"] = key
+        try:
+            response = await next()
+        except Exception:
+            await run_blocking(self.deduplicator.release, key)
+            raise
+        if body.get("type") != "event_callback":
+            await run_blocking(self.deduplicator.complete, key)
+        return response
+
+    async def handle_listener_error(self, error, body):
+        """
+        Async counterpart of SlackHandler.handle_listener_error.
+        """
+        logger.error("Slack listener failed: %s", error, exc_info=error)
+        if body.get("type") == "event_callback":
+            await run_blocking(self.deduplicator.release, dedupe_key(body))
+
+    def _call_on_loop(self, coroutine_fn):
+        """
+        Wraps Bolt's async say or respond as the blocking callable SlackHandler expects.
+        """
+        def call(*args, **kwargs):
+            return asyncio.run_coroutine_threadsafe(coroutine_fn(*args, **kwargs), self.loop).result(SLACK_SEND_TIMEOUT_SECONDS)
+        return call
+
+    async def connect(self):
+        """
+        Opens the Socket Mode connection and returns once it is established.
+        """
+        self.loop = asyncio.get_running_loop()
+        try:
+            logger.info("Connecting async Socket Mode handler")
+            await self.socket_mode_handler.connect_async()
+        except Exception as e:
+            logger.error("Failed to connect Socket Mode handler: %s", e, exc_info=True)
+            raise SystemExit("Critical error: Failed to start Slack Socket Mode handler.")
+
+    async def shutdown_async(self, timeout=None):
+        """
+        Async counterpart of SlackHandler.shutdown. The loop keeps running while
+        the drain waits, so replies from in-flight messages can still be sent.
+
+        :param timeout: Seconds to wait for queued messages; None waits for all of them
+        """
+        try:
+            await self.socket_mode_handler.close_async()
+        except Exception as e:
+            logger.warning("Failed to close Socket Mode handler: %s", e)
+        await asyncio.get_running_loop().run_in_executor(None, self.drain, timeout)
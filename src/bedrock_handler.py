@@ -2,27 +2,107 @@
 
 import json
 import logging
+import time
 from botocore.exceptions import ClientError
+from client_registry import get_client
+from metrics import timer, observe
+from bedrock_limiter import call_bedrock, BedrockThrottledError
+from model_router import model_router
+from log_setup import log_payload, LazyJson
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Appended to an answer that stopped at max_tokens
+TRUNCATED_NOTICE = "\n\n_(This answer was cut off because it reached the length limit.)_"
+
 def get_bedrock_client(session):
     """
-    Creates and returns a Bedrock runtime client using the provided session.
+    Returns the pooled Bedrock runtime client for the provided session.
 
     :param session: A boto3 session with assumed role credentials
     :return: A Bedrock runtime client or None if an error occurred
     """
     try:
-        return session.client('bedrock-runtime')
+        return get_client(session, 'bedrock-runtime')
     except Exception as e:
-        logger.error(f"Error creating Bedrock client: {str(e)}", exc_info=True)
+        logger.error("Error creating Bedrock client: %s", e, exc_info=True)
         return None
 
+def build_request_body(messages: str, max_tokens: int = 10000) -> str:
+    """
+    Converts a JSON list of chat messages into an Anthropic Messages API request body.
+
+    A leading system message is folded into the first user message and any
+    other role is mapped to 'user'.
+
+    :param messages: JSON-formatted string of messages
+    :param max_tokens: Output token limit for the request
+    :return: The JSON request body for invoke_model
+    """
+    parsed_messages = json.loads(messages)
+
+    if parsed_messages[0]['role'] == 'system':
+        system_content = parsed_messages.pop(0)['content']
+        parsed_messages[0]['content'] = f"{system_content}\n\nUser: {parsed_messages[0]['content']}"
+
+    for msg in parsed_messages:
+        if msg['role'] not in ['user', 'assistant']:
+            msg['role'] = 'user'
+
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "messages": parsed_messages
+    })
+
+def invoke_route(bedrock, decision):
+    """
+    Runs one invoke_model call for a routing decision and records its latency, usage and cost.
+
+    :return: The parsed response body
+    """
+    started = time.monotonic()
+    with timer("bedrock.invoke_model"):
+        response = call_bedrock(
+            "bedrock.invoke_model",
+            bedrock.invoke_model,
+            modelId=decision.route.model_id,
+            body=build_request_body(json.dumps(decision.messages), decision.max_tokens),
+            contentType="application/json",
+            accept="application/json"
+        )
+        response_body = json.loads(response.get('body').read())
+    model_router.record(decision, time.monotonic() - started, response_body.get('usage'))
+    return response_body
+
+def complete_claude(bedrock, messages: str) -> dict:
+    """
+    Routes a Claude request and runs it, retrying once on the escalation route
+    when the fast-route answer is truncated or unsure.
+
+    Errors are raised; query_claude turns them into replies.
+
+    :param bedrock: A Bedrock runtime client
+    :param messages: JSON-formatted string of messages
+    :return: The parsed response body of the final attempt
+    """
+    decision = model_router.route(json.loads(messages))
+    response_body = invoke_route(bedrock, decision)
+    log_payload(logger, "Raw response from Bedrock: %s", LazyJson(response_body, indent=2))
+    text = response_body['content'][0]['text'] if response_body.get('content') else ""
+    if model_router.needs_escalation(decision, text, response_body.get('stop_reason')):
+        logger.info("Escalating Claude request from route '%s'", decision.route.name)
+        decision = model_router.escalate(decision)
+        response_body = invoke_route(bedrock, decision)
+    return response_body
+
 def query_claude(session, messages: str) -> str:
     """
-    Queries the Claude AI model with the given list of messages using the provided session.
+    Queries Claude with the given list of messages using the provided session.
+
+    The model and max_tokens come from the model router. A fast-route answer
+    that is truncated or unsure is retried once on the escalation route; one
+    that is still cut off ends with TRUNCATED_NOTICE.
 
     :param session: A boto3 session with assumed role credentials
     :param messages: JSON-formatted string of messages
@@ -34,48 +114,93 @@ def query_claude(session, messages: str) -> str:
         return "Error: Unable to connect to AWS Bedrock. Please check your credentials and try again."
 
     try:
-        parsed_messages = json.loads(messages)
-        
-        if parsed_messages[0]['role'] == 'system':
-            system_content = parsed_messages.pop(0)['content']
-            parsed_messages[0]['content'] = f"{system_content}\n\nUser: {parsed_messages[0]['content']}"
-        
-        for msg in parsed_messages:
-            if msg['role'] not in ['user', 'assistant']:
-                msg['role'] = 'user'
-
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 10000,
-            "messages": parsed_messages
-        })
-
         try:
-            response = bedrock.invoke_model(
-                modelId="anthropic.claude-3-5-sonnet-20240620-v1:0",
-                body=body,
-                contentType="application/json",
-                accept="application/json"
-            )
-            
-            response_body = json.loads(response.get('body').read())
-            logger.info(f"Raw response from Bedrock: {json.dumps(response_body, indent=2)}")
-            
+            response_body = complete_claude(bedrock, messages)
+
             if 'content' in response_body and response_body['content']:
-                return response_body['content'][0]['text']
+                text = response_body['content'][0]['text']
+                if response_body.get('stop_reason') == 'max_tokens':
+                    text += TRUNCATED_NOTICE
+                return text
             else:
-                logger.error(f"Unexpected response structure: {response_body}")
+                logger.error("Unexpected response structure: %s", response_body)
                 return "I'm sorry, I received an unexpected response format."
 
+        except BedrockThrottledError as e:
+            logger.warning("Claude request gave up after repeated throttling: %s", e)
+            return "I'm handling a lot of requests right now. Please try again in a minute."
         except ClientError as e:
             error_code = e.response['Error']['Code']
             error_message = e.response['Error']['Message']
-            logger.error(f"AWS Bedrock ClientError: {error_code} - {error_message}", exc_info=True)
+            logger.error("AWS Bedrock ClientError: %s - %s", error_code, error_message, exc_info=True)
             return f"AWS Bedrock Error: {error_code} - {error_message}"
 
     except json.JSONDecodeError as e:
-        logger.error(f"Error parsing messages JSON: {str(e)}", exc_info=True)
+        logger.error("Error parsing messages JSON: %s", e, exc_info=True)
         return "Error: Invalid message format."
     except Exception as e:
-        logger.error(f"Error querying Claude: {str(e)}", exc_info=True)
-        return "I'm sorry, I encountered an error while processing your request."
\ No newline at end of file
+        logger.error("Error querying Claude: %s", e, exc_info=True)
+        return "I'm sorry, I encountered an error while processing your request."
+
+def stream_claude(session, messages: str):
+    """
+    Streams a Claude completion, yielding text deltas as they arrive.
+
+    Unlike query_claude, errors are raised rather than turned into a reply so
+    the caller can fall back to the non-streaming path. An answer cut off at
+    max_tokens ends with TRUNCATED_NOTICE, since it cannot be escalated once shown. Opening the stream goes
+    through the shared Bedrock limiter; the slot is released once the stream
+    has started.
+
+    :param session: A boto3 session with assumed role credentials
+    :param messages: JSON-formatted string of messages
+    :return: A generator of text fragments
+    """
+    bedrock = get_bedrock_client(session)
+    if not bedrock:
+        raise RuntimeError("Bedrock client is not initialized")
+
+    # Streamed text is shown as it arrives, so there is no escalation retry here
+    decision = model_router.route(json.loads(messages))
+    usage = {}
+    started = time.monotonic()
+    first_token_at = None
+    response = call_bedrock(
+        "bedrock.invoke_model_with_response_stream",
+        bedrock.invoke_model_with_response_stream,
+        modelId=decision.route.model_id,
+        body=build_request_body(json.dumps(decision.messages), decision.max_tokens),
+        contentType="application/json",
+        accept="application/json"
+    )
+
+    try:
+        for event in response.get('body'):
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            payload = json.loads(chunk['bytes'])
+            if payload.get('type') == 'message_start':
+                usage.update(payload.get('message', {}).get('usage', {}))
+            elif payload.get('type') == 'message_delta':
+                usage.update(payload.get('usage', {}))
+                if payload.get('delta', {}).get('stop_reason') == 'max_tokens':
+                    logger.warning("Claude stream on route '%s' hit max_tokens=%d", decision.route.name, decision.max_tokens)
+                    yield TRUNCATED_NOTICE
+            if payload.get('type') != 'content_block_delta':
+                continue
+            text = payload.get('delta', {}).get('text')
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            yield text
+    finally:
+        finished = time.monotonic()
+        model_router.record(decision, finished - started, usage)
+        observe("bedrock.stream_total", finished - started)
+        if first_token_at is not None:
+            observe("bedrock.stream_first_token", first_token_at - started)
+        logger.info("Claude stream finished: time_to_first_token=%s total_time=%.0fms",
+                    f"{(first_token_at - started) * 1000:.0f}ms" if first_token_at is not None else "n/a",
+                    (finished - started) * 1000)
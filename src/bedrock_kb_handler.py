@@ -2,66 +2,294 @@
 import json
 import os
 import logging
-from typing import Tuple
-import uuid
+from typing import Optional, Tuple
 from botocore.exceptions import BotoCoreError, ClientError
+from client_registry import get_client
+from metrics import timer, registry
+from bedrock_handler import get_bedrock_client, complete_claude
+from answer_cache import retrieval_cache
+from normalize import normalize_question
+from qa_index import tokenize
+from bedrock_limiter import call_bedrock, BedrockCallError, BedrockThrottledError
+import kb_events
+from qa_storage import get_qa_storage
+from log_setup import log_payload
+from conversation_store import build_messages
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+RETRIEVE_AND_GENERATE = "retrieve_and_generate"
+RETRIEVE_THEN_GENERATE = "retrieve_then_generate"
+KB_QUERY_MODE = os.getenv('KB_QUERY_MODE', RETRIEVE_AND_GENERATE).lower()
+KB_RETRIEVE_RESULTS = int(os.getenv('KB_RETRIEVE_RESULTS', '5'))
+KB_CONTEXT_MAX_CHARS = int(os.getenv('KB_CONTEXT_MAX_CHARS', '6000'))
+KB_MIN_RETRIEVAL_SCORE = float(os.getenv('KB_MIN_RETRIEVAL_SCORE', '0'))
+UNABLE_TO_ASSIST = "Sorry, I am unable to assist you with this request."
+
+GENERATION_PROMPT = (
+    "You are an HR assistant answering an employee's question in Slack. Answer using only the "
+    "policy excerpts below, concisely and professionally. If they do not contain the answer, "
+    "reply with exactly: " + UNABLE_TO_ASSIST + "\n\n{context}"
+)
+
+context_chunks = registry.counter(
+    "kb_context_chunks_total", "Retrieved KB chunks by what happened to them before generation",
+    labelnames=("outcome",)
+)
+context_chars = registry.histogram(
+    "kb_context_chars", "Characters of retrieved context sent for generation",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+
 def get_bedrock_agent_runtime_client(session):
     """
-    Returns a boto3 client for the Bedrock Agent Runtime service using the provided session.
+    Returns the pooled boto3 client for the Bedrock Agent Runtime service using the provided session.
 
     :param session: A boto3 session with assumed role credentials
     :return: A Bedrock Agent Runtime client or None if an error occurred
     """
     try:
-        return session.client('bedrock-agent-runtime')
+        return get_client(session, 'bedrock-agent-runtime')
         
     except Exception as e:
-        logger.error(f"Error creating Bedrock Agent Runtime client: {str(e)}", exc_info=True)
+        logger.error("Error creating Bedrock Agent Runtime client: %s", e, exc_info=True)
         return None
 
 def query_bedrock_kb(session, query: str) -> Tuple[str, bool]:
     """
     Queries the Bedrock knowledge base with the given query using the provided session.
 
+    Calls go through the shared Bedrock limiter, so throttles are retried
+    within the request deadline. Failures raise instead of returning an empty
+    answer, so callers can tell them apart from the KB not knowing the answer.
+
     :param session: A boto3 session with assumed role credentials
     :param query: The query to send to Bedrock
     :return: The response from Bedrock as a tuple (string, bool)
+    :raises BedrockThrottledError: If Bedrock kept throttling until the deadline
+    :raises BedrockCallError: If the call failed for any other reason
+    """
+    answer, valid, _ = query_bedrock_kb_in_session(session, query)
+    return answer, valid
+
+def is_session_error(error):
+    """
+    :return: True if Bedrock rejected the request because of its sessionId, e.g. an expired session
     """
+    cause = error.__cause__ if isinstance(error, BedrockCallError) else error
+    return (isinstance(cause, ClientError)
+            and cause.response.get("Error", {}).get("Code") in ("ValidationException", "ResourceNotFoundException")
+            and "session" in str(cause).lower())
+
+def query_bedrock_kb_in_session(session, query: str, session_id: Optional[str] = None,
+                                history=None) -> Tuple[str, bool, Optional[str]]:
+    """
+    Like query_bedrock_kb, for a follow-up question in a conversation.
+
+    retrieve_and_generate keeps the conversation on Bedrock's side: the
+    returned sessionId is passed back with the next question. Without a
+    session, e.g. when the first answer came from a cache, the previous
+    question is included in the query text instead. A session that Bedrock
+    no longer knows is dropped and the question is asked without it.
+    In retrieve_then_generate mode there is no Bedrock session; the
+    conversation history is sent with the generation instead.
+
+    :param session_id: The sessionId returned for the previous question, if any
+    :param history: (summary, turns) from the conversation store, used by retrieve_then_generate
+    :return: The answer, whether it is usable, and the sessionId for the next question
+    """
+    if KB_QUERY_MODE == RETRIEVE_THEN_GENERATE:
+        answer, valid = retrieve_then_generate(session, query, history)
+        return answer, valid, None
+
     bedrock_agent_runtime = get_bedrock_agent_runtime_client(session)
     if not bedrock_agent_runtime:
         logger.error("Bedrock Agent Runtime client is not initialized")
-        return "Error: Unable to connect to AWS Bedrock. Please check your credentials and try again.", False
+        raise BedrockCallError("Bedrock Agent Runtime client is not initialized")
+
+    turns = history[1] if history else []
+    if not session_id and turns:
+        query = f"Earlier question: {turns[-1][0]}\nFollow-up question: {query}"
 
     try:
         knowledge_base_id = os.environ.get("BEDROCK_KB_ID")
         model_arn = os.environ.get("BEDROCK_MODEL_ARN", "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-sonnet-20240620-v1:0")
-        
-        response = bedrock_agent_runtime.retrieve_and_generate(
-            input={
+        request = {
+            'input': {
                 'text': query
             },
-            retrieveAndGenerateConfiguration={
+            'retrieveAndGenerateConfiguration': {
                 'type': 'KNOWLEDGE_BASE',
                 'knowledgeBaseConfiguration': {
                     'knowledgeBaseId': knowledge_base_id,
                     'modelArn': model_arn
                 }
             }
-        )
+        }
+        if session_id:
+            request['sessionId'] = session_id
 
-        if 'output' in response and 'text' in response['output']:
-            return response['output']['text'], True
-        else:
-            logger.error(f"Unexpected response structure: {response}")
-            return "", False
+        with timer("bedrock.retrieve_and_generate"):
+            response = call_bedrock(
+                "bedrock.retrieve_and_generate",
+                bedrock_agent_runtime.retrieve_and_generate,
+                **request
+            )
 
+    except BedrockThrottledError:
+        logger.warning("Bedrock KB query gave up after repeated throttling")
+        raise
     except Exception as e:
-        logger.error(f"Error querying Bedrock KB: {str(e)}", exc_info=True)
-        return "", False
+        if session_id and is_session_error(e):
+            logger.info("Bedrock KB session %s is no longer valid, starting a new one", session_id)
+            return query_bedrock_kb_in_session(session, query, history=history)
+        logger.error("Error querying Bedrock KB: %s", e, exc_info=True)
+        raise BedrockCallError(str(e)) from e
+
+    if 'output' in response and 'text' in response['output']:
+        return response['output']['text'], True, response.get('sessionId')
+    else:
+        logger.error("Unexpected response structure: %s", response)
+        return "", False, None
+
+def retrieval_key(query):
+    """
+    Cache key for retrieval results: the query's stemmed content words, deduplicated and sorted.
+
+    This is looser than the answer cache key on purpose, so rewordings like
+    "how many vacation days do I get" and "vacation days, how many do I get"
+    share one retrieval while still getting their own generated answer.
+    """
+    terms = sorted({term for term in tokenize(query) if "_" not in term})
+    return " ".join(terms) or normalize_question(query)
+
+def retrieve_chunks(session, query):
+    """
+    Runs the KB retrieve call, reusing cached results for queries with the same retrieval key.
+
+    :return: A list of {'text', 'score', 'uri'} dicts, best match first
+    :raises BedrockThrottledError: If Bedrock kept throttling until the deadline
+    :raises BedrockCallError: If the call failed for any other reason
+    """
+    key = retrieval_key(query)
+    with timer("kb.retrieval_cache_lookup"):
+        cached = retrieval_cache.get(key)
+    if cached is not None:
+        return cached
+
+    generation = retrieval_cache.generation()
+    bedrock_agent_runtime = get_bedrock_agent_runtime_client(session)
+    if not bedrock_agent_runtime:
+        raise BedrockCallError("Bedrock Agent Runtime client is not initialized")
+    try:
+        with timer("bedrock.retrieve"):
+            response = call_bedrock(
+                "bedrock.retrieve",
+                bedrock_agent_runtime.retrieve,
+                knowledgeBaseId=os.environ.get("BEDROCK_KB_ID"),
+                retrievalQuery={'text': query},
+                retrievalConfiguration={
+                    'vectorSearchConfiguration': {'numberOfResults': KB_RETRIEVE_RESULTS}
+                }
+            )
+    except BedrockCallError:
+        raise
+    except Exception as e:
+        logger.error("Error retrieving from Bedrock KB: %s", e, exc_info=True)
+        raise BedrockCallError(str(e)) from e
+
+    chunks = []
+    for result in response.get('retrievalResults', []):
+        text = (result.get('content') or {}).get('text', '')
+        if text.strip():
+            chunks.append({
+                'text': text,
+                'score': result.get('score', 0.0),
+                'uri': (result.get('location') or {}).get('s3Location', {}).get('uri'),
+            })
+    chunks.sort(key=lambda chunk: chunk['score'], reverse=True)
+    retrieval_cache.put(key, chunks, generation)
+    return chunks
+
+def prepare_context(chunks, max_chars=None, min_score=None):
+    """
+    Drops low-scoring and duplicate chunks and trims the rest to a character budget.
+
+    A chunk is a duplicate when its whitespace-normalized text is contained in
+    a chunk already kept; overlapping ingestion chunks often repeat a section.
+
+    :param chunks: Retrieval results from retrieve_chunks, best first
+    :return: The context text to send for generation
+    """
+    max_chars = KB_CONTEXT_MAX_CHARS if max_chars is None else max_chars
+    min_score = KB_MIN_RETRIEVAL_SCORE if min_score is None else min_score
+    kept, kept_normalized, used = [], [], 0
+    for chunk in chunks:
+        if chunk['score'] < min_score:
+            context_chunks.inc("low_score")
+            continue
+        normalized = " ".join(chunk['text'].split())
+        if any(normalized in other for other in kept_normalized):
+            context_chunks.inc("duplicate")
+            continue
+        remaining = max_chars - used
+        if remaining <= 0:
+            context_chunks.inc("over_budget")
+            continue
+        kept_normalized.append(normalized)
+        if len(normalized) > remaining:
+            # Cut at a word boundary; whatever follows would not fit either
+            kept.append(normalized[:remaining].rsplit(" ", 1)[0])
+            context_chunks.inc("truncated")
+            used = max_chars
+        else:
+            kept.append(normalized)
+            context_chunks.inc("kept")
+            used += len(normalized)
+    context_chars.observe(used)
+    return "\n\n".join(f"<excerpt>\n{text}\n</excerpt>" for text in kept)
+
+def retrieve_then_generate(session, query: str, history=None) -> Tuple[str, bool]:
+    """
+    Two-stage alternative to retrieve_and_generate: retrieve chunks (cached), then
+    generate the answer through the routed Claude path used by query_claude.
+
+    Questions with no usable chunks get UNABLE_TO_ASSIST without a generation call.
+    For a follow-up, the previous question is added to the retrieval query and
+    the conversation history is sent with the generation.
+
+    :param history: (summary, turns) from the conversation store, if this is a follow-up
+    :return: The answer and whether it is usable, like query_bedrock_kb
+    :raises BedrockThrottledError: If Bedrock kept throttling until the deadline
+    :raises BedrockCallError: If either stage failed for any other reason
+    """
+    summary, turns = history or ("", [])
+    with timer("kb.retrieve_then_generate"):
+        # "and for part-timers?" retrieves little on its own
+        chunks = retrieve_chunks(session, f"{turns[-1][0]} {query}" if turns else query)
+        with timer("kb.prepare_context"):
+            context = prepare_context(chunks)
+        if not context:
+            # A definite "the KB has nothing on this", unlike a malformed response
+            logger.info("No usable KB chunks retrieved for the question")
+            return UNABLE_TO_ASSIST, True
+
+        bedrock = get_bedrock_client(session)
+        if not bedrock:
+            raise BedrockCallError("Bedrock client is not initialized")
+        messages = json.dumps(build_messages(GENERATION_PROMPT.format(context=context), summary, turns, query))
+        try:
+            response_body = complete_claude(bedrock, messages)
+        except BedrockCallError:
+            raise
+        except Exception as e:
+            logger.error("Error generating KB answer: %s", e, exc_info=True)
+            raise BedrockCallError(str(e)) from e
+
+    if response_body.get('content'):
+        return response_body['content'][0]['text'], True
+    logger.error("Unexpected response structure: %s", response_body)
+    return "", False
 
 def get_kb_info(session):
     """
@@ -82,44 +310,41 @@ def get_kb_info(session):
         )
         return json.dumps(response, indent=2)
     except Exception as e:
-        logger.error(f"Error retrieving KB info: {str(e)}", exc_info=True)
+        logger.error("Error retrieving KB info: %s", e, exc_info=True)
         return f"Error retrieving KB info: {str(e)}"
     
 def save_answer_to_s3(question, answer, session):
+    """
+    Stores an HR-provided question and answer in the knowledge base data source.
+
+    Each answer is written as its own object through the Q&A storage layer, so
+    the cost does not grow with the size of the knowledge base and concurrent
+    writers cannot lose each other's answers.
+
+    :param question: The employee question
+    :param answer: The HR answer
+    :param session: A boto3 session with the necessary AWS credentials
+    """
     try:
-        s3_client = session.client('s3')
-        bucket_name = os.getenv('S3_BUCKET_NAME')
-        knowledge_base_key = os.getenv('S3_KB_FILE_KEY')
-
-        # Retrieve the existing knowledge base from S3
-        response = s3_client.get_object(Bucket=bucket_name, Key=knowledge_base_key)
-        knowledge_base = json.loads(response['Body'].read().decode('utf-8'))
-
-        # Add the new question and answer
-        knowledge_base.append({"question": question, "answer": answer})
-
-        # Save the updated knowledge base back to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=knowledge_base_key,
-            Body=json.dumps(knowledge_base),
-            ContentType='application/json'
-        )
-        logger.info(f"Successfully added question and answer to S3: {question} | {answer}")
+        with timer("s3.save_answer"):
+            key = get_qa_storage(session).add(question, answer)
+        logger.info("Successfully added question and answer to %s", key)
+        log_payload(logger, "Saved Q&A pair: %s | %s", question, answer)
+        kb_events.publish("answer_saved")
     except Exception as e:
-        logger.error(f"Failed to save answer to S3: {str(e)}", exc_info=True)
+        logger.error("Failed to save answer to S3: %s", e, exc_info=True)
         raise
 
-def sync_knowledge_base(session):
+def start_ingestion_job(session):
     """
-    Synchronizes the Amazon Bedrock knowledge base with the specified data source.
+    Starts a Bedrock ingestion job for the configured knowledge base data source.
 
     :param session: A boto3 session with the necessary AWS credentials and configuration.
-    :return: True if the sync is initiated successfully, False otherwise.
+    :return: The ingestion job ID, or None if the job could not be started.
     """
     try:
         # Initialize the bedrock-agent client
-        client = session.client('bedrock-agent')
+        client = get_client(session, 'bedrock-agent')
 
         # Retrieve environment variables
         knowledge_base_id = os.getenv('BEDROCK_KB_ID')
@@ -127,23 +352,51 @@ def sync_knowledge_base(session):
 
         if not knowledge_base_id or not data_source_id:
             logger.error("Environment variables 'BEDROCK_KB_ID' or 'BEDROCK_DATA_SOURCE_ID' are not set.")
-            return False
-
-        # Generate a unique client token for idempotency
-        # client_token = str(uuid.uuid4())  # Generates a 36-character UUID
+            return None
 
         # Start the ingestion job
-        response = client.start_ingestion_job(
-            # clientToken=client_token,
-            dataSourceId=data_source_id,
-            description='Synchronizing knowledge base with S3 data source',
-            knowledgeBaseId=knowledge_base_id
-        )
+        with timer("bedrock.start_ingestion_job"):
+            response = client.start_ingestion_job(
+                dataSourceId=data_source_id,
+                description='Synchronizing knowledge base with S3 data source',
+                knowledgeBaseId=knowledge_base_id
+            )
 
-        ingestion_job_id = response.get('ingestionJob', {}).get('ingestionJobId', 'N/A')
-        logger.info(f"Knowledge base sync triggered successfully. Ingestion Job ID: {ingestion_job_id}")
-        return True
+        ingestion_job_id = response.get('ingestionJob', {}).get('ingestionJobId')
+        if not ingestion_job_id:
+            logger.error("start_ingestion_job returned no ingestion job ID")
+            return None
+        logger.info("Knowledge base sync triggered successfully. Ingestion Job ID: %s", ingestion_job_id)
+        return ingestion_job_id
 
     except (BotoCoreError, ClientError) as error:
-        logger.error(f"Failed to sync knowledge base: {error}", exc_info=True)
-        return False
\ No newline at end of file
+        logger.error("Failed to sync knowledge base: %s", error, exc_info=True)
+        return None
+
+def get_ingestion_job_status(session, ingestion_job_id):
+    """
+    Returns the status of an ingestion job, e.g. 'IN_PROGRESS', 'COMPLETE' or 'FAILED'.
+
+    :param session: A boto3 session with the necessary AWS credentials and configuration.
+    :param ingestion_job_id: The job ID returned by start_ingestion_job
+    :return: The job status string
+    """
+    client = get_client(session, 'bedrock-agent')
+    response = client.get_ingestion_job(
+        knowledgeBaseId=os.getenv('BEDROCK_KB_ID'),
+        dataSourceId=os.getenv('BEDROCK_DATA_SOURCE_ID'),
+        ingestionJobId=ingestion_job_id
+    )
+    return response.get('ingestionJob', {}).get('status')
+
+def sync_knowledge_base(session):
+    """
+    Synchronizes the Amazon Bedrock knowledge base with the specified data source.
+
+    :param session: A boto3 session with the necessary AWS credentials and configuration.
+    :return: True if the sync is initiated successfully, False otherwise.
+    """
+    if start_ingestion_job(session) is None:
+        return False
+    kb_events.publish("sync_started")
+    return True
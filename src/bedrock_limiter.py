@@ -0,0 +1,222 @@
+# bedrock_limiter.py
+
+import os
+import random
+import logging
+import threading
+import time
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+# Error codes that mean "slow down" rather than "this request is wrong"
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
+
+# Server-side failures worth another attempt; they say nothing about load, so
+# they do not shrink the concurrency limit
+TRANSIENT_ERROR_CODES = {
+    "InternalServerException",
+    "InternalFailure",
+    "ServiceFailure",
+}
+
+
+class BedrockCallError(Exception):
+    """
+    A Bedrock call failed. Unlike an empty or "unable to assist" answer, this
+    says nothing about whether the knowledge base knows the answer.
+    """
+
+
+class BedrockThrottledError(BedrockCallError):
+    """
+    Bedrock kept throttling until the request deadline ran out.
+    """
+
+
+def is_retryable(error):
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in RETRYABLE_ERROR_CODES
+
+
+def is_transient(error):
+    """
+    :return: True for connection errors, read timeouts and 5xx responses that are not throttles
+    """
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError)):
+        return True
+    if not isinstance(error, ClientError):
+        return False
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+    return error.response.get("Error", {}).get("Code") in TRANSIENT_ERROR_CODES or status >= 500
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit shared by every Bedrock runtime call.
+
+    The limit grows by roughly one slot per limit's worth of successful calls
+    made while the limiter is saturated, and is multiplied by backoff_ratio when
+    Bedrock throttles. Throttles arriving within cooldown_seconds of the last
+    decrease are treated as part of the same burst and do not shrink it again.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, backoff_ratio=0.7, cooldown_seconds=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.cooldown_seconds = cooldown_seconds
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._waiting = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.successes = 0
+        self.throttles = 0
+        self.failures = 0
+        self.decreases = 0
+        self.acquire_timeouts = 0
+        self.retries = 0
+        self.retries_exhausted = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            initial_limit=int(os.getenv('BEDROCK_LIMITER_INITIAL', '8')),
+            min_limit=int(os.getenv('BEDROCK_LIMITER_MIN', '1')),
+            max_limit=int(os.getenv('BEDROCK_LIMITER_MAX', '64')),
+            backoff_ratio=float(os.getenv('BEDROCK_LIMITER_BACKOFF_RATIO', '0.7')),
+            cooldown_seconds=float(os.getenv('BEDROCK_LIMITER_COOLDOWN_SECONDS', '1')),
+        )
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def acquire(self, timeout):
+        """
+        Waits for a free slot.
+
+        :param timeout: Seconds to wait at most
+        :return: True if a slot was taken, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._in_flight >= int(self._limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.acquire_timeouts += 1
+                        return False
+                    self._cond.wait(remaining)
+                self._in_flight += 1
+                return True
+            finally:
+                self._waiting -= 1
+
+    def release(self, outcome):
+        """
+        Frees a slot and adjusts the limit.
+
+        :param outcome: 'success', 'throttled' or 'failed'
+        """
+        with self._cond:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            if outcome == "success":
+                self.successes += 1
+                if saturated and self._limit < self.max_limit:
+                    self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            elif outcome == "throttled":
+                self.throttles += 1
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown_seconds:
+                    self._last_decrease = now
+                    self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+                    self.decreases += 1
+                    logger.warning("Bedrock throttled, concurrency limit lowered to %s", int(self._limit))
+            else:
+                self.failures += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "waiting": self._waiting,
+                "successes": self.successes,
+                "throttles": self.throttles,
+                "failures": self.failures,
+                "decreases": self.decreases,
+                "acquire_timeouts": self.acquire_timeouts,
+                "retries": self.retries,
+                "retries_exhausted": self.retries_exhausted,
+            }
+
+
+bedrock_limiter = AdaptiveLimiter.from_env()
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv('BEDROCK_REQUEST_DEADLINE_SECONDS', '30'))
+RETRY_BASE_SECONDS = float(os.getenv('BEDROCK_RETRY_BASE_SECONDS', '0.25'))
+RETRY_MAX_BACKOFF_SECONDS = float(os.getenv('BEDROCK_RETRY_MAX_BACKOFF_SECONDS', '8'))
+# Matches botocore's standard retry mode, which the Bedrock clients no longer use
+TRANSIENT_MAX_ATTEMPTS = int(os.getenv('BEDROCK_TRANSIENT_MAX_ATTEMPTS', '3'))
+
+
+def call_bedrock(stage, fn, *args, deadline_seconds=None, limiter=None, **kwargs):
+    """
+    Runs a Bedrock call under the shared limiter, retrying throttles with
+    full-jitter exponential backoff until the request deadline.
+
+    Connection errors, read timeouts and 5xx responses are retried the same
+    way, up to TRANSIENT_MAX_ATTEMPTS attempts in all, and re-raised unchanged
+    once those run out. The deadline bounds waiting for a slot and sleeping
+    between attempts; a single attempt is bounded by the client's read
+    timeout. Other errors are re-raised unchanged on the first attempt.
+
+    :param stage: Stage name used for the limiter wait metric, e.g. 'bedrock.invoke_model'
+    :param fn: The client method to call
+    :param deadline_seconds: Overall budget, defaults to BEDROCK_REQUEST_DEADLINE_SECONDS
+    :return: The result of fn
+    :raises BedrockThrottledError: If no attempt succeeded before the deadline
+    """
+    limiter = limiter or bedrock_limiter
+    deadline = time.monotonic() + (REQUEST_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds)
+    attempt = 0
+    transient_attempts = 0
+    while True:
+        wait_started = time.monotonic()
+        if not limiter.acquire(max(0.0, deadline - wait_started)):
+            raise BedrockThrottledError(f"Timed out waiting for Bedrock capacity ({stage})")
+        observe(f"{stage}.limiter_wait", time.monotonic() - wait_started)
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            throttled = is_retryable(e)
+            limiter.release("throttled" if throttled else "failed")
+            if not throttled:
+                transient_attempts += 1
+                if not is_transient(e) or transient_attempts >= TRANSIENT_MAX_ATTEMPTS:
+                    raise
+            backoff = random.uniform(0, min(RETRY_MAX_BACKOFF_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+            if time.monotonic() + backoff >= deadline:
+                limiter.retries_exhausted += 1
+                if not throttled:
+                    raise
+                raise BedrockThrottledError(f"Bedrock throttled {stage} for {attempt + 1} attempt(s)") from e
+            attempt += 1
+            limiter.retries += 1
+            logger.info("%s %s, retry %d in %.2fs", stage, "throttled" if throttled else "failed", attempt, backoff)
+            time.sleep(backoff)
+            continue
+
+        limiter.release("success")
+        return result
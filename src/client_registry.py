@@ -0,0 +1,140 @@
+# client_registry.py
+
+import os
+import logging
+import threading
+import weakref
+from botocore.config import Config
+from metrics import timer
+
+logger = logging.getLogger(__name__)
+
+# Throttles, connection errors and 5xx responses on these services are retried by
+# bedrock_limiter.call_bedrock, which needs to see every throttle to adapt its
+# concurrency limit
+LIMITER_MANAGED_SERVICES = ('bedrock-runtime', 'bedrock-agent-runtime')
+
+
+def build_client_config():
+    """
+    Builds the botocore client configuration shared by every pooled client.
+
+    Pool size, keep-alive and timeouts can be tuned with the
+    AWS_MAX_POOL_CONNECTIONS, AWS_TCP_KEEPALIVE, AWS_CONNECT_TIMEOUT and
+    AWS_READ_TIMEOUT environment variables.
+
+    :return: A botocore Config instance
+    """
+    return Config(
+        max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50')),
+        tcp_keepalive=os.getenv('AWS_TCP_KEEPALIVE', 'true').lower() == 'true',
+        connect_timeout=float(os.getenv('AWS_CONNECT_TIMEOUT', '5')),
+        read_timeout=float(os.getenv('AWS_READ_TIMEOUT', '120')),
+    )
+
+
+class ClientRegistry:
+    """
+    Process-wide cache of boto3 clients keyed by session and service name.
+
+    boto3 clients are thread-safe once built, but building one reloads the
+    service model and starts with an empty connection pool. The registry
+    builds each client once per session and hands the same instance to every
+    caller. Entries are dropped when their session is garbage collected (for
+    example after credentials rotate and a new session replaces the old one)
+    or when rotate() is called explicitly.
+    """
+
+    def __init__(self, config=None):
+        self._config = config
+        self._lock = threading.Lock()
+        self._clients = weakref.WeakKeyDictionary()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def config(self):
+        if self._config is None:
+            self._config = build_client_config()
+        return self._config
+
+    def config_for(self, service_name):
+        if service_name in LIMITER_MANAGED_SERVICES:
+            return self.config.merge(Config(retries={'mode': 'standard', 'total_max_attempts': 1}))
+        return self.config
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get_client(self, session, service_name):
+        """
+        Returns a pooled client for the given session and service, creating it on first use.
+
+        :param session: A boto3 session
+        :param service_name: The AWS service name, e.g. 'bedrock-runtime'
+        :return: A boto3 client
+        """
+        clients = self._clients.get(session)
+        if clients is not None:
+            client = clients.get(service_name)
+            if client is not None:
+                self.hits += 1
+                return client
+
+        with self._lock:
+            clients = self._clients.setdefault(session, {})
+            client = clients.get(service_name)
+            if client is not None:
+                self.hits += 1
+                return client
+            self.misses += 1
+            # Session.client() itself is not thread-safe, so creation stays under the lock
+            with timer("aws.client_create"):
+                client = session.client(service_name, config=self.config_for(service_name))
+            clients[service_name] = client
+            logger.info("Created pooled %s client (generation %s)", service_name, self._generation)
+            return client
+
+    def rotate(self, session=None):
+        """
+        Drops cached clients so the next call builds fresh ones.
+
+        :param session: Only drop clients for this session; drop everything when None
+        """
+        with self._lock:
+            if session is None:
+                self._clients = weakref.WeakKeyDictionary()
+            else:
+                self._clients.pop(session, None)
+            self._generation += 1
+        logger.info("Client registry rotated to generation %s", self._generation)
+
+    def stats(self):
+        with self._lock:
+            size = sum(len(clients) for clients in self._clients.values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "clients": size,
+            "generation": self._generation,
+        }
+
+
+_registry = ClientRegistry()
+
+
+def get_client_registry():
+    return _registry
+
+
+def get_client(session, service_name):
+    """
+    Returns a pooled client from the process-wide registry.
+
+    :param session: A boto3 session
+    :param service_name: The AWS service name
+    :return: A boto3 client
+    """
+    return _registry.get_client(session, service_name)
@@ -0,0 +1,442 @@
+# conversation_store.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from model_router import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def conversation_key(channel, thread_ts):
+    """
+    :param channel: The Slack channel ID
+    :param thread_ts: The thread's root ts, or the message's own ts for a top-level message
+    :return: The key for the conversation, or None if either part is missing
+    """
+    if not channel or not thread_ts:
+        return None
+    return f"{channel}:{thread_ts}"
+
+
+def _clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def summarize_turns(summary, turns, max_chars=1200):
+    """
+    Folds turns into a running summary without a model call: each question is
+    kept with the first sentence of its answer, and the oldest lines are dropped
+    once the summary passes max_chars.
+
+    :param summary: The summary so far, possibly empty
+    :param turns: (question, answer) pairs being folded in, oldest first
+    :return: The new summary
+    """
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        first_sentence = SENTENCE_END.split(answer.strip(), 1)[0]
+        lines.append(f"- Asked: {_clip(question, 200)} Answered: {_clip(first_sentence, 200)}")
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_messages(system_message, summary, turns, question):
+    """
+    Builds the chat messages for query_claude: the system message (with the
+    summary of older turns appended), the recent turns, then the new question.
+
+    :return: A list of message dicts
+    """
+    if summary:
+        system_message = f"{system_message}\n\nSummary of the earlier conversation in this thread:\n{summary}"
+    messages = [{"role": "system", "content": system_message}]
+    for previous_question, answer in turns:
+        messages.append({"role": "user", "content": previous_question})
+        messages.append({"role": "assistant", "content": answer})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+class Conversation:
+    __slots__ = ("key", "turns", "summary", "kb_session_id", "last_active", "summarizing")
+
+    def __init__(self, key, now):
+        self.key = key
+        self.turns = []
+        self.summary = ""
+        self.kb_session_id = None
+        self.last_active = now
+        self.summarizing = False
+
+    def tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns)
+
+    def to_dict(self):
+        return {"turns": self.turns, "summary": self.summary, "kb_session_id": self.kb_session_id}
+
+    @classmethod
+    def from_dict(cls, key, data, last_active):
+        conversation = cls(key, last_active)
+        conversation.turns = [tuple(turn) for turn in data["turns"]]
+        conversation.summary = data["summary"]
+        conversation.kb_session_id = data["kb_session_id"]
+        return conversation
+
+
+class ConversationStore:
+    """
+    Per-thread conversation state for follow-up questions.
+
+    Each conversation keeps its recent (question, answer) turns, a summary of
+    older ones and the Bedrock KB session ID. Once the stored turns pass
+    token_budget, the oldest are folded into the summary by summarize_fn, so
+    a conversation holds at most about token_budget tokens of turns plus
+    summary_max_chars of summary, with each stored text clipped to
+    max_turn_chars. history() returns the summary and the newest turns that fit the budget.
+
+    Conversations idle for idle_seconds are dropped, and beyond
+    max_conversations the least recently active go first.
+    """
+
+    def __init__(self, token_budget=1500, max_turn_chars=2000, summary_max_chars=1200, idle_seconds=1800,
+                 max_conversations=5000, summarize_fn=None, clock=time.monotonic):
+        self.token_budget = token_budget
+        self.max_turn_chars = max_turn_chars
+        self.summary_max_chars = summary_max_chars
+        self.idle_seconds = idle_seconds
+        self.max_conversations = max_conversations
+        self.summarize_fn = summarize_fn or (lambda summary, turns: summarize_turns(summary, turns, self.summary_max_chars))
+        self.clock = clock
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.follow_ups = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.idle_evictions = 0
+        self.capacity_evictions = 0
+
+    @classmethod
+    def from_env(cls, summarize_fn=None, idle_seconds=None, namespace="threads"):
+        """
+        CONVERSATION_BACKEND picks 'memory' (this class) or 'sqlite'
+        (SqliteConversationStore at CONVERSATION_SQLITE_PATH).
+
+        :param idle_seconds: Overrides CONVERSATION_IDLE_SECONDS
+        :param namespace: Keeps stores sharing one SQLite file apart
+        """
+        if idle_seconds is None:
+            idle_seconds = float(os.getenv('CONVERSATION_IDLE_SECONDS', '1800'))
+        options = dict(
+            token_budget=int(os.getenv('CONVERSATION_TOKEN_BUDGET', '1500')),
+            max_turn_chars=int(os.getenv('CONVERSATION_MAX_TURN_CHARS', '2000')),
+            summary_max_chars=int(os.getenv('CONVERSATION_SUMMARY_MAX_CHARS', '1200')),
+            idle_seconds=idle_seconds,
+            max_conversations=int(os.getenv('CONVERSATION_MAX_ACTIVE', '5000')),
+            summarize_fn=summarize_fn,
+        )
+        backend = os.getenv('CONVERSATION_BACKEND', 'memory').lower()
+        if backend == 'sqlite':
+            path = os.getenv('CONVERSATION_SQLITE_PATH', '/tmp/slackbot-conversations.sqlite3')
+            return SqliteConversationStore(path, namespace=namespace, **options)
+        if backend != 'memory':
+            raise ValueError(f"Unknown CONVERSATION_BACKEND '{backend}', expected 'memory' or 'sqlite'")
+        return cls(**options)
+
+    @property
+    def enabled(self):
+        return self.max_conversations > 0
+
+    def _evict_idle_locked(self, now):
+        # Ordered by last activity, so idle conversations are at the front
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_active < self.idle_seconds:
+                break
+            del self._conversations[key]
+            self.idle_evictions += 1
+
+    def get(self, key):
+        """
+        :return: The live conversation for key, or None
+        """
+        if not key or not self.enabled:
+            return None
+        now = self.clock()
+        with self._lock:
+            self._evict_idle_locked(now)
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                conversation.last_active = now
+                self._conversations.move_to_end(key)
+            return conversation
+
+    def history(self, key):
+        """
+        :return: (summary, turns) to send with the next question: the summary and the newest turns within token_budget
+        """
+        conversation = self.get(key)
+        if conversation is None:
+            return "", []
+        with self._lock:
+            summary = conversation.summary
+            budget = self.token_budget - estimate_tokens(summary) if summary else self.token_budget
+            turns = []
+            for question, answer in reversed(conversation.turns):
+                budget -= estimate_tokens(question) + estimate_tokens(answer)
+                if budget < 0:
+                    break
+                turns.append((question, answer))
+        turns.reverse()
+        return summary, turns
+
+    def kb_session_id(self, key):
+        conversation = self.get(key)
+        return conversation.kb_session_id if conversation is not None else None
+
+    def record(self, key, question, answer, kb_session_id=None):
+        """
+        Adds a turn to the conversation, creating it if needed, and summarizes older turns once over budget.
+        """
+        if not key or not self.enabled:
+            return
+        now = self.clock()
+        with self._lock:
+            self._evict_idle_locked(now)
+            conversation = self._conversations.get(key)
+            if conversation is None:
+                conversation = self._conversations[key] = Conversation(key, now)
+                self.created += 1
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+                    self.capacity_evictions += 1
+            else:
+                self.follow_ups += 1
+            self._conversations.move_to_end(key)
+            folded, previous_summary = self._add_turn(conversation, now, question, answer, kb_session_id)
+        if folded:
+            self._summarize(conversation, previous_summary, folded)
+
+    def _add_turn(self, conversation, now, question, answer, kb_session_id):
+        """
+        :return: The turns folded out of the conversation to be summarized, and the summary they extend
+        """
+        conversation.last_active = now
+        conversation.turns.append((_clip(question, self.max_turn_chars), _clip(answer, self.max_turn_chars)))
+        if kb_session_id:
+            conversation.kb_session_id = kb_session_id
+        folded = []
+        if not conversation.summarizing:
+            # Always keep the newest turn verbatim
+            while len(conversation.turns) > 1 and conversation.tokens() > self.token_budget:
+                folded.append(conversation.turns.pop(0))
+            conversation.summarizing = bool(folded)
+        return folded, conversation.summary
+
+    def _summarize(self, conversation, previous_summary, folded):
+        try:
+            summary = self.summarize_fn(previous_summary, folded)
+            self.summaries += 1
+        except Exception as e:
+            # Losing the older turns is better than letting the conversation grow without bound
+            self.summary_failures += 1
+            logger.warning("Conversation summary failed, falling back to a plain one: %s", e)
+            summary = summarize_turns(previous_summary, folded, self.summary_max_chars)
+        self._store_summary(conversation, _clip(summary, self.summary_max_chars))
+
+    def _store_summary(self, conversation, summary):
+        with self._lock:
+            conversation.summary = summary
+            conversation.summarizing = False
+
+    def clear(self, key=None):
+        """
+        Drops the conversation for key, or every conversation when key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._conversations.clear()
+            else:
+                self._conversations.pop(key, None)
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def stats(self):
+        with self._lock:
+            tokens = [conversation.tokens() for conversation in self._conversations.values()]
+            return {
+                "active": len(tokens),
+                "tokens_total": sum(tokens),
+                "tokens_max": max(tokens, default=0),
+                "created": self.created,
+                "follow_ups": self.follow_ups,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+                "idle_evictions": self.idle_evictions,
+                "capacity_evictions": self.capacity_evictions,
+            }
+
+
+class SqliteConversationStore(ConversationStore):
+    """
+    ConversationStore kept in a SQLite file, so a follow-up that Slack
+    delivers to another bot worker on the host still sees the earlier turns.
+
+    Each operation runs in its own IMMEDIATE transaction on a fresh copy of
+    the conversation; summaries are still computed outside it and written
+    back afterwards. A summary that never lands (e.g. its worker died) stops
+    blocking further folding after SUMMARY_STALE_SECONDS. The clock defaults
+    to time.time since it is shared between processes.
+    """
+
+    SUMMARY_STALE_SECONDS = 120
+
+    def __init__(self, path, namespace="threads", clock=time.time, **kwargs):
+        super().__init__(clock=clock, **kwargs)
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                "data TEXT NOT NULL, last_active REAL NOT NULL, tokens INTEGER NOT NULL, summarizing_at REAL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_active ON conversations (namespace, last_active)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict_idle(self, conn, now):
+        deleted = conn.execute(
+            "DELETE FROM conversations WHERE namespace = ? AND last_active <= ?",
+            (self.namespace, now - self.idle_seconds)
+        ).rowcount
+        self.idle_evictions += deleted
+
+    def _load(self, conn, key, now):
+        row = conn.execute(
+            "SELECT data, last_active, summarizing_at FROM conversations WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        conversation = Conversation.from_dict(key, json.loads(row[0]), row[1])
+        conversation.summarizing = row[2] is not None and now - row[2] < self.SUMMARY_STALE_SECONDS
+        return conversation
+
+    def _save(self, conn, conversation, now):
+        conn.execute(
+            "INSERT OR REPLACE INTO conversations (namespace, key, data, last_active, tokens, summarizing_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self.namespace, conversation.key, json.dumps(conversation.to_dict()), conversation.last_active,
+             conversation.tokens(), now if conversation.summarizing else None)
+        )
+
+    def get(self, key):
+        if not key or not self.enabled:
+            return None
+        now = self.clock()
+        with self._transaction() as conn:
+            self._evict_idle(conn, now)
+            conversation = self._load(conn, key, now)
+            if conversation is not None:
+                conversation.last_active = now
+                conn.execute(
+                    "UPDATE conversations SET last_active = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key)
+                )
+            return conversation
+
+    def record(self, key, question, answer, kb_session_id=None):
+        if not key or not self.enabled:
+            return
+        now = self.clock()
+        with self._transaction() as conn:
+            self._evict_idle(conn, now)
+            conversation = self._load(conn, key, now)
+            if conversation is None:
+                conversation = Conversation(key, now)
+                self.created += 1
+            else:
+                self.follow_ups += 1
+            folded, previous_summary = self._add_turn(conversation, now, question, answer, kb_session_id)
+            self._save(conn, conversation, now)
+            excess = conn.execute(
+                "SELECT COUNT(*) FROM conversations WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0] - self.max_conversations
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM conversations WHERE namespace = ? AND key IN "
+                    "(SELECT key FROM conversations WHERE namespace = ? ORDER BY last_active LIMIT ?)",
+                    (self.namespace, self.namespace, excess)
+                )
+                self.capacity_evictions += excess
+        if folded:
+            self._summarize(conversation, previous_summary, folded)
+
+    def _store_summary(self, conversation, summary):
+        now = self.clock()
+        with self._transaction() as conn:
+            current = self._load(conn, conversation.key, now)
+            if current is None:
+                return
+            current.summary = summary
+            current.summarizing = False
+            self._save(conn, current, now)
+
+    def clear(self, key=None):
+        with self._transaction() as conn:
+            if key is None:
+                conn.execute("DELETE FROM conversations WHERE namespace = ?", (self.namespace,))
+            else:
+                conn.execute("DELETE FROM conversations WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM conversations WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def stats(self):
+        active, tokens_total, tokens_max = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(MAX(tokens), 0) FROM conversations "
+            "WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return {
+            "active": active,
+            "tokens_total": tokens_total,
+            "tokens_max": tokens_max,
+            "created": self.created,
+            "follow_ups": self.follow_ups,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "idle_evictions": self.idle_evictions,
+            "capacity_evictions": self.capacity_evictions,
+        }
@@ -0,0 +1,153 @@
+# dispatcher.py
+
+import os
+import logging
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    __slots__ = ("user", "channel", "fn", "args", "enqueued_at", "context")
+
+    def __init__(self, user, channel, fn, args):
+        self.user = user
+        self.channel = channel
+        self.fn = fn
+        self.args = args
+        self.enqueued_at = time.monotonic()
+        # Carries the submitter's request ID (see log_setup) into the worker thread
+        self.context = contextvars.copy_context()
+
+
+class MessageDispatcher:
+    """
+    Runs message handlers on a bounded worker pool with per-user and per-channel fairness.
+
+    Jobs wait in a bounded FIFO queue. A queued job only starts when a worker is
+    free and neither its user nor its channel is at its concurrency cap, so
+    later jobs from other users can overtake a chatty user's backlog. When the
+    queue is full, submit() rejects the job so the caller can reply that the
+    bot is busy.
+    """
+
+    def __init__(self, workers=8, max_queue=100, per_user_limit=1, per_channel_limit=4):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self.per_channel_limit = per_channel_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = deque()
+        self._active = 0
+        self._active_by_user = {}
+        self._active_by_channel = {}
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv('DISPATCH_WORKERS', '8')),
+            max_queue=int(os.getenv('DISPATCH_MAX_QUEUE', '100')),
+            per_user_limit=int(os.getenv('DISPATCH_PER_USER_LIMIT', '1')),
+            per_channel_limit=int(os.getenv('DISPATCH_PER_CHANNEL_LIMIT', '4')),
+        )
+
+    def submit(self, user, channel, fn, *args):
+        """
+        Queues fn(*args) for execution.
+
+        :param user: The Slack user ID the work belongs to
+        :param channel: The Slack channel ID the work belongs to
+        :param fn: The handler to run
+        :return: True if the job was accepted, False if the queue is full
+        """
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                self.rejected += 1
+                logger.warning("Dispatch queue full (%s pending), rejecting message from %s", len(self._pending), user)
+                return False
+            self._pending.append(_Job(user, channel, fn, args))
+            self.submitted += 1
+            self._start_runnable_locked()
+        return True
+
+    def _start_runnable_locked(self):
+        if not self._pending or self._active >= self.workers:
+            return
+        skipped = deque()
+        while self._pending and self._active < self.workers:
+            job = self._pending.popleft()
+            if (self._active_by_user.get(job.user, 0) >= self.per_user_limit
+                    or self._active_by_channel.get(job.channel, 0) >= self.per_channel_limit):
+                skipped.append(job)
+                continue
+            self._active += 1
+            self._active_by_user[job.user] = self._active_by_user.get(job.user, 0) + 1
+            self._active_by_channel[job.channel] = self._active_by_channel.get(job.channel, 0) + 1
+            wait = time.monotonic() - job.enqueued_at
+            self.wait_time_total += wait
+            self.wait_time_max = max(self.wait_time_max, wait)
+            observe("dispatch.queue_wait", wait)
+            self._executor.submit(self._run, job)
+        # Jobs held back by a cap keep their place at the front of the queue
+        skipped.extend(self._pending)
+        self._pending = skipped
+
+    def _run(self, job):
+        try:
+            job.context.run(job.fn, *job.args)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Dispatched handler failed: %s", e, exc_info=True)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.completed += 1
+                self._release(self._active_by_user, job.user)
+                self._release(self._active_by_channel, job.channel)
+                self._start_runnable_locked()
+                if not self._active and not self._pending:
+                    self._idle.notify_all()
+
+    @staticmethod
+    def _release(counts, key):
+        remaining = counts.get(key, 0) - 1
+        if remaining > 0:
+            counts[key] = remaining
+        else:
+            counts.pop(key, None)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker pool, first draining queued jobs when wait is True.
+        """
+        if wait:
+            with self._idle:
+                self._idle.wait_for(lambda: not self._active and not self._pending)
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            started = self.completed + self._active
+            return {
+                "queue_depth": len(self._pending),
+                "active": self._active,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_time_avg_seconds": self.wait_time_total / started if started else 0.0,
+                "wait_time_max_seconds": self.wait_time_max,
+            }
@@ -0,0 +1,250 @@
+# event_dedupe.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+# Only deliveries that trigger real work are tracked
+DEDUPED_EVENT_TYPES = ("app_mention", "message")
+
+
+def dedupe_key(body):
+    """
+    Builds the idempotency key for a Slack delivery.
+
+    Events are keyed on the message's client_msg_id, falling back to the
+    envelope's event_id, and prefixed with the event type so the app_mention
+    and message events Slack sends for the same message stay distinct. Slash
+    commands are keyed on trigger_id.
+
+    :param body: The Bolt request body
+    :return: The key, or None if the delivery is not de-duplicated
+    """
+    if body.get("type") == "event_callback":
+        event = body.get("event") or {}
+        if event.get("type") not in DEDUPED_EVENT_TYPES or event.get("bot_id"):
+            return None
+        message_id = event.get("client_msg_id") or body.get("event_id")
+        return f"{event['type']}:{message_id}" if message_id else None
+    if body.get("command") and body.get("trigger_id"):
+        return f"command:{body['trigger_id']}"
+    return None
+
+
+class MemoryDedupeStore:
+    """
+    In-process store: an insertion-ordered dict of key -> (state, expires_at), capped at max_entries.
+    """
+
+    def __init__(self, max_entries=10000, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def claim(self, key, ttl):
+        """
+        Marks key as in flight unless a live entry exists.
+
+        :return: None if the caller now owns the key, otherwise the existing state
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            self._entries[key] = (IN_FLIGHT, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return None
+
+    def state(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        return entry[0]
+
+    def mark_done(self, key, ttl):
+        with self._lock:
+            self._entries[key] = (DONE, self.clock() + ttl)
+            self._entries.move_to_end(key)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def size(self):
+        return len(self._entries)
+
+
+class SqliteDedupeStore:
+    """
+    SQLite-backed store so several bot processes on one host share the same view.
+
+    Each thread gets its own connection; claims run in an IMMEDIATE
+    transaction so two processes cannot both take the same key.
+    """
+
+    PURGE_EVERY = 500
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        self._claims = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS slack_deliveries ("
+                "key TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS slack_deliveries_expiry ON slack_deliveries (expires_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key, ttl):
+        now = self.clock()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state FROM slack_deliveries WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO slack_deliveries (key, state, expires_at) VALUES (?, ?, ?)",
+                    (key, IN_FLIGHT, now + ttl)
+                )
+            self._claims += 1
+            if self._claims % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM slack_deliveries WHERE expires_at <= ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0] if row else None
+
+    def state(self, key):
+        row = self._connect().execute(
+            "SELECT state FROM slack_deliveries WHERE key = ? AND expires_at > ?", (key, self.clock())
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark_done(self, key, ttl):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO slack_deliveries (key, state, expires_at) VALUES (?, ?, ?)",
+            (key, DONE, self.clock() + ttl)
+        )
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM slack_deliveries WHERE key = ?", (key,))
+
+    def size(self):
+        return self._connect().execute("SELECT COUNT(*) FROM slack_deliveries").fetchone()[0]
+
+
+class EventDeduplicator:
+    """
+    Idempotency layer for Slack deliveries.
+
+    The first delivery of a key claims it and runs; the handler marks it done
+    (remembered for window_seconds) or releases it on failure so a redelivery
+    can try again. A duplicate is dropped at once, whether the first delivery
+    is finished or still in flight, so the middleware never holds up the ack.
+    An in-flight claim that is never finished lapses after in_flight_seconds.
+    """
+
+    def __init__(self, store, window_seconds=600, in_flight_seconds=300):
+        self.store = store
+        self.window_seconds = window_seconds
+        self.in_flight_seconds = in_flight_seconds
+        self.claimed = 0
+        self.duplicates = 0
+        self.in_flight_duplicates = 0
+        self.released = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        backend = os.getenv('DEDUPE_BACKEND', 'memory').lower()
+        if backend == 'sqlite':
+            store = SqliteDedupeStore(os.getenv('DEDUPE_SQLITE_PATH', '/tmp/slackbot-dedupe.sqlite3'))
+        elif backend == 'memory':
+            store = MemoryDedupeStore(max_entries=int(os.getenv('DEDUPE_MAX_ENTRIES', '10000')))
+        else:
+            raise ValueError(f"Unknown DEDUPE_BACKEND '{backend}', expected 'memory' or 'sqlite'")
+        return cls(
+            store,
+            window_seconds=float(os.getenv('DEDUPE_WINDOW_SECONDS', '600')),
+            in_flight_seconds=float(os.getenv('DEDUPE_IN_FLIGHT_SECONDS', '300')),
+        )
+
+    def claim(self, key):
+        """
+        :param key: The delivery key from dedupe_key()
+        :return: True if the caller should process the delivery, False if it is a duplicate
+        """
+        try:
+            state = self.store.claim(key, self.in_flight_seconds)
+        except Exception as e:
+            # Failing open means a rare duplicate reply rather than a dropped question
+            self.errors += 1
+            logger.error("Event de-duplication store failed, processing %s: %s", key, e, exc_info=True)
+            return True
+        if state is None:
+            self.claimed += 1
+            return True
+        self.duplicates += 1
+        if state == IN_FLIGHT:
+            self.in_flight_duplicates += 1
+        return False
+
+    def complete(self, key):
+        if key is None:
+            return
+        try:
+            self.store.mark_done(key, self.window_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.error("Failed to record %s as handled: %s", key, e, exc_info=True)
+
+    def release(self, key):
+        if key is None:
+            return
+        self.released += 1
+        try:
+            self.store.delete(key)
+        except Exception as e:
+            self.errors += 1
+            logger.error("Failed to release %s: %s", key, e, exc_info=True)
+
+    def stats(self):
+        try:
+            size = self.store.size()
+        except Exception:
+            size = None
+        return {
+            "claimed": self.claimed,
+            "duplicates": self.duplicates,
+            "in_flight_duplicates": self.in_flight_duplicates,
+            "released": self.released,
+            "errors": self.errors,
+            "size": size,
+        }
@@ -0,0 +1,89 @@
+# health.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class HealthState:
+    """
+    Tracks liveness, readiness and startup timings for the bot process.
+
+    The process is live once the Slack connection is open and ready once every
+    required startup check has passed.
+    """
+
+    def __init__(self, required_checks=()):
+        self.required_checks = tuple(required_checks)
+        self._lock = threading.Lock()
+        self._live = False
+        self._checks = {}
+        self._timings = {}
+        self._started_at = time.monotonic()
+
+    def mark_live(self, live=True):
+        with self._lock:
+            self._live = live
+
+    def set_check(self, name, ok, detail=None):
+        with self._lock:
+            self._checks[name] = {"ok": bool(ok), "detail": detail}
+        if ok:
+            logger.info("Startup check '%s' passed", name)
+        else:
+            logger.error("Startup check '%s' failed: %s", name, detail)
+
+    def check_status(self, name):
+        """
+        Returns True or False once the named check has run, or None while it is pending.
+        """
+        with self._lock:
+            check = self._checks.get(name)
+        return check["ok"] if check else None
+
+    @contextmanager
+    def time_stage(self, name):
+        """
+        Records how long the wrapped block took under the given stage name.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._timings[name] = time.monotonic() - started
+
+    @property
+    def live(self):
+        return self._live
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self._live and all(
+                self._checks.get(name, {}).get("ok") for name in self.required_checks
+            )
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "live": self._live,
+                "ready": self._live and all(
+                    self._checks.get(name, {}).get("ok") for name in self.required_checks
+                ),
+                "checks": dict(self._checks),
+                "timings_seconds": dict(self._timings),
+                "uptime_seconds": time.monotonic() - self._started_at,
+            }
+
+    def log_timings(self):
+        with self._lock:
+            timings = dict(self._timings)
+        breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        logger.info("Startup timing breakdown: %s", breakdown)
+
+
+health_state = HealthState(required_checks=("aws_role", "slack_auth", "bedrock_kb"))
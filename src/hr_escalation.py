@@ -0,0 +1,443 @@
+# hr_escalation.py
+
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from normalize import normalize_question
+from qa_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+GROUP_REFERENCE = re.compile(r"^#(\d+)$")
+
+
+def similarity(terms_a, terms_b):
+    """
+    Jaccard similarity of two term sets.
+    """
+    if not terms_a or not terms_b:
+        return 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+class EscalationGroup:
+    __slots__ = ("group_id", "question", "terms", "variants", "askers", "created_at",
+                 "posted_at", "message_ts", "posted_count")
+
+    def __init__(self, group_id, question, terms, now):
+        self.group_id = group_id
+        self.question = question
+        self.terms = terms
+        self.variants = {normalize_question(question): question}
+        self.askers = {}
+        self.created_at = now
+        self.posted_at = None
+        self.message_ts = None
+        self.posted_count = 0
+
+    def to_dict(self):
+        return {
+            "group_id": self.group_id,
+            "question": self.question,
+            "terms": sorted(self.terms),
+            "variants": self.variants,
+            "askers": self.askers,
+            "created_at": self.created_at,
+            "posted_at": self.posted_at,
+            "message_ts": self.message_ts,
+            "posted_count": self.posted_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        group = cls(data["group_id"], data["question"], set(data["terms"]), data["created_at"])
+        group.variants = data["variants"]
+        group.askers = data["askers"]
+        group.posted_at = data["posted_at"]
+        group.message_ts = data["message_ts"]
+        group.posted_count = data["posted_count"]
+        return group
+
+
+class MemoryEscalationStore:
+    """
+    In-process store: open groups in an insertion-ordered dict of group ID -> EscalationGroup.
+    """
+
+    def __init__(self):
+        self._groups = {}
+        self._next_id = 1
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def groups(self):
+        """
+        Yields the open groups for reading and changing in place.
+        """
+        with self._lock:
+            yield self._groups
+
+    def allocate_id(self):
+        """
+        :return: A new group ID; only call inside groups()
+        """
+        group_id = self._next_id
+        self._next_id += 1
+        return group_id
+
+
+class SqliteEscalationStore:
+    """
+    SQLite-backed store so every bot worker on a host shares the same groups and group IDs.
+
+    groups() loads the open groups inside an IMMEDIATE transaction and writes
+    back the ones that changed, so an escalation, a digest and /add_answer on
+    different workers cannot interleave. Group IDs come from a counter in the
+    same file and are never reused.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS escalation_groups (group_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS escalation_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO escalation_meta (name, value) VALUES ('next_id', 1)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def groups(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = dict(conn.execute("SELECT group_id, data FROM escalation_groups ORDER BY group_id"))
+            groups = {group_id: EscalationGroup.from_dict(json.loads(data)) for group_id, data in rows.items()}
+            yield groups
+            for group_id in rows.keys() - groups.keys():
+                conn.execute("DELETE FROM escalation_groups WHERE group_id = ?", (group_id,))
+            for group_id, group in groups.items():
+                data = json.dumps(group.to_dict(), sort_keys=True)
+                if rows.get(group_id) != data:
+                    conn.execute("INSERT OR REPLACE INTO escalation_groups (group_id, data) VALUES (?, ?)", (group_id, data))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def allocate_id(self):
+        conn = self._connect()
+        group_id = conn.execute("SELECT value FROM escalation_meta WHERE name = 'next_id'").fetchone()[0]
+        conn.execute("UPDATE escalation_meta SET value = value + 1 WHERE name = 'next_id'")
+        return group_id
+
+
+class EscalationQueue:
+    """
+    Groups unanswered questions and posts one HR digest per group.
+
+    A question joins an open group when its normalized text matches one of the
+    group's questions or its term overlap clears similarity_threshold;
+    otherwise it starts a new group. The threshold is deliberately high: near
+    misses such as "do I get" and "do interns get" ask different things, and
+    everyone in a group receives the same answer. A group's digest is posted
+    once window_seconds after its first question, listing how many employees
+    asked and every distinct phrasing. Later askers are folded into the posted
+    digest with an edit on the next flush instead of a new message.
+    resolve() sends HR's answer to everyone in the group HR named by '#<id>'
+    and closes it.
+
+    Groups live in store, in process by default. Workers started with
+    --workers share a SqliteEscalationStore, so '#<id>' means the same group
+    on every worker; a digest is claimed in the store before it is posted so
+    only one worker posts it, and poll_seconds bounds how long a worker waits
+    before checking for digests other workers left due.
+    """
+
+    MAX_DIGEST_VARIANTS = 10
+
+    def __init__(self, post_fn, update_fn=None, hr_channel_id=None, window_seconds=60,
+                 similarity_threshold=0.85, max_groups=1000, group_ttl_seconds=7 * 24 * 3600, store=None,
+                 poll_seconds=None, clock=time.monotonic):
+        """
+        :param post_fn: Callable(channel, text) posting a message and returning its ts
+        :param update_fn: Optional callable(channel, ts, text) editing a posted message
+        :param store: Where open groups live, defaults to a MemoryEscalationStore
+        :param clock: Must be time.time (or agree across processes) when the store is shared
+        """
+        self.post_fn = post_fn
+        self.update_fn = update_fn
+        self.hr_channel_id = hr_channel_id
+        self.window_seconds = window_seconds
+        self.similarity_threshold = similarity_threshold
+        self.max_groups = max_groups
+        self.group_ttl_seconds = group_ttl_seconds
+        self.store = store or MemoryEscalationStore()
+        self.poll_seconds = poll_seconds
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.escalations = 0
+        self.grouped = 0
+        self.digests_posted = 0
+        self.digest_updates = 0
+        self.groups_answered = 0
+        self.askers_notified = 0
+        self.post_failures = 0
+
+    @classmethod
+    def from_env(cls, post_fn, update_fn=None):
+        backend = os.getenv('HR_ESCALATION_BACKEND', 'memory').lower()
+        if backend == 'sqlite':
+            store = SqliteEscalationStore(os.getenv('HR_ESCALATION_SQLITE_PATH', '/tmp/slackbot-escalations.sqlite3'))
+            poll_seconds, clock = float(os.getenv('HR_ESCALATION_POLL_SECONDS', '30')), time.time
+        elif backend == 'memory':
+            store, poll_seconds, clock = MemoryEscalationStore(), None, time.monotonic
+        else:
+            raise ValueError(f"Unknown HR_ESCALATION_BACKEND '{backend}', expected 'memory' or 'sqlite'")
+        return cls(
+            post_fn,
+            update_fn=update_fn,
+            hr_channel_id=os.getenv('HR_CHANNEL_ID'),
+            window_seconds=float(os.getenv('HR_ESCALATION_WINDOW_SECONDS', '60')),
+            similarity_threshold=float(os.getenv('HR_ESCALATION_SIMILARITY', '0.85')),
+            max_groups=int(os.getenv('HR_ESCALATION_MAX_GROUPS', '1000')),
+            group_ttl_seconds=float(os.getenv('HR_ESCALATION_GROUP_TTL_SECONDS', str(7 * 24 * 3600))),
+            store=store,
+            poll_seconds=poll_seconds,
+            clock=clock,
+        )
+
+    def _find_group(self, groups, key, terms):
+        best, best_score = None, self.similarity_threshold
+        for group in groups.values():
+            if key in group.variants:
+                return group
+            score = similarity(terms, group.terms)
+            if score >= best_score:
+                best, best_score = group, score
+        return best
+
+    def escalate(self, question, user, channel):
+        """
+        Adds an unanswered question to its group, creating the group if needed.
+
+        :param question: The question as asked, without the bot mention
+        :param user: The asking user's ID
+        :param channel: Where to send the answer once HR provides it
+        :return: The number of employees waiting on the group, including this one
+        """
+        key = normalize_question(question)
+        terms = set(tokenize(question))
+        now = self.clock()
+        with self._cond:
+            self.escalations += 1
+            with self.store.groups() as groups:
+                group = self._find_group(groups, key, terms)
+                if group is None:
+                    group = EscalationGroup(self.store.allocate_id(), question, terms, now)
+                    groups[group.group_id] = group
+                    self._evict(groups)
+                else:
+                    self.grouped += 1
+                    group.variants.setdefault(key, question)
+                group.askers[user] = channel
+                waiting = len(group.askers)
+            self._ensure_thread()
+            self._cond.notify_all()
+            return waiting
+
+    def _evict(self, groups):
+        # Oldest groups go first; dicts keep insertion order
+        while len(groups) > self.max_groups:
+            group_id = next(iter(groups))
+            del groups[group_id]
+            logger.warning("Dropped HR escalation #%s to stay under %s open groups", group_id, self.max_groups)
+
+    def find(self, question):
+        """
+        :param question: Either '#<group id>' or question text
+        :return: The open group with that ID, or whose questions include the normalized text; otherwise None
+        """
+        reference = GROUP_REFERENCE.match(question.strip())
+        key = normalize_question(question)
+        with self._cond, self.store.groups() as groups:
+            if reference:
+                return groups.get(int(reference.group(1)))
+            return next((group for group in groups.values() if key in group.variants), None)
+
+    def resolve(self, reference, answer):
+        """
+        Sends HR's answer to everyone waiting on a group and closes it.
+
+        Only an explicit '#<group id>' resolves a group: matching free text
+        could send the answer to employees who asked something else.
+
+        :param reference: '#<group id>' as given to /add_answer
+        :param answer: HR's answer
+        :return: The number of employees notified
+        """
+        match = GROUP_REFERENCE.match(reference.strip())
+        if not match:
+            return 0
+        with self._cond, self.store.groups() as groups:
+            group = groups.pop(int(match.group(1)), None)
+            if group is None:
+                return 0
+            self.groups_answered += 1
+
+        notified = 0
+        for user, channel in group.askers.items():
+            try:
+                self.post_fn(channel, f"<@{user}> HR answered your question \"{group.question}\":\n\n{answer}")
+                notified += 1
+            except Exception as e:
+                self.post_failures += 1
+                logger.error("Failed to send HR answer to %s: %s", user, e, exc_info=True)
+        self.askers_notified += notified
+        logger.info("HR answered escalation #%s, notified %s employee(s)", group.group_id, notified)
+        return notified
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hr-escalation", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops the background thread, then posts every pending digest, including
+        groups still inside their window, so escalations are not lost on shutdown.
+
+        :param timeout: Seconds to wait for a flush already in progress
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush(pending=True)
+
+    def _due(self, groups, now, pending=False):
+        due, next_due = [], None
+        for group_id, group in list(groups.items()):
+            if now - group.created_at >= self.group_ttl_seconds:
+                del groups[group_id]
+                continue
+            if group.posted_at is None:
+                due_at = group.created_at + self.window_seconds
+            elif len(group.askers) != group.posted_count:
+                due_at = group.posted_at + self.window_seconds
+            else:
+                continue
+            if pending or due_at <= now:
+                due.append(group)
+            elif next_due is None or due_at < next_due:
+                next_due = due_at
+        return due, next_due
+
+    def flush(self, pending=False):
+        """
+        Posts or updates every digest whose window has closed.
+
+        :param pending: Also post digests whose window is still open
+        :return: Seconds until the next digest is due, or None if nothing is pending
+        """
+        now = self.clock()
+        claims = []
+        with self._cond, self.store.groups() as groups:
+            due, next_due = self._due(groups, now, pending)
+            for group in due:
+                claims.append((group.group_id, group.message_ts, group.posted_at, group.posted_count, self.digest_text(group)))
+                # Claim the digest so a worker sharing the store does not post it as well
+                group.posted_at = now
+                group.posted_count = len(group.askers)
+        for group_id, message_ts, posted_at, posted_count, text in claims:
+            try:
+                if message_ts is not None and self.update_fn is not None:
+                    self.update_fn(self.hr_channel_id, message_ts, text)
+                    self.digest_updates += 1
+                    continue
+                message_ts = self.post_fn(self.hr_channel_id, text)
+                self.digests_posted += 1
+            except Exception as e:
+                self.post_failures += 1
+                logger.error("Failed to post HR digest #%s: %s", group_id, e, exc_info=True)
+                with self._cond, self.store.groups() as groups:
+                    group = groups.get(group_id)
+                    if group is not None:
+                        # Try again after another window rather than spinning on a failing channel
+                        group.posted_count = posted_count
+                        if posted_at is None:
+                            group.posted_at = None
+                            group.created_at = self.clock()
+                        else:
+                            group.posted_at = self.clock()
+                continue
+            with self._cond, self.store.groups() as groups:
+                group = groups.get(group_id)
+                if group is not None:
+                    group.message_ts = message_ts
+        return next_due - self.clock() if next_due is not None else None
+
+    def _run(self):
+        while True:
+            wait = self.flush()
+            if self.poll_seconds is not None:
+                wait = self.poll_seconds if wait is None else min(wait, self.poll_seconds)
+            with self._cond:
+                if self._stopped:
+                    return
+                self._cond.wait(wait if wait is None else max(wait, 0.05))
+                if self._stopped:
+                    return
+
+    def digest_text(self, group):
+        askers = len(group.askers)
+        lines = [
+            f"A new employee question could not be answered by the KB "
+            f"(#{group.group_id}, asked by {askers} employee{'s' if askers != 1 else ''}):",
+            "",
+            f"*Question:* {group.question}",
+        ]
+        others = [q for q in group.variants.values() if q != group.question]
+        if others:
+            lines.append("*Also asked as:*")
+            lines.extend(f"• {q}" for q in others[:self.MAX_DIGEST_VARIANTS])
+            if len(others) > self.MAX_DIGEST_VARIANTS:
+                lines.append(f"• ...and {len(others) - self.MAX_DIGEST_VARIANTS} more")
+        lines.extend([
+            "",
+            f"Please provide an answer with `/add_answer #{group.group_id} | answer` to update the KB "
+            f"and reply to everyone who asked.",
+        ])
+        return "\n".join(lines)
+
+    def stats(self):
+        with self._cond, self.store.groups() as groups:
+            open_groups = len(groups)
+            waiting = sum(len(g.askers) for g in groups.values())
+            pending = sum(1 for g in groups.values() if g.posted_at is None)
+        return {
+            "open_groups": open_groups,
+            "pending_digests": pending,
+            "askers_waiting": waiting,
+            "escalations": self.escalations,
+            "grouped": self.grouped,
+            "digests_posted": self.digests_posted,
+            "digest_updates": self.digest_updates,
+            "groups_answered": self.groups_answered,
+            "askers_notified": self.askers_notified,
+            "post_failures": self.post_failures,
+        }
@@ -0,0 +1,320 @@
+# ingestion_scheduler.py
+
+import os
+import uuid
+import sqlite3
+import logging
+import threading
+import time
+import kb_events
+from bedrock_kb_handler import start_ingestion_job, get_ingestion_job_status
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("COMPLETE", "FAILED", "STOPPED")
+
+
+class SqliteIngestionLease:
+    """
+    Lets one bot worker on a host run an ingestion job at a time.
+
+    Bedrock allows a single running job per data source, so without the
+    lease every worker's scheduler would start its own and retry through
+    ConflictExceptions. The holder renews the lease while it polls; a lease
+    not renewed for ttl_seconds (e.g. its worker died) can be taken over.
+    """
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingestion_lease (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                "holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, holder, ttl_seconds):
+        """
+        Takes or renews the lease.
+
+        :return: True if holder now holds the lease
+        """
+        now = self.clock()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT holder, expires_at FROM ingestion_lease WHERE id = 1").fetchone()
+            if row is not None and row[0] != holder and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO ingestion_lease (id, holder, expires_at) VALUES (1, ?, ?)",
+                (holder, now + ttl_seconds)
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def release(self, holder):
+        self._connect().execute("DELETE FROM ingestion_lease WHERE id = 1 AND holder = ?", (holder,))
+
+
+class IngestionScheduler:
+    """
+    Debounces knowledge base syncs into batched ingestion jobs.
+
+    Every request_sync() call adds a pending change. The first pending change
+    opens a batching window; when it closes, a single ingestion job covers all
+    changes collected so far. Only one job runs at a time. Changes that arrive
+    while a job is running are batched into the next one. The job is polled
+    with get_ingestion_job until it finishes, then the batch's callbacks and
+    the notifier are told whether it went live. A job still running after
+    max_wait_seconds, or whose status could not be read max_poll_failures
+    times in a row, counts as failed. stop() ends any wait at once.
+
+    With a lease (see SqliteIngestionLease) the schedulers of every worker
+    on the host take turns: a batch waits up to max_wait_seconds for the
+    lease, and changes that arrive meanwhile join it, since the job it
+    starts covers everything written before.
+    """
+
+    def __init__(self, session, window_seconds=30, poll_interval_seconds=10, notifier=None,
+                 max_wait_seconds=3600, max_poll_failures=5, lease=None):
+        self.session = session
+        self.window_seconds = window_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.notifier = notifier
+        self.max_wait_seconds = max_wait_seconds
+        self.max_poll_failures = max_poll_failures
+        self.lease = lease
+        self._holder = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._cond = threading.Condition()
+        self._pending = []
+        self._first_pending_at = None
+        self._running_job_id = None
+        self._stopped = False
+        self._thread = None
+        self.jobs_started = 0
+        self.jobs_failed = 0
+        self.last_ingestion_lag = None
+
+    @classmethod
+    def from_env(cls, session, notifier=None):
+        """
+        INGESTION_LEASE_PATH, when set, shares a SqliteIngestionLease between the workers using the file.
+        """
+        lease_path = os.getenv('INGESTION_LEASE_PATH')
+        return cls(
+            session,
+            window_seconds=float(os.getenv('INGESTION_WINDOW_SECONDS', '30')),
+            poll_interval_seconds=float(os.getenv('INGESTION_POLL_SECONDS', '10')),
+            notifier=notifier,
+            max_wait_seconds=float(os.getenv('INGESTION_MAX_WAIT_SECONDS', '3600')),
+            max_poll_failures=int(os.getenv('INGESTION_MAX_POLL_FAILURES', '5')),
+            lease=SqliteIngestionLease(lease_path) if lease_path else None,
+        )
+
+    def request_sync(self, on_complete=None):
+        """
+        Records a knowledge base change to be picked up by the next ingestion job.
+
+        :param on_complete: Optional callable receiving True once the change is live, False if the job failed
+        """
+        with self._cond:
+            self._pending.append((time.monotonic(), on_complete))
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ingestion-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _sleep(self, seconds):
+        """
+        :return: False if stop() was called before or during the wait
+        """
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            while not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                self._cond.wait(remaining)
+            return False
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._stopped:
+                if self._first_pending_at is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._first_pending_at + self.window_seconds - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                batch = self._pending
+                self._pending = []
+                self._first_pending_at = None
+                return batch
+            return None
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            succeeded = self._ingest(batch)
+            if succeeded is None:
+                logger.info("Ingestion scheduler stopped with %s change(s) not confirmed live", len(batch))
+                return
+            oldest = min(changed_at for changed_at, _ in batch)
+            self.last_ingestion_lag = time.monotonic() - oldest
+            if succeeded:
+                kb_events.publish("ingestion_complete")
+            for _, callback in batch:
+                if callback:
+                    try:
+                        callback(succeeded)
+                    except Exception as e:
+                        logger.error("Ingestion completion callback failed: %s", e, exc_info=True)
+            self._notify(batch, succeeded)
+
+    def _lease_ttl(self):
+        return max(60.0, 3 * self.poll_interval_seconds)
+
+    def _wait_for_lease(self, batch):
+        """
+        :return: True once the lease is held, False after max_wait_seconds, None if stop() interrupted it
+        """
+        deadline = time.monotonic() + self.max_wait_seconds
+        while not self.lease.acquire(self._holder, self._lease_ttl()):
+            if time.monotonic() >= deadline:
+                logger.error("Another worker held the ingestion lease for %ss", self.max_wait_seconds)
+                return False
+            if not self._sleep(self.poll_interval_seconds):
+                return None
+        # The job about to start covers every change written so far
+        with self._cond:
+            batch.extend(self._pending)
+            self._pending = []
+            self._first_pending_at = None
+        return True
+
+    def _ingest(self, batch):
+        """
+        :return: True if the job completed, False if it failed, None if stop() interrupted it
+        """
+        if self.lease is None:
+            return self._run_job(batch)
+        try:
+            leased = self._wait_for_lease(batch)
+        except sqlite3.Error as e:
+            # Better a possible ConflictException retry than no sync at all
+            logger.error("Ingestion lease unavailable, starting the job anyway: %s", e)
+            leased = True
+        if not leased:
+            if leased is False:
+                self.jobs_failed += 1
+            return leased
+        try:
+            return self._run_job(batch)
+        finally:
+            try:
+                self.lease.release(self._holder)
+            except sqlite3.Error as e:
+                logger.error("Failed to release the ingestion lease: %s", e)
+
+    def _run_job(self, batch):
+        job_id = None
+        delay = self.poll_interval_seconds
+        for _ in range(5):
+            job_id = start_ingestion_job(self.session)
+            if job_id is not None:
+                break
+            # Most often another ingestion job is still running for this data source
+            if not self._sleep(delay):
+                return None
+            delay *= 2
+        if job_id is None:
+            self.jobs_failed += 1
+            return False
+
+        self.jobs_started += 1
+        with self._cond:
+            self._running_job_id = job_id
+        logger.info("Ingestion job %s started for %s pending change(s)", job_id, len(batch))
+        deadline = time.monotonic() + self.max_wait_seconds
+        poll_failures = 0
+        try:
+            while time.monotonic() < deadline:
+                if not self._sleep(self.poll_interval_seconds):
+                    return None
+                if self.lease is not None:
+                    try:
+                        self.lease.acquire(self._holder, self._lease_ttl())
+                    except sqlite3.Error as e:
+                        logger.warning("Failed to renew the ingestion lease: %s", e)
+                try:
+                    status = get_ingestion_job_status(self.session, job_id)
+                except Exception as e:
+                    poll_failures += 1
+                    logger.warning("Failed to poll ingestion job %s (%s/%s): %s", job_id, poll_failures, self.max_poll_failures, e)
+                    if poll_failures >= self.max_poll_failures:
+                        break
+                    continue
+                poll_failures = 0
+                if status in TERMINAL_STATUSES:
+                    logger.info("Ingestion job %s finished with status %s", job_id, status)
+                    if status != "COMPLETE":
+                        self.jobs_failed += 1
+                    return status == "COMPLETE"
+            else:
+                logger.error("Ingestion job %s still running after %ss, giving up on it", job_id, self.max_wait_seconds)
+            self.jobs_failed += 1
+            return False
+        finally:
+            with self._cond:
+                self._running_job_id = None
+
+    def _notify(self, batch, succeeded):
+        if not self.notifier:
+            return
+        if succeeded:
+            message = f"The knowledge base is now live with {len(batch)} new answer(s)."
+        else:
+            message = f"Syncing {len(batch)} new answer(s) into the knowledge base failed. Please check the logs."
+        try:
+            self.notifier(message)
+        except Exception as e:
+            logger.error("Failed to report ingestion result: %s", e, exc_info=True)
+
+    def stats(self):
+        with self._cond:
+            oldest_pending = min((changed_at for changed_at, _ in self._pending), default=None)
+            return {
+                "pending_changes": len(self._pending),
+                "job_running": self._running_job_id is not None,
+                "jobs_started": self.jobs_started,
+                "jobs_failed": self.jobs_failed,
+                "pending_lag_seconds": time.monotonic() - oldest_pending if oldest_pending else 0.0,
+                "last_ingestion_lag_seconds": self.last_ingestion_lag,
+            }
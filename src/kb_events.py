@@ -0,0 +1,42 @@
+# kb_events.py
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_listeners = []
+_lock = threading.Lock()
+
+
+def subscribe(callback):
+    """
+    Registers a callback to run whenever the knowledge base content changes.
+
+    :param callback: A callable taking the change reason as its only argument
+    """
+    with _lock:
+        _listeners.append(callback)
+
+
+def unsubscribe(callback):
+    with _lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+
+def publish(reason):
+    """
+    Notifies every subscriber that the knowledge base content changed.
+
+    A failing subscriber is logged and does not stop the others.
+
+    :param reason: Short description of the change, e.g. 'answer_saved'
+    """
+    with _lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(reason)
+        except Exception as e:
+            logger.error("KB change listener failed for '%s': %s", reason, e, exc_info=True)
@@ -0,0 +1,249 @@
+# log_setup.py
+
+import os
+import re
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import uuid
+import contextvars
+import structlog
+
+logger = logging.getLogger(__name__)
+
+# Correlation ID of the Slack request being handled; copied into worker threads by dispatcher and async_aws
+request_id = contextvars.ContextVar("request_id", default=None)
+
+SECRET_PATTERNS = [
+    (re.compile(r"\b(xox[abposr]|xapp)-[A-Za-z0-9-]+"), r"\1-[REDACTED]"),
+    (re.compile(r"\b(AKIA|ASIA)[A-Z0-9]{16}\b"), r"\1[REDACTED]"),
+    (re.compile(
+        r"(?i)\b(aws_secret_access_key|secret_?access_?key|session_?token|aws_session_token|password)"
+        r"(['\"]?\s*[:=]\s*['\"]?)[^\s'\",}]+"
+    ), r"\1\2[REDACTED]"),
+]
+
+
+def redact(text):
+    """
+    Masks Slack tokens, AWS access keys and credential values in text.
+    """
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def request_id_from_body(body):
+    """
+    Derives a correlation ID from a Bolt request body so redeliveries of the same
+    message share one ID: client_msg_id or event_id for events, trigger_id for commands.
+    """
+    event = body.get("event") or {}
+    return event.get("client_msg_id") or body.get("event_id") or body.get("trigger_id") or new_request_id()
+
+
+def bind_request_id(value=None):
+    """
+    Sets the correlation ID for the current thread or task.
+
+    :param value: The ID to bind, a new random one if None
+    :return: The bound ID
+    """
+    value = value or new_request_id()
+    request_id.set(value)
+    return value
+
+
+def get_request_id():
+    return request_id.get()
+
+
+class LazyJson:
+    """
+    Defers json.dumps until the record is actually formatted by the log writer thread.
+    """
+
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value, indent=None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self):
+        return json.dumps(self.value, indent=self.indent, default=str)
+
+
+PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.01'))
+
+
+def log_payload(log, msg, *args, sample_rate=None):
+    """
+    Logs a verbose payload (raw model responses, full questions and answers).
+
+    Payloads are always logged at DEBUG; otherwise only a sample_rate fraction
+    of them is logged at INFO so production logs keep a representative trace
+    without paying for every one. Arguments are formatted lazily.
+
+    :param log: The stdlib logger to write to
+    :param sample_rate: Fraction of payloads kept at INFO, defaults to LOG_PAYLOAD_SAMPLE_RATE
+    :return: True if the payload was logged
+    """
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(msg, *args)
+        return True
+    rate = PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate > 0 and random.random() < rate and log.isEnabledFor(logging.INFO):
+        log.info(msg, *args, extra={"sampled": True})
+        return True
+    return False
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamps each record with the caller's correlation ID before it crosses to the writer thread.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id.get()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the listener thread.
+
+    The stock handler formats every record on the calling thread before
+    queueing it; here the record is queued as is. When the queue is full the
+    record is dropped and counted instead of blocking a request.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _add_request_id(logger_, method_name, event_dict):
+    record = event_dict.get("_record")
+    value = getattr(record, "request_id", None) if record is not None else request_id.get()
+    if value:
+        event_dict["request_id"] = value
+    if record is not None and getattr(record, "sampled", False):
+        event_dict["sampled"] = True
+    return event_dict
+
+
+def _redact_event(logger_, method_name, event_dict):
+    for key, value in event_dict.items():
+        if isinstance(value, str):
+            event_dict[key] = redact(value)
+    return event_dict
+
+
+_listener = None
+_handler = None
+
+
+def configure_logging(level=None, fmt=None, stream=None, queue_size=None):
+    """
+    Routes all stdlib and structlog logging through a bounded queue to a single writer thread.
+
+    Records are formatted, redacted and written by the writer, so request
+    threads only pay for building the record. Settings come from LOG_LEVEL,
+    LOG_FORMAT ('console' or 'json') and LOG_QUEUE_SIZE unless given.
+
+    :return: The queue handler attached to the root logger
+    """
+    global _listener, _handler
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'console')).lower()
+    queue_size = queue_size or int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+    shutdown_logging()
+
+    shared = [
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.add_logger_name,
+        _add_request_id,
+        structlog.processors.TimeStamper(fmt="iso"),
+    ]
+    if fmt == "json":
+        renderer = structlog.processors.JSONRenderer()
+    else:
+        renderer = structlog.dev.ConsoleRenderer(colors=False)
+    # Tracebacks are rendered to text before redaction so secrets in exception messages are masked too
+    formatter = structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=shared,
+        processors=[
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            _redact_event,
+            renderer,
+        ],
+    )
+
+    output = logging.StreamHandler(stream)
+    output.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    _handler = DeferredQueueHandler(log_queue)
+    _handler.addFilter(RequestIdFilter())
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    structlog.configure(
+        processors=[
+            structlog.contextvars.merge_contextvars,
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+    return _handler
+
+
+def shutdown_logging():
+    """
+    Flushes queued records and stops the writer thread.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _handler is not None:
+        logging.getLogger().removeHandler(_handler)
+        _handler = None
+
+
+def stats():
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+atexit.register(shutdown_logging)
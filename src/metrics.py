@@ -0,0 +1,254 @@
+# metrics.py
+
+import os
+import json
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus exposition format.
+
+    observe() is a bisect and three additions under a lock, cheap enough to
+    leave on for every request.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, *labelvalues):
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                return None
+            return {"count": series[2], "sum": series[1], "buckets": list(series[0])}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for labelvalues, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, ('le', le))} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them as Prometheus text.
+
+    Besides counters and histograms, components expose their own stats()
+    dictionaries through register_collector(); numeric values become gauges
+    named slackbot_<component>_<key>.
+    """
+
+    def __init__(self, prefix="slackbot"):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = {}
+        self._lock = threading.Lock()
+        self.stage_duration = self.histogram(
+            "stage_duration_seconds", "Time spent in each request stage", labelnames=("stage",)
+        )
+        self.stage_errors = self.counter(
+            "stage_errors_total", "Exceptions raised inside each request stage", labelnames=("stage",)
+        )
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(f"{self.prefix}_{name}", documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, component, stats_fn):
+        """
+        :param component: Name used in the gauge names, e.g. 'answer_cache'
+        :param stats_fn: Callable returning a flat dict of numbers (or None)
+        """
+        with self._lock:
+            self._collectors[component] = stats_fn
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = dict(self._collectors)
+        for metric in metrics:
+            lines.extend(metric.render())
+        for component, stats_fn in sorted(collectors.items()):
+            try:
+                stats = stats_fn() or {}
+            except Exception as e:
+                logger.warning("Metrics collector '%s' failed: %s", component, e)
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"{self.prefix}_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class Timer:
+    """
+    Context manager recording the duration of its block in the stage duration histogram.
+
+    A plain class rather than @contextmanager to keep per-use overhead low.
+    """
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.stage_duration.observe(time.perf_counter() - self.started, self.stage)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            registry.stage_errors.inc(self.stage)
+        return False
+
+
+def timer(stage):
+    return Timer(stage)
+
+
+def timed(stage):
+    """
+    Decorator form of timer().
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(stage, seconds):
+    registry.stage_duration.observe(seconds, stage)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    health_fn = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send(200, registry.render(), "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path in ("/healthz", "/readyz") and self.health_fn is not None:
+            health = self.health_fn()
+            ok = health["live"] if self.path == "/healthz" else health["ready"]
+            self._send(200 if ok else 503, json.dumps(health), "application/json")
+        else:
+            self._send(404, "not found\n", "text/plain")
+
+    def _send(self, status, body, content_type):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood the application log
+        pass
+
+
+def start_metrics_server(port=None, host=None, health_fn=None):
+    """
+    Serves /metrics (and /healthz, /readyz when health_fn is given) on a daemon thread.
+
+    :param port: TCP port, defaults to METRICS_PORT; 0 disables the server
+    :param health_fn: Callable returning a dict with 'live' and 'ready' booleans
+    :return: The running server, or None if disabled
+    """
+    port = int(os.getenv('METRICS_PORT', '9100')) if port is None else port
+    host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+    if port == 0:
+        return None
+    handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"health_fn": staticmethod(health_fn) if health_fn else None})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,230 @@
+# model_router.py
+
+import os
+import re
+import json
+import logging
+import threading
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# USD per 1,000 tokens, on-demand us-east-1 pricing; override with MODEL_ROUTES.
+# max_tokens is each route's ceiling. The large route's 4096 is Claude 3.5 Sonnet
+# (20240620)'s output limit on Bedrock, so it replaces the 10000 query_claude used
+# to send; answers that reach it end with bedrock_handler.TRUNCATED_NOTICE.
+DEFAULT_ROUTES = {
+    "fast": {
+        "model_id": "anthropic.claude-3-haiku-20240307-v1:0",
+        "max_tokens": 1024,
+        "input_cost_per_1k": 0.00025,
+        "output_cost_per_1k": 0.00125,
+    },
+    "large": {
+        "model_id": "anthropic.claude-3-5-sonnet-20240620-v1:0",
+        "max_tokens": 4096,
+        "input_cost_per_1k": 0.003,
+        "output_cost_per_1k": 0.015,
+    },
+}
+
+# Requests that need reasoning or long output go straight to the escalation route
+COMPLEX_PATTERN = re.compile(
+    r"\b(explain|compare|analy[sz]e|step[- ]by[- ]step|write|draft|rewrite|summari[sz]e|review|plan|code|debug)\b"
+    r"|```",
+    re.IGNORECASE
+)
+# Requests for long output get the route's whole max_tokens instead of a size based on the prompt
+LONG_FORM_PATTERN = re.compile(r"\b(detailed|in detail|essay|draft|write|document|report|letter|email|list all)\b", re.IGNORECASE)
+# The model hedging about its own answer suggests the larger model should have a go;
+# words like "unclear" also describe the subject ("the policy is unclear"), so only first-person phrases count
+LOW_CONFIDENCE_PATTERN = re.compile(
+    r"\b(i'?m not sure|i am not sure|i'?m not certain|i am not certain|i don'?t know|i do not know"
+    r"|i can(?:no|')t determine|i'?m unable to|i am unable to)\b",
+    re.IGNORECASE
+)
+EXPLICIT_ROUTE_PATTERN = re.compile(r"^\s*--(\w+)\s+")
+
+route_requests = registry.counter(
+    "claude_requests_total", "Claude requests by route and routing reason", labelnames=("route", "reason")
+)
+route_tokens = registry.counter(
+    "claude_tokens_total", "Claude tokens by route and direction", labelnames=("route", "direction")
+)
+route_cost = registry.counter(
+    "claude_cost_usd_total", "Estimated Claude spend in USD by route", labelnames=("route",)
+)
+route_latency = registry.histogram(
+    "claude_route_duration_seconds", "Claude invocation latency by route", labelnames=("route",)
+)
+
+
+class ModelRoute:
+    __slots__ = ("name", "model_id", "max_tokens", "input_cost_per_1k", "output_cost_per_1k")
+
+    def __init__(self, name, model_id, max_tokens, input_cost_per_1k=0.0, output_cost_per_1k=0.0):
+        self.name = name
+        self.model_id = model_id
+        self.max_tokens = int(max_tokens)
+        self.input_cost_per_1k = float(input_cost_per_1k)
+        self.output_cost_per_1k = float(output_cost_per_1k)
+
+    def cost(self, input_tokens, output_tokens):
+        return input_tokens / 1000 * self.input_cost_per_1k + output_tokens / 1000 * self.output_cost_per_1k
+
+
+class RouteDecision:
+    __slots__ = ("route", "max_tokens", "reason", "messages", "can_escalate")
+
+    def __init__(self, route, max_tokens, reason, messages, can_escalate):
+        self.route = route
+        self.max_tokens = max_tokens
+        self.reason = reason
+        self.messages = messages
+        self.can_escalate = can_escalate
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+class ModelRouter:
+    """
+    Picks a Claude model for each request from a routing table.
+
+    Short, simple prompts go to default_route. Long prompts, prompts that ask
+    for reasoning or code, and explicit '--<route>' requests go to the named
+    or escalation route. A default-route answer that is truncated or hedges is
+    retried once on escalation_route with that route's full max_tokens.
+
+    max_tokens is sized to the request within the route's ceiling: about
+    output_ratio times the prompt's tokens, at least min_output_tokens, and
+    the whole ceiling for long-form or complex requests. Bedrock reserves
+    max_tokens against the tokens-per-minute quota when a request starts, so
+    a ceiling-sized reservation for a one-line question throttles everyone
+    else sooner. Latency, token usage and estimated cost are recorded per route.
+    """
+
+    def __init__(self, routes, default_route="fast", escalation_route="large", short_prompt_chars=400,
+                 min_output_tokens=512, output_ratio=8):
+        self.routes = routes
+        self.default_route = default_route
+        self.escalation_route = escalation_route
+        self.short_prompt_chars = short_prompt_chars
+        self.min_output_tokens = min_output_tokens
+        self.output_ratio = output_ratio
+        self._lock = threading.Lock()
+        self._stats = {name: {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+                       for name in routes}
+        self.escalations = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        Reads the routing table from MODEL_ROUTES (JSON, same shape as DEFAULT_ROUTES) or MODEL_ROUTES_FILE.
+        """
+        table = DEFAULT_ROUTES
+        raw = os.getenv('MODEL_ROUTES')
+        path = os.getenv('MODEL_ROUTES_FILE')
+        try:
+            if raw:
+                table = json.loads(raw)
+            elif path:
+                with open(path) as f:
+                    table = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Invalid model routing table, using defaults: %s", e)
+            table = DEFAULT_ROUTES
+        routes = {name: ModelRoute(name, **config) for name, config in table.items()}
+        default_route = os.getenv('MODEL_ROUTE_DEFAULT', 'fast')
+        escalation_route = os.getenv('MODEL_ROUTE_ESCALATION', 'large')
+        for name in (default_route, escalation_route):
+            if name not in routes:
+                raise ValueError(f"Model route '{name}' is not in the routing table")
+        return cls(
+            routes,
+            default_route=default_route,
+            escalation_route=escalation_route,
+            short_prompt_chars=int(os.getenv('MODEL_ROUTE_SHORT_PROMPT_CHARS', '400')),
+            min_output_tokens=int(os.getenv('MODEL_ROUTE_MIN_OUTPUT_TOKENS', '512')),
+            output_ratio=int(os.getenv('MODEL_ROUTE_OUTPUT_RATIO', '8')),
+        )
+
+    def route(self, messages):
+        """
+        :param messages: Parsed list of chat messages; the last user message decides the route
+        :return: A RouteDecision with the explicit route flag stripped from the messages
+        """
+        messages = [dict(m) for m in messages]
+        last_user = next((m for m in reversed(messages) if m.get("role") == "user"), None)
+        prompt = last_user["content"] if last_user else ""
+
+        explicit = EXPLICIT_ROUTE_PATTERN.match(prompt)
+        if explicit and explicit.group(1) in self.routes:
+            prompt = prompt[explicit.end():]
+            last_user["content"] = prompt
+            name, reason = explicit.group(1), "explicit"
+        elif len(prompt) > self.short_prompt_chars:
+            name, reason = self.escalation_route, "long_prompt"
+        elif COMPLEX_PATTERN.search(prompt):
+            name, reason = self.escalation_route, "complex_prompt"
+        else:
+            name, reason = self.default_route, "simple_prompt"
+
+        route = self.routes[name]
+        can_escalate = name == self.default_route and name != self.escalation_route
+        return RouteDecision(route, self.size_max_tokens(route, prompt, reason), reason, messages, can_escalate)
+
+    def size_max_tokens(self, route, prompt, reason):
+        """
+        :return: max_tokens for the prompt, never above the route's ceiling
+        """
+        if reason == "complex_prompt" or LONG_FORM_PATTERN.search(prompt):
+            return route.max_tokens
+        return min(route.max_tokens, max(self.min_output_tokens, estimate_tokens(prompt) * self.output_ratio))
+
+    def escalate(self, decision):
+        route = self.routes[self.escalation_route]
+        self.escalations += 1
+        return RouteDecision(route, route.max_tokens, "low_confidence", decision.messages, False)
+
+    def needs_escalation(self, decision, text, stop_reason):
+        if not decision.can_escalate:
+            return False
+        return not text.strip() or stop_reason == "max_tokens" or bool(LOW_CONFIDENCE_PATTERN.search(text))
+
+    def record(self, decision, seconds, usage):
+        """
+        Records one invocation.
+
+        :param usage: The response 'usage' block with input_tokens and output_tokens
+        """
+        route = decision.route
+        input_tokens = int((usage or {}).get("input_tokens", 0))
+        output_tokens = int((usage or {}).get("output_tokens", 0))
+        cost = route.cost(input_tokens, output_tokens)
+        route_requests.inc(route.name, decision.reason)
+        route_tokens.inc(route.name, "input", amount=input_tokens)
+        route_tokens.inc(route.name, "output", amount=output_tokens)
+        route_cost.inc(route.name, amount=cost)
+        route_latency.observe(seconds, route.name)
+        with self._lock:
+            stats = self._stats.setdefault(route.name, {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+            stats["requests"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["cost_usd"] += cost
+        logger.info("Claude route=%s reason=%s max_tokens=%d latency=%.0fms tokens=%d/%d cost=$%.5f",
+                    route.name, decision.reason, decision.max_tokens, seconds * 1000, input_tokens, output_tokens, cost)
+
+    def stats(self):
+        with self._lock:
+            flat = {"escalations": self.escalations}
+            for name, stats in self._stats.items():
+                for key, value in stats.items():
+                    flat[f"{name}_{key}"] = value
+        return flat
+
+
+model_router = ModelRouter.from_env()
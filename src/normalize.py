@@ -0,0 +1,26 @@
+# normalize.py
+
+import re
+
+_MENTION_RE = re.compile(r"<@[A-Z0-9]+(\|[^>]*)?>")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(text, bot_user_id=None):
+    """
+    Normalizes a question so trivially different phrasings share one key.
+
+    Bot and user mentions, case, punctuation and repeated whitespace are removed.
+
+    :param text: The raw question text from Slack
+    :param bot_user_id: The bot's user ID, stripped even if the generic pattern misses it
+    :return: The normalized question
+    """
+    if not text:
+        return ""
+    if bot_user_id:
+        text = text.replace(f"<@{bot_user_id}>", " ")
+    text = _MENTION_RE.sub(" ", text)
+    text = _PUNCTUATION_RE.sub(" ", text.lower())
+    return _WHITESPACE_RE.sub(" ", text).strip()
@@ -0,0 +1,212 @@
+# qa_index.py
+
+import os
+import math
+import heapq
+import logging
+import threading
+from collections import Counter
+from normalize import normalize_question
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "a an and are as at be can do does for from have how i in is it me my of on or "
+    "our should the to was we what when where which who why will with you your".split()
+)
+
+
+def _stem(word):
+    # Just enough stemming to match "days"/"day" and "holidays"/"holiday"
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """
+    Turns text into index terms: stemmed unigrams without stopwords, plus word bigrams.
+
+    Bigrams are built before stopword removal so phrases like "time off" keep their meaning.
+
+    :param text: Raw or normalized text
+    :return: A list of terms
+    """
+    words = [_stem(w) for w in normalize_question(text).split()]
+    terms = [w for w in words if w not in STOPWORDS]
+    terms.extend(f"{a}_{b}" for a, b in zip(words, words[1:]))
+    return terms
+
+
+class QAIndex:
+    """
+    In-memory BM25 index over the HR-curated question/answer pairs.
+
+    Only questions are indexed. lookup() returns the best answer when its
+    confidence clears min_confidence. Confidence is the IDF-weighted overlap
+    between the query terms and the matched question's terms, so it is
+    comparable across queries, unlike raw BM25 scores.
+    """
+
+    def __init__(self, min_confidence=0.75, k1=1.2, b=0.75):
+        self.min_confidence = min_confidence
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings = {}
+        self._doc_terms = []
+        self._doc_lengths = []
+        self._answers = []
+        self._questions = []
+        self._doc_ids = {}
+        self._total_length = 0
+        self._norms = None
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(min_confidence=float(os.getenv('QA_INDEX_MIN_CONFIDENCE', '0.75')))
+
+    def __len__(self):
+        return len(self._answers)
+
+    def add(self, question, answer):
+        """
+        Adds or replaces the answer for a question.
+        """
+        key = normalize_question(question)
+        if not key:
+            return
+        with self._lock:
+            doc_id = self._doc_ids.get(key)
+            if doc_id is not None:
+                self._answers[doc_id] = answer
+                return
+            terms = Counter(tokenize(key))
+            doc_id = len(self._answers)
+            self._doc_ids[key] = doc_id
+            self._questions.append(question)
+            self._answers.append(answer)
+            self._doc_terms.append(dict(terms))
+            length = sum(terms.values())
+            self._doc_lengths.append(length)
+            self._total_length += length
+            self._norms = None
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((doc_id, tf))
+
+    def build(self, entries):
+        """
+        Adds every {"question", "answer"} entry, later entries winning on duplicates.
+        """
+        for entry in entries:
+            self.add(entry.get("question", ""), entry.get("answer", ""))
+        logger.info("Q&A index built with %s entries", len(self))
+
+    def _idf(self, term, n_docs):
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+    def _length_norms(self):
+        # BM25 length normalisation depends on the average length, so it is recomputed after adds
+        if self._norms is None or len(self._norms) != len(self._doc_lengths):
+            avg_length = self._total_length / len(self._doc_lengths)
+            self._norms = [self.k1 * (1 - self.b + self.b * length / avg_length) for length in self._doc_lengths]
+        return self._norms
+
+    def search(self, query, limit=1, min_confidence=0.0):
+        """
+        Ranks indexed questions against the query.
+
+        With min_confidence, documents that cannot reach it are never scored: a
+        match must contain enough of the query's IDF mass, so only the postings
+        of the rarest query terms are needed to find every candidate.
+
+        :return: A list of (confidence, bm25_score, question, answer) tuples, best first
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return []
+        with self._lock:
+            n_docs = len(self._answers)
+            if not n_docs:
+                return []
+            norms = self._length_norms()
+            idf = {term: self._idf(term, n_docs) for term in query_terms}
+            k1_plus_1 = self.k1 + 1
+            candidates = None
+            if min_confidence > 0:
+                allowed_missing = (1 - min_confidence) * sum(idf.values())
+                candidates = set()
+                covered = 0.0
+                for term in sorted(query_terms, key=idf.get, reverse=True):
+                    candidates.update(doc_id for doc_id, _ in self._postings.get(term, ()))
+                    covered += idf[term]
+                    if covered > allowed_missing:
+                        break
+            scores = {}
+            if candidates is None:
+                for term in query_terms:
+                    term_idf = idf[term]
+                    for doc_id, tf in self._postings.get(term, ()):
+                        scores[doc_id] = scores.get(doc_id, 0.0) + term_idf * tf * k1_plus_1 / (tf + norms[doc_id])
+            else:
+                for doc_id in candidates:
+                    doc_terms = self._doc_terms[doc_id]
+                    score = 0.0
+                    for term in query_terms:
+                        tf = doc_terms.get(term)
+                        if tf:
+                            score += idf[term] * tf * k1_plus_1 / (tf + norms[doc_id])
+                    scores[doc_id] = score
+            ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            results = []
+            for doc_id, score in ranked:
+                doc_terms = self._doc_terms[doc_id].keys()
+                union = query_terms | doc_terms
+                matched = sum(idf[t] for t in query_terms & doc_terms)
+                total = sum(idf[t] if t in idf else self._idf(t, n_docs) for t in union)
+                confidence = matched / total if total else 0.0
+                results.append((confidence, score, self._questions[doc_id], self._answers[doc_id]))
+            return results
+
+    def lookup(self, query):
+        """
+        Returns the curated answer for the query if the best match is confident enough, else None.
+        """
+        self.lookups += 1
+        results = self.search(query, limit=1, min_confidence=self.min_confidence)
+        if not results:
+            return None
+        confidence, _, question, answer = results[0]
+        if confidence < self.min_confidence:
+            return None
+        self.hits += 1
+        logger.info("Q&A index match (confidence %.2f): %s", confidence, question)
+        return answer
+
+    def stats(self):
+        return {
+            "entries": len(self),
+            "terms": len(self._postings),
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
+
+
+qa_index = QAIndex.from_env()
+
+
+def load_qa_index(storage):
+    """
+    Builds the process-wide index from the Q&A storage layer.
+
+    :param storage: A qa_storage.QAStorage instance
+    """
+    try:
+        qa_index.build(storage.list_entries())
+    except Exception as e:
+        logger.error("Failed to build Q&A index: %s", e, exc_info=True)
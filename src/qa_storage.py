@@ -0,0 +1,368 @@
+# qa_storage.py
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from client_registry import get_client
+
+logger = logging.getLogger(__name__)
+
+
+class S3Backend:
+    """
+    Object storage on S3 using conditional writes (If-None-Match / If-Match).
+    """
+
+    def __init__(self, s3_client, bucket_name):
+        self.s3 = s3_client
+        self.bucket_name = bucket_name
+
+    def put_if_absent(self, key, body):
+        try:
+            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=body, IfNoneMatch='*')
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                return False
+            raise
+
+    def put_if_match(self, key, body, etag):
+        try:
+            self.s3.put_object(Bucket=self.bucket_name, Key=key, Body=body, IfMatch=etag)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('PreconditionFailed', 'ConditionalRequestConflict', 'NoSuchKey'):
+                return False
+            raise
+
+    def get(self, key):
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        return response['Body'].read(), response.get('ETag')
+
+    def list(self, prefix):
+        keys = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            keys.extend(obj['Key'] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+
+
+class LocalBackend:
+    """
+    Filesystem implementation of the storage backend, for offline use and tests.
+
+    put_if_absent relies on O_EXCL; put_if_match compares a content hash under a
+    process-wide lock.
+    """
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, *key.split('/'))
+
+    @staticmethod
+    def _etag(body):
+        return hashlib.md5(body).hexdigest()
+
+    def put_if_absent(self, key, body):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        return True
+
+    def put_if_match(self, key, body, etag):
+        path = self._path(key)
+        with self._lock:
+            current = self.get(key)
+            if current is None or current[1] != etag:
+                return False
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            return True
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return body, self._etag(body)
+
+    def list(self, prefix):
+        keys = []
+        for dirpath, _, filenames in os.walk(self.root_dir):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root_dir)
+                key = rel.replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class QAStorage:
+    """
+    Append-only storage for HR-curated question/answer pairs.
+
+    Every answer is written as its own immutable object under
+    ``<prefix>entries/``, so adding an answer costs one small conditional PUT
+    and concurrent writers never overwrite each other. compact() rolls
+    entries up into JSON array segments under ``<prefix>segments/``; a lease
+    object written with a conditional PUT keeps two compactors from running at
+    once. Each segment record keeps the entry key it came from, so entries
+    still present after a compaction that crashed before its deletes are
+    skipped on read and only deleted by the next compaction.
+
+    The prefix is usually one the Bedrock KB data source ingests, so only
+    .json documents are written under it; the lease lives under ``_locks/``.
+    """
+
+    LEASE_TTL_SECONDS = 300
+
+    def __init__(self, backend, prefix="qa/", legacy_key=None, compaction_threshold=50, lease_key=None):
+        """
+        :param lease_key: Where the compaction lease is written; defaults to a key outside prefix
+        """
+        self.backend = backend
+        self.prefix = prefix
+        self._lease_key = lease_key
+        self.legacy_key = legacy_key
+        self.compaction_threshold = compaction_threshold
+        self._compaction_thread = None
+        self._stop = threading.Event()
+
+    @property
+    def entries_prefix(self):
+        return f"{self.prefix}entries/"
+
+    @property
+    def segments_prefix(self):
+        return f"{self.prefix}segments/"
+
+    @property
+    def lease_key(self):
+        return self._lease_key or f"_locks/{self.prefix}compaction.lease"
+
+    @staticmethod
+    def _new_object_name():
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        return f"{stamp}-{uuid.uuid4().hex}"
+
+    def add(self, question, answer):
+        """
+        Stores one question/answer pair as a new object.
+
+        :return: The key of the written object
+        """
+        entry = {"question": question, "answer": answer}
+        body = json.dumps(entry).encode('utf-8')
+        while True:
+            key = f"{self.entries_prefix}{self._new_object_name()}.json"
+            if self.backend.put_if_absent(key, body):
+                return key
+
+    def list_entries(self):
+        """
+        Returns every stored question/answer pair, oldest first.
+
+        Includes the legacy single-file knowledge base when one is configured.
+        """
+        entries = []
+        if self.legacy_key:
+            legacy = self.backend.get(self.legacy_key)
+            if legacy is not None:
+                entries.extend(json.loads(legacy[0].decode('utf-8')))
+        segmented = set()
+        for entry_key, entry in self._segment_records():
+            if entry_key is not None:
+                if entry_key in segmented:
+                    continue
+                segmented.add(entry_key)
+            entries.append(entry)
+        for key in self.backend.list(self.entries_prefix):
+            if key in segmented:
+                continue
+            found = self.backend.get(key)
+            if found is not None:
+                entries.append(json.loads(found[0].decode('utf-8')))
+        return entries
+
+    def _segment_records(self):
+        """
+        Yields (entry key, entry) for every compacted answer; the key is None in segments written without one.
+
+        Reads the JSON array segments written now and the JSONL segments written before them.
+        """
+        for key in self.backend.list(self.segments_prefix):
+            found = self.backend.get(key)
+            if found is None:
+                continue
+            text = found[0].decode('utf-8')
+            if key.endswith('.jsonl'):
+                records = [json.loads(line) for line in text.splitlines() if line.strip()]
+            else:
+                records = json.loads(text)
+            for entry in records:
+                yield entry.pop("key", None), entry
+
+    def _acquire_lease(self):
+        lease = json.dumps({"owner": uuid.uuid4().hex, "acquired_at": time.time()}).encode('utf-8')
+        if self.backend.put_if_absent(self.lease_key, lease):
+            return True
+        current = self.backend.get(self.lease_key)
+        if current is None:
+            return self.backend.put_if_absent(self.lease_key, lease)
+        body, etag = current
+        try:
+            acquired_at = json.loads(body.decode('utf-8')).get("acquired_at", 0)
+        except ValueError:
+            acquired_at = 0
+        if time.time() - acquired_at < self.LEASE_TTL_SECONDS:
+            return False
+        # Take over a stale lease only if nobody else replaced it first
+        return self.backend.put_if_match(self.lease_key, lease, etag)
+
+    def compact(self, force=False):
+        """
+        Rolls individual entry objects up into one JSON segment.
+
+        :param force: Compact even when fewer than compaction_threshold entries exist
+        :return: The number of entries compacted
+        """
+        keys = self.backend.list(self.entries_prefix)
+        if not keys or (not force and len(keys) < self.compaction_threshold):
+            return 0
+        if not self._acquire_lease():
+            logger.info("Another process holds the compaction lease, skipping compaction")
+            return 0
+        try:
+            # Re-list under the lease so entries compacted by a previous holder are not duplicated
+            keys = self.backend.list(self.entries_prefix)
+            # Entries a crashed compaction already wrote to a segment only need deleting
+            segmented = {entry_key for entry_key, _ in self._segment_records()}
+            records = []
+            compacted_keys = []
+            for key in keys:
+                if key in segmented:
+                    compacted_keys.append(key)
+                    continue
+                found = self.backend.get(key)
+                if found is None:
+                    continue
+                records.append(dict(json.loads(found[0].decode('utf-8')), key=key))
+                compacted_keys.append(key)
+            if not compacted_keys:
+                return 0
+            segment_key = f"{self.segments_prefix}{self._new_object_name()}.json"
+            if records and not self.backend.put_if_absent(segment_key, json.dumps(records).encode('utf-8')):
+                logger.warning("Could not write compaction segment %s, keeping the entries", segment_key)
+                return 0
+            for key in compacted_keys:
+                self.backend.delete(key)
+            if records:
+                logger.info("Compacted %d answers into %s", len(records), segment_key)
+            if len(records) < len(compacted_keys):
+                logger.info("Removed %d answers left behind by an interrupted compaction", len(compacted_keys) - len(records))
+            return len(compacted_keys)
+        finally:
+            self.backend.delete(self.lease_key)
+
+    def start_background_compaction(self, interval_seconds=600):
+        if self._compaction_thread is not None:
+            return
+        self._compaction_thread = threading.Thread(
+            target=self._compaction_loop, args=(interval_seconds,), name="qa-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+
+    def stop_background_compaction(self):
+        self._stop.set()
+
+    def _compaction_loop(self, interval_seconds):
+        while not self._stop.wait(interval_seconds):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error("Background compaction failed: %s", e, exc_info=True)
+
+
+def default_prefix(legacy_key):
+    """
+    Puts new answers next to the legacy knowledge base file, so they sit under
+    the same S3 location the Bedrock KB data source already ingests. The
+    compaction lease is kept outside it (see QAStorage.lease_key).
+
+    :param legacy_key: The S3_KB_FILE_KEY, or None
+    :return: The directory of legacy_key with a trailing slash, or 'qa/' without one
+    """
+    if not legacy_key:
+        return 'qa/'
+    directory = os.path.dirname(legacy_key)
+    return f"{directory}/" if directory else ''
+
+
+_storages = weakref.WeakKeyDictionary()
+_local_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_qa_storage(session):
+    """
+    Returns the Q&A storage configured by KB_STORAGE_BACKEND ('s3' or 'local').
+
+    S3_KB_PREFIX defaults to the directory of S3_KB_FILE_KEY (see default_prefix);
+    S3_KB_LEASE_KEY moves the compaction lease if ``_locks/`` is ingested too.
+
+    :param session: A boto3 session, unused by the local backend
+    :return: A QAStorage instance shared per session
+    """
+    global _local_storage
+
+    legacy_key = os.getenv('S3_KB_FILE_KEY')
+    prefix = os.getenv('S3_KB_PREFIX', default_prefix(legacy_key))
+    threshold = int(os.getenv('KB_COMPACTION_THRESHOLD', '50'))
+    lease_key = os.getenv('S3_KB_LEASE_KEY')
+    with _storage_lock:
+        if os.getenv('KB_STORAGE_BACKEND', 's3') == 'local':
+            if _local_storage is None:
+                backend = LocalBackend(os.getenv('KB_LOCAL_DIR', 'kb_data'))
+                _local_storage = QAStorage(backend, prefix, legacy_key, threshold, lease_key)
+            return _local_storage
+
+        storage = _storages.get(session)
+        if storage is None:
+            backend = S3Backend(get_client(session, 's3'), os.getenv('S3_BUCKET_NAME'))
+            storage = QAStorage(backend, prefix, legacy_key, threshold, lease_key)
+            _storages[session] = storage
+        return storage
@@ -3,10 +3,26 @@ import os
 import sys
 import logging
 import signal
+import argparse
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from assume_role import assume_role, check_assumed_role
+from assume_role import assume_role, check_assumed_role, get_credential_stats
 from slack_handler import SlackHandler
 from bedrock_kb_handler import query_bedrock_kb
+from bedrock_limiter import bedrock_limiter, BedrockCallError
+from model_router import model_router
+from health import health_state
+from qa_storage import get_qa_storage
+from qa_index import load_qa_index, qa_index
+from answer_cache import answer_cache, retrieval_cache, unanswerable_cache, watch_peer_changes, PEER_CHANGE
+import kb_events
+from client_registry import get_client_registry
+from singleflight import kb_flight, claude_flight
+from metrics import registry as metrics_registry, start_metrics_server
+from supervisor import WorkerSupervisor, spawn_server_worker
+import log_setup
 
 # Add the src directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
@@ -15,7 +31,6 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 's
 load_dotenv()
 
 # Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -23,61 +38,305 @@ logger = logging.getLogger(__name__)
 required_env_vars = ['SLACK_BOT_TOKEN', 'SLACK_APP_TOKEN', 'SLACK_SIGNING_SECRET', 'AWS_DEFAULT_REGION', 'BEDROCK_KB_ID', 'BEDROCK_MODEL_ARN']
 for var in required_env_vars:
     if not os.getenv(var):
-        logger.error(f"Missing required environment variable: {var}")
+        logger.error("Missing required environment variable: %s", var)
         sys.exit(1)
 
 
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv('SHUTDOWN_TIMEOUT_SECONDS', '25'))
+
+# The running SlackHandler, drained by signal_handler
+active_handler = None
+
+
 def signal_handler(sig, frame):
     logger.info('Shutting down gracefully...')
-    # Perform any cleanup operations here
+    if active_handler is not None:
+        active_handler.shutdown(timeout=SHUTDOWN_TIMEOUT_SECONDS)
+    log_setup.shutdown_logging()
     sys.exit(0)
 
-def main():
-    try:
-        logger.info("Starting the application...")
-        
-        # Set up signal handlers
-        signal.signal(signal.SIGINT, signal_handler)
-        signal.signal(signal.SIGTERM, signal_handler)
-        logger.info("Signal handlers set up")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="HR knowledge base Slack bot")
+    parser.add_argument(
+        "--startup-mode",
+        choices=["fast", "sequential"],
+        default=os.getenv("STARTUP_MODE", "fast"),
+        help="fast connects to Slack first and runs startup checks concurrently in the background"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["sync", "async"],
+        default=os.getenv("BOT_MODE", "sync"),
+        help="async (experimental) receives from Slack on asyncio (AsyncApp) and answers through the same workers "
+             "as sync; it always starts fast"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("BOT_WORKERS", "1")),
+        help="more than 1 runs a supervisor that keeps this many bot processes, each with its own Socket Mode connection"
+    )
+    return parser.parse_args(argv)
 
+
+def start_aws(slack_handler):
+    """
+    Assumes the AWS role, hands the session to the Slack handler and probes the knowledge base.
+
+    :return: True if the role was assumed, False otherwise
+    """
+    with health_state.time_stage("assume_role"):
         assumed_session = assume_role()
-        if not assumed_session or not check_assumed_role(assumed_session):
-            logger.error("Failed to assume role or role is not valid.")
-            sys.exit(1)
-        logger.info("AWS role assumed successfully")
+    with health_state.time_stage("check_assumed_role"):
+        role_ok = bool(assumed_session) and check_assumed_role(assumed_session)
+    health_state.set_check("aws_role", role_ok)
+    if not role_ok:
+        return False
+    slack_handler.set_aws_session(assumed_session)
+    start_background_jobs(assumed_session)
+
+    with health_state.time_stage("bedrock_probe"):
+        health_state.set_check("bedrock_kb", slack_handler.test_bedrock_access())
+    return True
+
+
+def start_background_jobs(session):
+    storage = get_qa_storage(session)
+    threading.Thread(target=load_qa_index, args=(storage,), name="qa-index-load", daemon=True).start()
+
+    def reload_qa_index(reason):
+        # An answer HR saved through another worker shows up here as a shared answer store change
+        if reason == PEER_CHANGE:
+            threading.Thread(target=load_qa_index, args=(storage,), name="qa-index-reload", daemon=True).start()
+
+    kb_events.subscribe(reload_qa_index)
+    compaction_interval = int(os.getenv('KB_COMPACTION_INTERVAL_SECONDS', '600'))
+    if compaction_interval > 0:
+        get_qa_storage(session).start_background_compaction(compaction_interval)
+
 
-        logger.info("Setting up Slack handler...")
+def register_metrics_collectors(slack_handler):
+    metrics_registry.register_collector("aws_clients", get_client_registry().stats)
+    metrics_registry.register_collector("credentials", get_credential_stats)
+    metrics_registry.register_collector("answer_cache", answer_cache.stats)
+    metrics_registry.register_collector("retrieval_cache", retrieval_cache.stats)
+    metrics_registry.register_collector("unanswerable_cache", unanswerable_cache.stats)
+    if answer_cache.store is not None:
+        metrics_registry.register_collector("answer_store", answer_cache.store.stats)
+    metrics_registry.register_collector("qa_index", qa_index.stats)
+    metrics_registry.register_collector("kb_singleflight", kb_flight.stats)
+    metrics_registry.register_collector("claude_singleflight", claude_flight.stats)
+    metrics_registry.register_collector("dispatch", slack_handler.dispatcher.stats)
+    metrics_registry.register_collector("slack_outbox", slack_handler.outbox.stats)
+    metrics_registry.register_collector("bedrock_limiter", bedrock_limiter.stats)
+    metrics_registry.register_collector("model_router", model_router.stats)
+    metrics_registry.register_collector("event_dedupe", slack_handler.deduplicator.stats)
+    metrics_registry.register_collector("hr_escalation", slack_handler.escalations.stats)
+    metrics_registry.register_collector("conversations", slack_handler.conversations.stats)
+    metrics_registry.register_collector("command_conversations", slack_handler.command_conversations.stats)
+    metrics_registry.register_collector(
+        "answer_warmer",
+        lambda: slack_handler.answer_warmer.stats() if slack_handler.answer_warmer else None
+    )
+    metrics_registry.register_collector(
+        "ingestion",
+        lambda: slack_handler.ingestion_scheduler.stats() if slack_handler.ingestion_scheduler else None
+    )
+    metrics_registry.register_collector("logging", log_setup.stats)
+    metrics_registry.register_collector("health", lambda: {"live": health_state.live, "ready": health_state.ready})
+
+
+def start_slack_auth(slack_handler):
+    with health_state.time_stage("slack_auth"):
+        try:
+            slack_handler.resolve_bot_user_id()
+            health_state.set_check("slack_auth", True)
+        except Exception as e:
+            health_state.set_check("slack_auth", False, str(e))
+
+
+def run_supervisor(args):
+    """
+    Runs `args.workers` single-process bots and restarts any that exit.
+
+    Slack spreads events across the workers' Socket Mode connections; the
+    workers share de-duplication and cached answers through SQLite files
+    (see supervisor.worker_environment).
+    """
+    worker_argv = ["--startup-mode", args.startup_mode, "--mode", args.mode]
+    supervisor = WorkerSupervisor.from_env(lambda index: spawn_server_worker(index, worker_argv), args.workers)
+    supervisor.install_signal_handlers()
+    metrics_registry.register_collector("supervisor", supervisor.stats)
+    start_metrics_server()
+    supervisor.run()
+    log_setup.shutdown_logging()
+
+
+def fast_start():
+    """
+    Opens the Socket Mode connection first, then runs the startup checks concurrently.
+
+    Events that arrive before the AWS session is ready get a "still starting" reply
+    instead of being dropped.
+    """
+    global active_handler
+    with health_state.time_stage("slack_connect"):
         slack_handler = SlackHandler(
+            os.environ.get("SLACK_BOT_TOKEN"),
+            os.environ.get("SLACK_APP_TOKEN"),
+            defer_auth=True
+        )
+        slack_handler.connect()
+    active_handler = slack_handler
+    register_metrics_collectors(slack_handler)
+    health_state.mark_live()
+    logger.info("Slack bot connected in Socket Mode, running startup checks")
+
+    with health_state.time_stage("startup_checks"):
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+            aws_future = pool.submit(start_aws, slack_handler)
+            pool.submit(start_slack_auth, slack_handler)
+    health_state.log_timings()
+
+    if not aws_future.result():
+        logger.error("Failed to assume role or role is not valid.")
+        sys.exit(1)
+    logger.info("Startup complete: live=%s ready=%s", health_state.live, health_state.ready)
+
+    # Socket Mode runs on its own threads; keep the main thread alive like SocketModeHandler.start()
+    threading.Event().wait()
+
+
+def async_start():
+    asyncio.run(run_async_bot())
+
+
+async def run_async_bot():
+    """
+    Async counterpart of fast_start(): connect first, then run the startup checks concurrently.
+    """
+    # Imported here so the threaded bot does not need aiohttp installed
+    from async_slack_handler import AsyncSlackHandler
+    from async_aws import run_blocking, executor_stats
+
+    with health_state.time_stage("slack_connect"):
+        slack_handler = AsyncSlackHandler(
             os.environ.get("SLACK_BOT_TOKEN"),
             os.environ.get("SLACK_APP_TOKEN")
         )
-        slack_handler.set_aws_session(assumed_session)
-        logger.info("Slack handler initialized")
+        await slack_handler.connect()
+    register_metrics_collectors(slack_handler)
+    metrics_registry.register_collector("aws_executor", executor_stats)
+    health_state.mark_live()
+    logger.info("Async Slack bot connected in Socket Mode, running startup checks")
+
+    async def slack_auth():
+        with health_state.time_stage("slack_auth"):
+            try:
+                await slack_handler.resolve_bot_user_id()
+                health_state.set_check("slack_auth", True)
+            except Exception as e:
+                health_state.set_check("slack_auth", False, str(e))
 
-        if slack_handler.test_bedrock_access():
-            logger.info("Bedrock access test passed")
-            # Add a test query to check KB content
+    with health_state.time_stage("startup_checks"):
+        aws_ok, _ = await asyncio.gather(run_blocking(start_aws, slack_handler), slack_auth())
+    health_state.log_timings()
+
+    if not aws_ok:
+        logger.error("Failed to assume role or role is not valid.")
+        sys.exit(1)
+    logger.info("Startup complete: live=%s ready=%s", health_state.live, health_state.ready)
+
+    # signal_handler would block the loop that in-flight replies are sent through
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    await stopping.wait()
+    logger.info('Shutting down gracefully...')
+    await slack_handler.shutdown_async(timeout=SHUTDOWN_TIMEOUT_SECONDS)
+    log_setup.shutdown_logging()
+
+
+def sequential_start():
+    global active_handler
+    assumed_session = assume_role()
+    if not assumed_session or not check_assumed_role(assumed_session):
+        logger.error("Failed to assume role or role is not valid.")
+        sys.exit(1)
+    health_state.set_check("aws_role", True)
+    logger.info("AWS role assumed successfully")
+
+    logger.info("Setting up Slack handler...")
+    slack_handler = SlackHandler(
+        os.environ.get("SLACK_BOT_TOKEN"),
+        os.environ.get("SLACK_APP_TOKEN")
+    )
+    health_state.set_check("slack_auth", True)
+    active_handler = slack_handler
+    register_metrics_collectors(slack_handler)
+    slack_handler.set_aws_session(assumed_session)
+    start_background_jobs(assumed_session)
+    logger.info("Slack handler initialized")
+
+    if slack_handler.test_bedrock_access():
+        health_state.set_check("bedrock_kb", True)
+        logger.info("Bedrock access test passed")
+        # Add a test query to check KB content
+        try:
             test_response, valid = query_bedrock_kb(assumed_session, "How many minus vacation days can I get into?")
-            if valid and test_response.strip() and test_response != "Sorry, I am unable to assist you with this request.":
-                logger.info(f"Bedrock KB content test passed. Response: {test_response}")
-            else:
-                logger.warning("Bedrock KB content test failed. The knowledge base might be empty or not contain relevant information.")
+        except BedrockCallError as e:
+            logger.warning("Bedrock KB content test could not run: %s", e)
+            test_response, valid = "", False
+        if valid and test_response.strip() and test_response != "Sorry, I am unable to assist you with this request.":
+            logger.info("Bedrock KB content test passed. Response: %s", test_response)
         else:
-            logger.error("Bedrock access test failed")
+            logger.warning("Bedrock KB content test failed. The knowledge base might be empty or not contain relevant information.")
+    else:
+        health_state.set_check("bedrock_kb", False)
+        logger.error("Bedrock access test failed")
 
-        logger.info(f"Slack handler initialized with bot token: {os.environ.get('SLACK_BOT_TOKEN')[:10]}... and app token: {os.environ.get('SLACK_APP_TOKEN')[:10]}...")
 
-        logger.info("Starting Slack bot in Socket Mode...")
-        try:
-            slack_handler.start()
-        except Exception as e:
-            logger.error(f"Failed to start Slack bot: {str(e)}", exc_info=True)
-            sys.exit(1)
+    logger.info("Starting Slack bot in Socket Mode...")
+    health_state.mark_live()
+    try:
+        slack_handler.start()
+    except Exception as e:
+        logger.error("Failed to start Slack bot: %s", e, exc_info=True)
+        sys.exit(1)
+
+
+def main(argv=None):
+    log_setup.configure_logging()
+    try:
+        logger.info("Starting the application...")
+        args = parse_args(argv)
+
+        # Set up signal handlers
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+        logger.info("Signal handlers set up")
+
+        if args.workers > 1:
+            run_supervisor(args)
+            return
+
+        start_metrics_server(health_fn=health_state.snapshot)
+        # Answers persisted by the previous run; lookups fall back to disk until this finishes
+        threading.Thread(target=answer_cache.warm, name="answer-cache-warm", daemon=True).start()
+        watch_peer_changes()
+
+        if args.mode == "async":
+            logger.warning("Async mode is experimental; sync is the supported mode")
+            async_start()
+        elif args.startup_mode == "fast":
+            fast_start()
+        else:
+            sequential_start()
 
     except Exception as e:
-        logger.error(f"An error occurred during startup: {e}", exc_info=True)
+        logger.error("An error occurred during startup: %s", e, exc_info=True)
         sys.exit(1)
-        
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,153 @@
+# singleflight.py
+
+import os
+import logging
+import asyncio
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for its result, or re-raise its exception. A waiter that
+    gives up after timeout_seconds runs the function itself instead of failing.
+    """
+
+    def __init__(self, timeout_seconds=60):
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(timeout_seconds=float(os.getenv('SINGLEFLIGHT_TIMEOUT_SECONDS', '60')))
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) unless a call with the same key is already in flight.
+
+        :param key: The coalescing key, e.g. a normalized question
+        :return: The result of fn, possibly computed for another caller
+        """
+        if not key:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiters += 1
+
+        if not leader:
+            if call.done.wait(self.timeout_seconds):
+                self.shared += 1
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            self.timeouts += 1
+            logger.warning("Timed out after %ss waiting for in-flight call, running it directly", self.timeout_seconds)
+            return fn(*args, **kwargs)
+
+        self.executions += 1
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "executions": self.executions,
+            "calls_saved": self.shared,
+            "timeouts": self.timeouts,
+            "in_flight": in_flight,
+        }
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for coroutine functions.
+
+    Waiters await the leader's task instead of holding a thread, so hundreds
+    of identical questions cost one call and no extra threads. All callers
+    must run on the same event loop.
+    """
+
+    def __init__(self, timeout_seconds=60):
+        self.timeout_seconds = timeout_seconds
+        self._calls = {}
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(timeout_seconds=float(os.getenv('SINGLEFLIGHT_TIMEOUT_SECONDS', '60')))
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Awaits fn(*args, **kwargs) unless a call with the same key is already in flight.
+
+        :param key: The coalescing key, e.g. a normalized question
+        :param fn: A coroutine function
+        :return: The result of fn, possibly computed for another caller
+        """
+        if not key:
+            return await fn(*args, **kwargs)
+
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            return await asyncio.shield(task)
+
+        try:
+            # shield() keeps a waiter's timeout or cancellation from cancelling the leader
+            result = await asyncio.wait_for(asyncio.shield(task), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("Timed out after %ss waiting for in-flight call, running it directly", self.timeout_seconds)
+            return await fn(*args, **kwargs)
+        self.shared += 1
+        return result
+
+    def stats(self):
+        return {
+            "executions": self.executions,
+            "calls_saved": self.shared,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._calls),
+        }
+
+
+kb_flight = SingleFlight.from_env()
+claude_flight = SingleFlight.from_env()
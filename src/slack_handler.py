@@ -1,219 +1,716 @@
 # slack_handler.py
 import os
+import re
 import logging
-from slack_bolt import App
+import time
+import threading
+import functools
+from slack_bolt import App, BoltResponse
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from bedrock_kb_handler import query_bedrock_kb
-from bedrock_kb_handler import save_answer_to_s3, sync_knowledge_base
-from bedrock_handler import query_claude
+from bedrock_kb_handler import query_bedrock_kb, query_bedrock_kb_in_session
+from bedrock_kb_handler import save_answer_to_s3, UNABLE_TO_ASSIST
+from bedrock_handler import query_claude, stream_claude, complete_claude, get_bedrock_client
+from bedrock_limiter import BedrockCallError, BedrockThrottledError
+from client_registry import get_client
+from answer_cache import answer_cache, unanswerable_cache
+from normalize import normalize_question
+from dispatcher import MessageDispatcher
+from slack_outbox import SlackOutbox, SlackRateLimited
+from hr_escalation import EscalationQueue, GROUP_REFERENCE
+from event_dedupe import EventDeduplicator, dedupe_key
+from health import health_state
+from ingestion_scheduler import IngestionScheduler
+from answer_warmer import AnswerWarmer
+from conversation_store import ConversationStore, conversation_key, build_messages
+from qa_index import qa_index
+from singleflight import kb_flight, claude_flight
+from metrics import timer, timed
+from log_setup import log_payload, bind_request_id, request_id_from_body
 import json
 
 logger = logging.getLogger(__name__)
 
+SLACK_SEND_TIMEOUT_SECONDS = float(os.getenv('SLACK_SEND_TIMEOUT_SECONDS', '60'))
+# Slack accepts at most this many calls per slash command response_url
+RESPONSE_URL_MAX_USES = 5
+# "/use_claude --new ..." starts over instead of continuing the user's conversation in the channel
+NEW_CONVERSATION_FLAG = re.compile(r"^\s*--new\b\s*")
+STREAM_INTERRUPTED_NOTICE = "\n\n_(This answer was interrupted and may be incomplete. Please try again.)_"
+
+def add_answer_reply(escalations, reference, question, notified):
+    """
+    Builds the /add_answer confirmation; shared with AsyncSlackHandler.
+
+    :param reference: The question part of the command, possibly '#<group id>'
+    :param question: The question the answer was saved under
+    :param notified: How many employees resolve() sent the answer to
+    """
+    message = "The answer has been successfully added. I'll post in this channel once the knowledge base has been updated."
+    if notified:
+        message += f" I've also sent it to the {notified} employee(s) who asked."
+    elif not GROUP_REFERENCE.match(reference):
+        # Employees are only messaged when HR names the digest, never on a text match
+        group = escalations.find(question)
+        if group is not None:
+            message += (f" Employees are still waiting on the matching question #{group.group_id}; "
+                        f"use `/add_answer #{group.group_id} | answer` to send it to them.")
+    return message
+
+
 class SlackHandler:
-    def __init__(self, slack_bot_token, slack_app_token):
+    def __init__(self, slack_bot_token, slack_app_token, defer_auth=False, client=None):
         """
         Initializes the SlackHandler with tokens and starts setting up listeners.
+
+        With defer_auth the Slack auth_test is skipped here so the Socket Mode
+        connection can be opened first; call resolve_bot_user_id() afterwards.
+        A preconfigured WebClient can be passed as client, e.g. by the benchmarks.
         """
-        self.app = App(token=slack_bot_token)
+        if client is not None:
+            self.app = App(client=client, token_verification_enabled=not defer_auth)
+        else:
+            self.app = App(token=slack_bot_token, token_verification_enabled=not defer_auth)
         self.socket_mode_handler = SocketModeHandler(self.app, slack_app_token)
-        try:
-            self.bot_user_id = self.app.client.auth_test()['user_id']
-        except Exception as e:
-            logger.error(f"Failed to authenticate with Slack API: {str(e)}", exc_info=True)
-            raise SystemExit("Critical error: Failed to authenticate with Slack API.")
-        self.aws_session = None
+        # Blocking WebClient for worker and background threads
+        self.client = self.app.client
+        self.bot_user_id = None
+        if not defer_auth:
+            try:
+                self.resolve_bot_user_id()
+            except Exception:
+                raise SystemExit("Critical error: Failed to authenticate with Slack API.")
+        self.init_request_handling()
         self.setup_listeners()
 
+    def init_request_handling(self):
+        """
+        Sets up everything behind the Bolt listeners; AsyncSlackHandler reuses it with its own front end.
+        """
+        self.aws_session = None
+        self.ingestion_scheduler = None
+        self.answer_warmer = None
+        # Streamed /use_claude answers stay ephemeral: they are updated in place through the response_url
+        self.streaming_enabled = os.getenv('CLAUDE_STREAMING', 'true').lower() == 'true'
+        self.stream_update_interval = float(os.getenv('CLAUDE_STREAM_UPDATE_INTERVAL', '1.0'))
+        self.dispatcher = MessageDispatcher.from_env()
+        self.outbox = SlackOutbox.from_env()
+        self.deduplicator = EventDeduplicator.from_env()
+        self.escalations = EscalationQueue.from_env(self.post_message, update_fn=self.update_message)
+        summarizer = os.getenv('CONVERSATION_SUMMARIZER', 'extractive').lower()
+        self.conversations = ConversationStore.from_env(
+            summarize_fn=self.summarize_with_claude if summarizer == 'claude' else None
+        )
+        # /use_claude has no threads to mark a conversation, so its history only carries over for quick follow-ups
+        self.command_conversations = ConversationStore.from_env(
+            summarize_fn=self.summarize_with_claude if summarizer == 'claude' else None,
+            idle_seconds=float(os.getenv('CONVERSATION_COMMAND_IDLE_SECONDS', '300')),
+            namespace="commands",
+        )
+
     def set_aws_session(self, session):
         self.aws_session = session
+        if self.ingestion_scheduler is None:
+            self.ingestion_scheduler = IngestionScheduler.from_env(session, notifier=self.post_to_hr_channel)
+        else:
+            self.ingestion_scheduler.session = session
+        if self.answer_warmer is None:
+            self.answer_warmer = AnswerWarmer.from_env(session, answer_cache, unanswerable_cache)
+            self.answer_warmer.request_warm("startup")
+        else:
+            self.answer_warmer.session = session
+
+    def resolve_bot_user_id(self):
+        try:
+            self.bot_user_id = self.app.client.auth_test()['user_id']
+            return self.bot_user_id
+        except Exception as e:
+            logger.error("Failed to authenticate with Slack API: %s", e, exc_info=True)
+            raise
 
     def setup_listeners(self):
+        self.app.use(self.bind_request_context)
+        self.app.use(self.deduplicate_events)
+        self.app.error(self.handle_listener_error)
+
         @self.app.event("app_mention")
-        def handle_app_mention(event, say):
-            self.handle_message(event, say)
+        def handle_app_mention(event, say, context):
+            bind_request_id(context.get("request_id"))
+            self.dispatch_message(event, say, context.get("dedupe_key"))
 
         @self.app.event("message")
-        def handle_message_event(event, say):
-            if event.get("channel_type") == "im" and f"<@{self.bot_user_id}>" not in event.get("text", ""):
-                self.handle_message(event, say)
+        def handle_message_event(event, say, context):
+            bind_request_id(context.get("request_id"))
+            self.handle_message_event(event, say, context.get("dedupe_key"))
 
         @self.app.command("/use_claude")
-        def handle_use_claude_command(ack, respond, command):
-            ack()  # Acknowledge the command request
-            try:
+        def handle_use_claude_command(ack, respond, command, context):
+            bind_request_id(context.get("request_id"))
+            with timer("slack.ack"):
+                ack()  # Acknowledge the command request
+            self.use_claude(command, respond)
 
-                if not self.aws_session:
-                    logger.error("AWS session not set for Claude query")
-                    respond("I'm not properly configured to answer questions at the moment. Please try again later.")
-                    return
+        @self.app.command("/add_answer")
+        def handle_add_answer(ack, respond, command, context):
+            bind_request_id(context.get("request_id"))
+            with timer("slack.ack"):
+                ack()  # Acknowledge the command request
+            self.add_answer(command, respond)
 
-                user_message = command.get("text", "")
-                if not user_message:
-                    respond("Please provide a question or message to process.")
-                    return
+    def handle_message_event(self, event, say, dedupe_key=None):
+        """
+        Answers direct messages; other message events are mentions handled by app_mention, or not for the bot.
+        """
+        if event.get("channel_type") == "im" and f"<@{self.bot_user_id}>" not in event.get("text", ""):
+            self.dispatch_message(event, say, dedupe_key)
+        else:
+            self.deduplicator.complete(dedupe_key)
 
-                system_message = "You are a helpful AI assistant integrated into a Slack bot. Respond concisely and professionally."
-                messages = [
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ]
-                response = query_claude(self.aws_session, json.dumps(messages))
-                if not response:
-                    respond("I was unable to generate a response. Please try again or reach out to HR.")
-                else:
-                    logger.info(f"Claude response: {response}")
-                    respond(response)
-            except Exception as e:
-                logger.error(f"Error in handle_use_claude_command: {str(e)}", exc_info=True)
-                respond("I'm sorry, I encountered an error while processing your request.")
-            
-        @self.app.command("/add_answer")
-        def handle_add_answer(ack, respond, command):
-            ack()  # Acknowledge the command request
-            hr_channel_id = os.getenv('HR_CHANNEL_ID')
-            if command.get('channel_id') != hr_channel_id:
-                respond("This command is not allowed outside the HR channel.")
+    def use_claude(self, command, respond):
+        """
+        Answers /use_claude after the ack.
+
+        :param respond: Bolt's respond for the command
+        """
+        bolt_respond, respond = respond, self.queued_respond(respond, command.get("response_url"))
+        try:
+
+            if not self.aws_session:
+                logger.error("AWS session not set for Claude query")
+                respond("I'm not properly configured to answer questions at the moment. Please try again later.")
                 return
-            try:
-                 
-                if not self.aws_session:
-                    logger.error("AWS session not set for saving answer")
-                    respond("I'm not properly configured to save answers at the moment. Please try again later.")
-                    return
 
-                user_message = command.get("text", "").strip()
+            user_message = command.get("text", "")
+            # Slash commands cannot be sent in a thread, so each user gets one conversation per channel
+            key = conversation_key(command.get("channel_id"), command.get("user_id"))
+            new_conversation = NEW_CONVERSATION_FLAG.match(user_message)
+            if new_conversation:
+                self.command_conversations.clear(key)
+                user_message = user_message[new_conversation.end():]
                 if not user_message:
-                    respond("Please provide both the question and the answer in the format: `question | answer`.")
+                    respond("Started a new conversation. Your next question won't include the earlier ones.")
                     return
+            if not user_message:
+                respond("Please provide a question or message to process.")
+                return
 
-                # Extract question and answer
-                parts = user_message.split("|")
-                if len(parts) != 2:
-                    respond("Invalid format. Please use: `question | answer`.")
+            system_message = "You are a helpful AI assistant integrated into a Slack bot. Respond concisely and professionally."
+            summary, turns = self.command_conversations.history(key)
+            messages = build_messages(system_message, summary, turns, user_message)
+            if self.streaming_enabled:
+                streamed = self.respond_streaming(command, json.dumps(messages), bolt_respond)
+                if streamed:
+                    self.command_conversations.record(key, user_message, streamed)
                     return
+            flight_key = normalize_question(user_message)
+            if summary or turns:
+                # The answer depends on the conversation, so only the same conversation may share it
+                flight_key = f"{key}|{flight_key}"
+            response = claude_flight.do(flight_key, query_claude, self.aws_session, json.dumps(messages))
+            if not response:
+                respond("I was unable to generate a response. Please try again or reach out to HR.")
+            else:
+                log_payload(logger, "Claude response: %s", response)
+                respond(response)
+                self.command_conversations.record(key, user_message, response)
+        except Exception as e:
+            logger.error("Error in handle_use_claude_command: %s", e, exc_info=True)
+            respond("I'm sorry, I encountered an error while processing your request.")
+        
+    def add_answer(self, command, respond):
+        """
+        Saves an HR answer from /add_answer after the ack.
 
-                question = parts[0].strip()
-                answer = parts[1].strip()
+        :param respond: Bolt's respond for the command
+        """
+        respond = self.queued_respond(respond, command.get("response_url"))
+        hr_channel_id = os.getenv('HR_CHANNEL_ID')
+        if command.get('channel_id') != hr_channel_id:
+            respond("This command is not allowed outside the HR channel.")
+            return
+        try:
+             
+            if not self.aws_session:
+                logger.error("AWS session not set for saving answer")
+                respond("I'm not properly configured to save answers at the moment. Please try again later.")
+                return
 
-                # Save the question and answer to S3
-                save_answer_to_s3(question, answer, self.aws_session)
-                respond("The answer has been successfully added to the knowledge base.")
+            user_message = command.get("text", "").strip()
+            if not user_message:
+                respond("Please provide both the question and the answer in the format: `question | answer`.")
+                return
+
+            # Extract question and answer
+            parts = user_message.split("|")
+            if len(parts) != 2:
+                respond("Invalid format. Please use: `question | answer`.")
+                return
 
-                # Sync with knowledge base
-                if sync_knowledge_base(self.aws_session):
-                    respond("The knowledge base has been updated successfully.")
-                else:
-                    respond("The answer was added, but there was an issue syncing the knowledge base. Please check the logs.")
-            except Exception as e:
-                logger.error(f"Error in handle_add_answer: {str(e)}", exc_info=True)
-                respond("I'm sorry, I encountered an error while processing your request.")
+            question = parts[0].strip()
+            answer = parts[1].strip()
+
+            # "#12 | answer" answers escalation digest #12 with its original question
+            reference = question
+            if GROUP_REFERENCE.match(reference):
+                group = self.escalations.find(reference)
+                if group is None:
+                    respond(f"I couldn't find an open question {reference}. It may already have been answered.")
+                    return
+                question = group.question
 
+            # Save the question and answer to S3
+            save_answer_to_s3(question, answer, self.aws_session)
+            qa_index.add(question, answer)
+            notified = self.escalations.resolve(reference, answer)
+
+            # Batch the knowledge base sync with other recent answers
+            self.ingestion_scheduler.request_sync()
+            respond(add_answer_reply(self.escalations, reference, question, notified))
+        except Exception as e:
+            logger.error("Error in handle_add_answer: %s", e, exc_info=True)
+            respond("I'm sorry, I encountered an error while processing your request.")
+
+    def bind_request_context(self, body, context, next):
+        """
+        Global middleware that gives each Slack delivery a correlation ID for its log lines.
+
+        Listeners run on Bolt's executor, so each one re-binds context['request_id'];
+        the dispatcher carries it on to the worker thread.
+        """
+        context["request_id"] = bind_request_id(request_id_from_body(body))
+        return next()
+
+    def deduplicate_events(self, body, context, next):
+        """
+        Global middleware that drops Slack redeliveries of events and commands already handled.
+
+        Events are acknowledged before their listener runs, so the key is marked
+        done by the listener path (see dispatch_message); commands are marked
+        done once the listener has acknowledged them.
+        """
+        key = dedupe_key(body)
+        if key is None:
+            return next()
+        if not self.deduplicator.claim(key):
+            logger.info("Ignoring duplicate Slack delivery %s", key)
+            return BoltResponse(status=200, body="")
+        context["dedupe_key"] = key
+        try:
+            response = next()
+        except Exception:
+            self.deduplicator.release(key)
+            raise
+        if body.get("type") != "event_callback":
+            self.deduplicator.complete(key)
+        return response
+
+    def handle_listener_error(self, error, body):
+        """
+        Global error handler. Event listeners run after the ack, outside
+        deduplicate_events, so a listener that raises releases its delivery
+        here; otherwise a Slack retry would be dropped as a duplicate until
+        the in-flight claim lapsed.
+        """
+        logger.error("Slack listener failed: %s", error, exc_info=error)
+        if body.get("type") == "event_callback":
+            self.deduplicator.release(dedupe_key(body))
+
+    def dispatch_message(self, event, say, dedupe_key=None):
+        """
+        Hands the event to the worker pool so the Bolt listener thread is released immediately.
+        """
+        if event.get("bot_id"):
+            self.deduplicator.complete(dedupe_key)
+            return
+        if not self.dispatcher.submit(event.get("user"), event.get("channel"), self.handle_deduplicated, dedupe_key, event, say):
+            # Let a redelivery of this event try again once the queue has drained
+            self.deduplicator.release(dedupe_key)
+            say("I'm handling a lot of questions right now. Please try again in a minute.")
+
+    def handle_deduplicated(self, dedupe_key, event, say):
+        try:
+            self.handle_message(event, say)
+        finally:
+            self.deduplicator.complete(dedupe_key)
+
+    @timed("slack.handle_message")
     def handle_message(self, event, say):
         if event.get("bot_id"):
             return
-        
+        thread_ts = event.get("thread_ts")
+        # A top-level message starts a conversation that continues in its thread
+        conversation = conversation_key(event.get("channel"), thread_ts or event.get("ts"))
+        say = self.queued_say(say, event.get("channel"), thread_ts, merge_key=conversation)
+
         try:
             text = event.get("text", "")
-            logger.info(f"Received message: {text}")
+            log_payload(logger, "Received message: %s", text)
 
             if not text:
                 say("Received an empty message. I'm sorry, I can't help with that.")
                 return
 
             if not self.aws_session:
+                if health_state.check_status("aws_role") is None:
+                    say("I'm still starting up. Please try again in a few seconds.")
+                    return
                 logger.error("AWS session not set")
                 say("I'm sorry, I'm not properly configured to answer questions at the moment. check the logs for more details")
                 return
             
             # Remove bot mention from the text
             text = text.replace(f"<@{self.bot_user_id}>", "").strip()
-            
+
+            history = self.conversations.history(conversation)
+            if history[0] or history[1]:
+                self.answer_follow_up(conversation, text, history, say, event)
+                return
+
+            # HR-curated answers are authoritative, so a confident match skips Bedrock entirely
+            with timer("qa_index.lookup"):
+                indexed_answer = qa_index.lookup(text)
+            if indexed_answer is not None:
+                logger.info("Responding with curated Q&A answer")
+                say(indexed_answer)
+                self.conversations.record(conversation, text, indexed_answer)
+                return
+
+            cache_key = normalize_question(text, self.bot_user_id)
+            with timer("answer_cache.lookup"):
+                cached_response = answer_cache.get(cache_key)
+            if self.answer_warmer is not None:
+                self.answer_warmer.observe(cache_key, text, cached_response is not None)
+            if cached_response is not None:
+                logger.info("Responding with cached knowledge base answer")
+                say(cached_response)
+                self.conversations.record(conversation, text, cached_response)
+                return
+
+            # The KB already said it cannot answer this; skip Bedrock and join the pending HR escalation
+            with timer("unanswerable_cache.lookup"):
+                known_unanswerable = unanswerable_cache.get(cache_key) is not None
+            if known_unanswerable:
+                logger.info("Question is known to be unanswerable, adding the asker to the HR escalation")
+                self.notify_hr_with_question(text, say, event.get("user"), event.get("channel"))
+                return
+
             #query the knowledge base
-            kb_response, valid = query_bedrock_kb(self.aws_session, text)
-            logger.info(f"Knowledge base response: {kb_response}")
-            if not valid or not kb_response.strip() or kb_response == "Sorry, I am unable to assist you with this request.":
+            # Taken before the query, so an answer from before a KB change is not cached after it
+            answer_generation = answer_cache.generation()
+            unanswerable_generation = unanswerable_cache.generation()
+            # Identical questions asked at the same time share one Bedrock call
+            try:
+                kb_response, valid = kb_flight.do(cache_key, query_bedrock_kb, self.aws_session, text)
+            except BedrockThrottledError:
+                # A throttle says nothing about whether the KB knows the answer, so HR is not bothered
+                say("I'm handling a lot of questions right now. Please try again in a minute.")
+                return
+            except BedrockCallError:
+                say("I'm having trouble reaching the knowledge base right now. Please try again shortly.")
+                return
+            log_payload(logger, "Knowledge base response: %s", kb_response)
+            if not valid or not kb_response.strip() or kb_response == UNABLE_TO_ASSIST:
                 logger.info("No valid response from knowledge base, notifying HR")
-                self.notify_hr_with_question(text, say)
+                if valid:
+                    # Only a real "don't know" is remembered; a malformed response may work next time
+                    unanswerable_cache.put(cache_key, True, unanswerable_generation)
+                self.notify_hr_with_question(text, say, event.get("user"), event.get("channel"))
             else:
-                logger.info(f"Responding with knowledge base answer: {kb_response}")
+                logger.info("Responding with knowledge base answer")
+                answer_cache.put(cache_key, kb_response, answer_generation)
                 say(kb_response)
+                self.conversations.record(conversation, text, kb_response)
 
         
         except Exception as e:
-            logger.error(f"Error in handle_message: {str(e)}", exc_info=True)
+            logger.error("Error in handle_message: %s", e, exc_info=True)
             say("I'm sorry, I encountered an error while processing your message.")
 
 
-    def notify_hr_with_question(self, user_question, say):
+    def answer_follow_up(self, conversation, text, history, say, event):
+        """
+        Answers a question asked in a thread with earlier turns.
+
+        The answer depends on the conversation, so the curated index and the
+        answer caches are skipped and nothing is cached. The KB sees the
+        conversation through its Bedrock session, or through the history in
+        retrieve_then_generate mode.
+        """
+        session_id = self.conversations.kb_session_id(conversation)
+        try:
+            kb_response, valid, session_id = kb_flight.do(
+                f"{conversation}|{normalize_question(text, self.bot_user_id)}",
+                query_bedrock_kb_in_session, self.aws_session, text, session_id, history
+            )
+        except BedrockThrottledError:
+            say("I'm handling a lot of questions right now. Please try again in a minute.")
+            return
+        except BedrockCallError:
+            say("I'm having trouble reaching the knowledge base right now. Please try again shortly.")
+            return
+        log_payload(logger, "Knowledge base response: %s", kb_response)
+        if not valid or not kb_response.strip() or kb_response == UNABLE_TO_ASSIST:
+            logger.info("No valid response from knowledge base for a follow-up, notifying HR")
+            # HR needs the question the follow-up refers to
+            question = f"{history[1][-1][0]} (follow-up: {text})" if history[1] else text
+            self.notify_hr_with_question(question, say, event.get("user"), event.get("channel"))
+            return
+        logger.info("Responding with knowledge base answer to a follow-up")
+        say(kb_response)
+        self.conversations.record(conversation, text, kb_response, session_id)
+
+    def summarize_with_claude(self, summary, turns):
+        """
+        Conversation summarizer for CONVERSATION_SUMMARIZER=claude; runs after the reply has been queued.
+        """
+        transcript = "\n".join(f"Q: {question}\nA: {answer}" for question, answer in turns)
+        messages = [
+            {"role": "system", "content": "Summarize this HR Q&A thread in at most five short bullet points, "
+                                          "keeping facts the employee may ask a follow-up about."},
+            {"role": "user", "content": f"{summary}\n{transcript}".strip()},
+        ]
+        # complete_claude raises on failure, unlike query_claude, so an error never becomes the summary
+        response_body = complete_claude(get_bedrock_client(self.aws_session), json.dumps(messages))
+        if not response_body.get('content'):
+            raise ValueError("Claude returned an empty summary")
+        return response_body['content'][0]['text']
+
+    def respond_streaming(self, command, messages, respond):
+        """
+        Streams a Claude answer into the ephemeral /use_claude reply.
+
+        A placeholder is posted through the command's response_url and then
+        replaced (replace_original) as text arrives, so the answer is only
+        visible to the user who asked, as with respond(). Slack takes at most
+        RESPONSE_URL_MAX_USES calls per response_url, which bounds the number
+        of intermediate updates; they are also at least stream_update_interval
+        apart, and none is sent while the previous one is still queued or
+        waiting out a 429. A failed Slack update stops further intermediate
+        updates but not the stream. If the stream fails before producing any
+        text, the non-streaming query_claude result is used instead; if it
+        fails later, the partial text is delivered marked as incomplete.
+
+        :param command: The slash command payload
+        :param messages: JSON-formatted string of messages
+        :param respond: Bolt's respond for the command
+        :return: The answer text, or None if the caller should fall back to respond()
+        """
+        replace = self.queued_respond(respond, command.get("response_url"), replace_original=True)
+        try:
+            replace("_Thinking..._").result(timeout=SLACK_SEND_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.warning("Could not post streaming placeholder, falling back to respond(): %s", e)
+            return None
+
+        # The placeholder and the final answer each use one call
+        updates_left = RESPONSE_URL_MAX_USES - 2
+        pending = None
+        text = ""
+        interrupted = False
+        last_update = time.monotonic()
+        try:
+            for delta in stream_claude(self.aws_session, messages):
+                text += delta
+                now = time.monotonic()
+                if updates_left <= 0 or now - last_update < self.stream_update_interval:
+                    continue
+                if pending is not None:
+                    if not pending.done():
+                        # Still queued or rate limited; the next update carries this text too
+                        continue
+                    if pending.exception() is not None:
+                        logger.warning("Streaming update failed, sending only the final answer: %s", pending.exception())
+                        updates_left = 0
+                        continue
+                pending = replace(text)
+                updates_left -= 1
+                last_update = now
+        except Exception as e:
+            logger.error("Error while streaming Claude response: %s", e, exc_info=True)
+            if text:
+                interrupted = True
+            else:
+                text = query_claude(self.aws_session, messages)
+
+        if not text:
+            text = "I was unable to generate a response. Please try again or reach out to HR."
+        elif interrupted:
+            text += STREAM_INTERRUPTED_NOTICE
+        try:
+            replace(text).result(timeout=SLACK_SEND_TIMEOUT_SECONDS)
+        except Exception as e:
+            logger.error("Failed to deliver the streamed Claude answer: %s", e, exc_info=True)
+        return text
+
+    def queued_say(self, say, channel, thread_ts=None, merge_key=None):
+        """
+        Wraps Bolt's say so replies are sent by the outbox; the wrapper returns the delivery future.
+
+        :param thread_ts: Replies go to this thread, for messages that were asked in one
+        :param merge_key: The conversation the replies belong to; only replies with the same key are merged
+        """
+        if thread_ts:
+            say = functools.partial(say, thread_ts=thread_ts)
+        timed_say = timed("slack.say")(say)
+
+        def send(text):
+            return self.outbox.submit("chat.postMessage", channel, timed_say, text, merge_key=merge_key)
+        return send
+
+    def queued_respond(self, respond, response_url, replace_original=False):
+        """
+        Wraps Bolt's respond like queued_say. response_url calls report 429 in the
+        response rather than raising, so that is turned into SlackRateLimited here.
+
+        :param replace_original: Each text replaces the previous reply instead of adding one; never merged
+        """
+        timed_respond = timed("slack.respond")(respond)
+
+        def deliver(text):
+            if replace_original:
+                response = timed_respond(text=text, replace_original=True)
+            else:
+                response = timed_respond(text)
+            if getattr(response, "status_code", None) == 429:
+                raise SlackRateLimited(float((response.headers or {}).get("Retry-After", 1)))
+            return response
+
+        def send(text):
+            return self.outbox.submit("response_url", response_url, deliver, text,
+                                      merge_key=None if replace_original else response_url)
+        return send
+
+    def post_to_hr_channel(self, text):
+        hr_channel_id = os.getenv('HR_CHANNEL_ID')
+        if not hr_channel_id:
+            logger.error("HR_CHANNEL_ID environment variable is not set")
+            return
+        self.outbox.submit("chat.postMessage", hr_channel_id,
+                           lambda text: self.client.chat_postMessage(channel=hr_channel_id, text=text), text)
+
+    def post_message(self, channel, text):
+        # The digest's ts is kept for later edits, so this waits for delivery
+        return self.outbox.submit(
+            "chat.postMessage", channel, lambda text: self.client.chat_postMessage(channel=channel, text=text), text
+        ).result(timeout=SLACK_SEND_TIMEOUT_SECONDS)["ts"]
+
+    def update_message(self, channel, ts, text):
+        self.outbox.submit(
+            "chat.update", channel, lambda text: self.client.chat_update(channel=channel, ts=ts, text=text), text
+        ).result(timeout=SLACK_SEND_TIMEOUT_SECONDS)
+
+    def notify_hr_with_question(self, user_question, say, user=None, channel=None):
+        """
+        Queues an unanswered question for the next HR digest.
+
+        Similar questions are grouped so HR gets one post per topic with the
+        number of employees asking, and everyone in the group receives the
+        answer once HR adds it with /add_answer.
+        """
         try:
-            # Send message to HR channel using Slack Bolt client
             hr_channel_id = os.getenv('HR_CHANNEL_ID')
             if not hr_channel_id:
                 logger.error("HR_CHANNEL_ID environment variable is not set")
                 say("I'm unable to forward your question to HR because the HR channel is not configured.")
                 return
             
-            user_question = user_question.replace(f'<@{self.bot_user_id}>', '')
-            try:
-                self.app.client.chat_postMessage(
-                    channel=hr_channel_id,
-                    text=f"A new employee question could not be answered by the KB:\n\n"
-                         f"*Question:* {user_question}\n\n"
-                         f"Please provide an answer and use the /add_answer command to update the KB."
-                )
-                say("I'm not sure about that, but I've sent your question to HR. They'll respond soon!")
-            except Exception as e:
-                logger.error(f"Failed to send message to HR channel: {str(e)}", exc_info=True)
-                say("I'm sorry, I encountered an error while trying to notify HR. Please contact support if the issue persists.")
-
+            user_question = user_question.replace(f'<@{self.bot_user_id}>', '').strip()
+            with timer("slack.notify_hr"):
+                waiting = self.escalations.escalate(user_question, user, channel)
+            if waiting > 1:
+                say(f"I'm not sure about that, but HR already has this question from {waiting - 1} other employee(s). "
+                    f"I'll send you their answer as soon as they respond!")
+            else:
+                say("I'm not sure about that, but I've sent your question to HR. I'll send you their answer as soon as they respond!")
 
         except Exception as e:
-            logger.error(f"Unexpected error in notify_hr_with_question: {str(e)}", exc_info=True)
+            logger.error("Unexpected error in notify_hr_with_question: %s", e, exc_info=True)
             say("I'm sorry, I encountered an unexpected error while trying to notify HR.")
 
-
-
     def start(self):
         try:
             logger.info("Starting Socket Mode handler")
             self.socket_mode_handler.start()
         except Exception as e:
-            logger.error(f"Failed to start Socket Mode handler: {str(e)}", exc_info=True)
+            logger.error("Failed to start Socket Mode handler: %s", e, exc_info=True)
+            raise SystemExit("Critical error: Failed to start Slack Socket Mode handler.")
+
+    def connect(self):
+        """
+        Opens the Socket Mode connection without blocking the calling thread.
+        """
+        try:
+            logger.info("Connecting Socket Mode handler")
+            self.socket_mode_handler.connect()
+        except Exception as e:
+            logger.error("Failed to connect Socket Mode handler: %s", e, exc_info=True)
             raise SystemExit("Critical error: Failed to start Slack Socket Mode handler.")
     
+    def shutdown(self, timeout=None):
+        """
+        Stops taking events, then lets queued messages finish and their replies go out.
+
+        :param timeout: Seconds to wait for queued messages; None waits for all of them
+        """
+        try:
+            self.socket_mode_handler.close()
+        except Exception as e:
+            logger.warning("Failed to close Socket Mode handler: %s", e)
+        self.drain(timeout)
+
+    def drain(self, timeout=None):
+        """
+        The part of shutdown() after Slack stops delivering: finishes queued messages and flushes replies.
+        """
+        drained = threading.Thread(target=self.dispatcher.shutdown, name="dispatch-drain", daemon=True)
+        drained.start()
+        drained.join(timeout)
+        if drained.is_alive():
+            logger.warning("Messages still in progress after %ss, shutting down anyway", timeout)
+        self.escalations.stop(timeout=SLACK_SEND_TIMEOUT_SECONDS)
+        self.outbox.stop(wait=not drained.is_alive())
+        if answer_cache.store is not None:
+            answer_cache.store.flush()
+        logger.info("Slack handler stopped")
+
     def test_bedrock_access(self):
+        """
+        Probes the knowledge base with a single-result retrieve call.
+
+        This checks credentials, permissions and that the KB has content without
+        paying for an LLM generation.
+        """
         if not self.aws_session:
             logger.error("AWS session not set")
             return False
         try:
-            client = self.aws_session.client('bedrock-agent-runtime')
+            client = get_client(self.aws_session, 'bedrock-agent-runtime')
             knowledge_base_id = os.getenv('BEDROCK_KB_ID')
-            model_arn = os.getenv('BEDROCK_MODEL_ARN')
 
-            response = client.retrieve_and_generate(
-                input={
-                    'text': 'Test query'
+            response = client.retrieve(
+                knowledgeBaseId=knowledge_base_id,
+                retrievalQuery={
+                    'text': 'vacation days'
                 },
-                retrieveAndGenerateConfiguration={
-                    'type': 'KNOWLEDGE_BASE',
-                    'knowledgeBaseConfiguration': {
-                        'knowledgeBaseId': knowledge_base_id,
-                        'modelArn': model_arn
+                retrievalConfiguration={
+                    'vectorSearchConfiguration': {
+                        'numberOfResults': 1
                     }
                 }
             )
-            logger.info(f"Successfully accessed Bedrock knowledge base: {response}")
+            if response.get('retrievalResults'):
+                logger.info("Successfully accessed Bedrock knowledge base")
+            else:
+                logger.warning("Bedrock knowledge base is reachable but returned no results. It might be empty.")
             return True
-        except client.exceptions.ClientError as e:
-            logger.error(f"Client error while accessing Bedrock knowledge base: {str(e)}", exc_info=True)
-            return False
-        except client.exceptions.InvalidParameterException as e:
-            logger.error(f"Invalid parameters provided: {str(e)}. Please verify the knowledge base ID and model ARN.", exc_info=True)
+        except client.exceptions.ValidationException as e:
+            logger.error("Invalid parameters provided: %s. Please verify the knowledge base ID.", e, exc_info=True)
             return False
         except client.exceptions.AccessDeniedException as e:
-            logger.error(f"Access denied: {str(e)}. Please check your AWS permissions.", exc_info=True)
+            logger.error("Access denied: %s. Please check your AWS permissions.", e, exc_info=True)
+            return False
+        except client.exceptions.ClientError as e:
+            logger.error("Client error while accessing Bedrock knowledge base: %s", e, exc_info=True)
             return False
         except Exception as e:
-            logger.error(f"Failed to access Bedrock knowledge base: {str(e)}", exc_info=True)
+            logger.error("Failed to access Bedrock knowledge base: %s", e, exc_info=True)
             return False
@@ -0,0 +1,340 @@
+# slack_outbox.py
+
+import os
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from slack_sdk.errors import SlackApiError
+from metrics import observe
+
+logger = logging.getLogger(__name__)
+
+# (tokens per second, burst) per Slack method; chat.postMessage is also limited per channel below.
+# Slack's tiers are per workspace per minute, e.g. Tier 3 is ~50/min and chat.postMessage allows
+# short bursts above one message per second per channel.
+DEFAULT_METHOD_LIMITS = {
+    "chat.postMessage": (10.0, 20),
+    "chat.update": (0.8, 10),
+    "response_url": (5.0, 20),
+}
+
+
+class SlackRateLimited(Exception):
+    """
+    Raised by send functions when Slack answered 429; retry_after is in seconds.
+    """
+
+    def __init__(self, retry_after, message="Slack rate limited the request"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SlackOutboxFull(Exception):
+    """
+    The outbox queue was full and the message was dropped.
+    """
+
+
+def retry_after_from(error):
+    """
+    :return: Seconds to wait if error is a Slack rate limit, otherwise None
+    """
+    if isinstance(error, SlackRateLimited):
+        return error.retry_after
+    if isinstance(error, SlackApiError) and error.response is not None:
+        if error.response.status_code == 429 or error.response.get("error") == "ratelimited":
+            headers = error.response.headers or {}
+            value = headers.get("Retry-After") or headers.get("retry-after") or 1
+            try:
+                return float(value[0] if isinstance(value, list) else value)
+            except (TypeError, ValueError):
+                return 1.0
+    return None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+
+    def wait_time(self, now):
+        """
+        :return: Seconds until a token is available, 0 if one is available now
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, until):
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+
+
+class _Message:
+    __slots__ = ("method", "channel", "merge_key", "send_fn", "texts", "futures",
+                 "enqueued_at", "attempts", "not_before")
+
+    def __init__(self, method, channel, merge_key, send_fn, text, future, now):
+        self.method = method
+        self.channel = channel
+        self.merge_key = merge_key
+        self.send_fn = send_fn
+        self.texts = [text]
+        self.futures = [future]
+        self.enqueued_at = now
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class SlackOutbox:
+    """
+    Sends Slack messages from a background pool within Slack's rate limits.
+
+    Every message waits for a token from its method's bucket and its
+    channel's bucket, and a 429 pauses the affected bucket for the
+    Retry-After period before the message is retried. Messages whose channel
+    is blocked do not hold up messages to other channels. A short text queued
+    behind a still-unsent text with the same method, channel, merge_key and
+    send function (so the same originating event) is merged into it, up to
+    merge_max_chars, so a burst of replies to one question becomes one post; nothing is delayed just to wait for something
+    to merge with. Messages without a merge_key are always sent alone, so
+    replies to different users are never combined.
+
+    submit() returns a Future that resolves to the send function's result.
+    """
+
+    def __init__(self, workers=4, max_queue=1000, channel_rate=1.0, channel_burst=3,
+                 method_limits=None, merge_max_chars=3000, max_attempts=5, clock=time.monotonic):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.method_limits = dict(DEFAULT_METHOD_LIMITS if method_limits is None else method_limits)
+        self.merge_max_chars = merge_max_chars
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._method_buckets = {}
+        self._channel_buckets = {}
+        self._in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slack-outbox")
+        self._thread = None
+        self._stopped = False
+        self.submitted = 0
+        self.sent = 0
+        self.merged = 0
+        self.rate_limited = 0
+        self.retried = 0
+        self.dropped_full = 0
+        self.dropped_attempts = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls):
+        method_limits = DEFAULT_METHOD_LIMITS
+        raw = os.getenv('SLACK_OUTBOX_METHOD_LIMITS')
+        if raw:
+            try:
+                method_limits = {method: tuple(limit) for method, limit in json.loads(raw).items()}
+            except (ValueError, TypeError) as e:
+                logger.error("Invalid SLACK_OUTBOX_METHOD_LIMITS, using defaults: %s", e)
+        return cls(
+            workers=int(os.getenv('SLACK_OUTBOX_WORKERS', '4')),
+            max_queue=int(os.getenv('SLACK_OUTBOX_MAX_QUEUE', '1000')),
+            channel_rate=float(os.getenv('SLACK_OUTBOX_CHANNEL_RATE', '1')),
+            channel_burst=int(os.getenv('SLACK_OUTBOX_CHANNEL_BURST', '3')),
+            method_limits=method_limits,
+            merge_max_chars=int(os.getenv('SLACK_OUTBOX_MERGE_MAX_CHARS', '3000')),
+            max_attempts=int(os.getenv('SLACK_OUTBOX_MAX_ATTEMPTS', '5')),
+        )
+
+    def submit(self, method, channel, send_fn, text, merge_key=None):
+        """
+        Queues a message.
+
+        :param method: Slack method name used for rate limiting, e.g. 'chat.postMessage' or 'response_url'
+        :param channel: Channel ID (or response_url) the message goes to, used for per-channel limits
+        :param send_fn: Callable(text) that performs the call; raise SlackRateLimited or SlackApiError on 429
+        :param merge_key: Identifies the question or thread the message answers, e.g. the event's thread;
+            None for messages that must be sent on their own, such as a post whose ts is kept
+        :return: A Future resolving to send_fn's result
+        """
+        future = Future()
+        now = self.clock()
+        with self._cond:
+            if merge_key is not None:
+                for message in reversed(self._pending):
+                    if (message.channel != channel or message.merge_key != merge_key or message.method != method
+                            or message.send_fn is not send_fn):
+                        continue
+                    # Only the newest queued message with this key may take more text, to keep order
+                    if sum(len(t) for t in message.texts) + len(text) <= self.merge_max_chars:
+                        message.texts.append(text)
+                        message.futures.append(future)
+                        self.merged += 1
+                        self.submitted += 1
+                        return future
+                    break
+            if len(self._pending) >= self.max_queue:
+                self.dropped_full += 1
+                logger.warning("Slack outbox full (%s queued), dropping message to %s", len(self._pending), channel)
+                future.set_exception(SlackOutboxFull(f"Slack outbox full, message to {channel} dropped"))
+                return future
+            self._pending.append(_Message(method, channel, merge_key, send_fn, text, future, now))
+            self.submitted += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        return future
+
+    def _bucket(self, buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst, self.clock)
+        return bucket
+
+    def _buckets_for(self, message):
+        rate, burst = self.method_limits.get(message.method, (None, None))
+        method_bucket = self._bucket(self._method_buckets, message.method, rate, burst) if rate else None
+        channel_bucket = self._bucket(self._channel_buckets, (message.method, message.channel),
+                                      self.channel_rate, self.channel_burst)
+        return method_bucket, channel_bucket
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slack-outbox-scheduler", daemon=True)
+            self._thread.start()
+
+    def _take_ready_locked(self):
+        """
+        :return: (message, None) for the first message that may be sent now, or (None, seconds to wait)
+        """
+        now = self.clock()
+        next_wait = None
+        blocked_channels = set()
+        for index, message in enumerate(self._pending):
+            key = (message.method, message.channel)
+            if key in blocked_channels:
+                continue
+            wait = max(0.0, message.not_before - now)
+            method_bucket, channel_bucket = self._buckets_for(message)
+            for bucket in (method_bucket, channel_bucket):
+                if bucket is not None:
+                    wait = max(wait, bucket.wait_time(now))
+            if wait == 0.0:
+                del self._pending[index]
+                for bucket in (method_bucket, channel_bucket):
+                    if bucket is not None:
+                        bucket.take()
+                return message, None
+            # Later messages to the same channel must not overtake this one
+            blocked_channels.add(key)
+            next_wait = wait if next_wait is None else min(next_wait, wait)
+        return None, next_wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped and not self._pending:
+                        self._executor.shutdown(wait=False)
+                        return
+                    message = None
+                    if self._in_flight < self.workers:
+                        message, wait = self._take_ready_locked()
+                    else:
+                        wait = None
+                    if message is not None:
+                        self._in_flight += 1
+                        break
+                    self._cond.wait(wait)
+            self._executor.submit(self._send, message)
+
+    def _send(self, message):
+        text = "\n\n".join(message.texts)
+        started = self.clock()
+        if message.attempts == 0:
+            observe("slack.outbox.queue_wait", started - message.enqueued_at)
+        message.attempts += 1
+        try:
+            result = message.send_fn(text)
+        except Exception as e:
+            retry_after = retry_after_from(e)
+            self._finish_failed(message, e, retry_after)
+            return
+        observe("slack.outbox.send", self.clock() - started)
+        with self._cond:
+            self._in_flight -= 1
+            self.sent += 1
+            self._cond.notify_all()
+        for future in message.futures:
+            future.set_result(result)
+
+    def _finish_failed(self, message, error, retry_after):
+        with self._cond:
+            self._in_flight -= 1
+            if retry_after is not None:
+                self.rate_limited += 1
+                until = self.clock() + retry_after
+                method_bucket, channel_bucket = self._buckets_for(message)
+                # A method-level 429 is workspace wide; pause both so nothing else piles into it
+                for bucket in (method_bucket, channel_bucket):
+                    if bucket is not None:
+                        bucket.pause(until)
+                if message.attempts < self.max_attempts:
+                    self.retried += 1
+                    message.not_before = until
+                    self._pending.appendleft(message)
+                    self._cond.notify_all()
+                    logger.warning("Slack rate limited %s, retrying in %.1fs", message.method, retry_after)
+                    return
+                self.dropped_attempts += 1
+            else:
+                self.failed += 1
+            self._cond.notify_all()
+        logger.error("Failed to send Slack %s to %s: %s", message.method, message.channel, error)
+        for future in message.futures:
+            future.set_exception(error)
+
+    def stop(self, wait=True):
+        """
+        Shuts the sender pool down once queued messages have been sent; with wait, blocks until then.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is None:
+            self._executor.shutdown(wait=wait)
+        elif wait:
+            thread.join()
+            self._executor.shutdown(wait=True)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._pending),
+                "in_flight": self._in_flight,
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "merged": self.merged,
+                "rate_limited": self.rate_limited,
+                "retried": self.retried,
+                "dropped_full": self.dropped_full,
+                "dropped_attempts": self.dropped_attempts,
+                "failed": self.failed,
+            }
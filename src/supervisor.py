@@ -0,0 +1,239 @@
+# supervisor.py
+
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def worker_environment(index, base_env=None):
+    """
+    Builds the environment for one worker process.
+
+    Workers share de-duplication, the answer store, HR escalations, thread
+    and /use_claude conversations and the ingestion lease through SQLite
+    files on this host, since Slack may deliver a retry, a repeat question,
+    a follow-up or /add_answer to a different connection than the original.
+    Each worker gets its own metrics port and question log.
+
+    The Q&A index and the unanswerable-question cache stay per worker; both
+    are reloaded or cleared when another worker changes the answer store.
+
+    :param index: The worker's slot, starting at 0
+    :param base_env: The environment to start from, defaults to os.environ
+    :return: A new environment dict
+    """
+    env = dict(os.environ if base_env is None else base_env)
+    env["BOT_WORKER_INDEX"] = str(index)
+    if env.get("DEDUPE_BACKEND", "").lower() == "memory":
+        logger.warning("DEDUPE_BACKEND=memory is per process; redeliveries reaching another worker will be processed twice")
+    env.setdefault("DEDUPE_BACKEND", "sqlite")
+    if env.get("HR_ESCALATION_BACKEND", "").lower() == "memory":
+        logger.warning("HR_ESCALATION_BACKEND=memory is per process; /add_answer #N will only find questions escalated on the same worker")
+    if env.get("CONVERSATION_BACKEND", "").lower() == "memory":
+        logger.warning("CONVERSATION_BACKEND=memory is per process; follow-ups reaching another worker "
+                       "will be answered without the earlier turns")
+    env.setdefault("ANSWER_STORE_PATH", "/tmp/slackbot-answers.sqlite3")
+    env.setdefault("HR_ESCALATION_BACKEND", "sqlite")
+    env.setdefault("CONVERSATION_BACKEND", "sqlite")
+    env.setdefault("INGESTION_LEASE_PATH", "/tmp/slackbot-ingestion-lease.sqlite3")
+    metrics_port = int(env.get("METRICS_PORT", "9100"))
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + 1 + index)
+    if env.get("PREWARM_LOG_PATH"):
+        env["PREWARM_LOG_PATH"] = f"{env['PREWARM_LOG_PATH']}.{index}"
+    return env
+
+
+def spawn_server_worker(index, argv):
+    """
+    Starts server.py as a single-process worker.
+
+    :param argv: Command line options forwarded to the worker
+    :return: The subprocess.Popen for the worker
+    """
+    return subprocess.Popen(
+        [sys.executable, SERVER_PATH, *argv, "--workers", "1"],
+        env=worker_environment(index),
+    )
+
+
+class _Slot:
+    __slots__ = ("index", "process", "started_at", "restart_at", "failures", "restarts")
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.started_at = None
+        self.restart_at = 0.0
+        self.failures = 0
+        self.restarts = 0
+
+
+class WorkerSupervisor:
+    """
+    Keeps `workers` worker processes running.
+
+    spawn_fn(index) starts the worker for a slot and returns a
+    subprocess.Popen (or anything with poll/send_signal/kill/wait/pid). A
+    worker that exits is started again after a backoff that doubles with
+    each consecutive failure, from backoff_initial up to backoff_max; a
+    worker that stayed up for stable_seconds starts over at backoff_initial.
+
+    After stop() or a SIGTERM, every worker gets SIGTERM and up to
+    shutdown_timeout to drain and exit before the rest are killed. With restart_clean_exits
+    False a worker that exits with status 0 is not restarted, and run()
+    returns once every worker has finished; the benchmarks use this.
+    """
+
+    POLL_SECONDS = 0.2
+
+    def __init__(self, spawn_fn, workers=2, backoff_initial=1.0, backoff_max=60.0, stable_seconds=60.0,
+                 shutdown_timeout=30.0, restart_clean_exits=True, clock=time.monotonic):
+        self.spawn_fn = spawn_fn
+        self.workers = workers
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_seconds = stable_seconds
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_clean_exits = restart_clean_exits
+        self.clock = clock
+        self._slots = [_Slot(index) for index in range(workers)]
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.exits = 0
+        self.crashes = 0
+        self.spawn_failures = 0
+
+    @classmethod
+    def from_env(cls, spawn_fn, workers):
+        return cls(
+            spawn_fn,
+            workers=workers,
+            backoff_initial=float(os.getenv('WORKER_RESTART_BACKOFF_SECONDS', '1')),
+            backoff_max=float(os.getenv('WORKER_RESTART_BACKOFF_MAX_SECONDS', '60')),
+            stable_seconds=float(os.getenv('WORKER_STABLE_SECONDS', '60')),
+            shutdown_timeout=float(os.getenv('WORKER_SHUTDOWN_TIMEOUT_SECONDS', '30')),
+        )
+
+    def install_signal_handlers(self):
+        def handle(sig, frame):
+            logger.info("Supervisor received signal %s, stopping workers", sig)
+            self._stopping.set()
+        signal.signal(signal.SIGTERM, handle)
+        signal.signal(signal.SIGINT, handle)
+
+    def _start(self, slot):
+        try:
+            slot.process = self.spawn_fn(slot.index)
+        except Exception as e:
+            self.spawn_failures += 1
+            logger.error("Failed to start worker %s: %s", slot.index, e, exc_info=True)
+            slot.process = None
+            self._schedule_restart(slot, self.clock())
+            return
+        slot.started_at = self.clock()
+        slot.restart_at = 0.0
+        logger.info("Started worker %s (pid %s)", slot.index, slot.process.pid)
+
+    def _schedule_restart(self, slot, now):
+        if slot.started_at is not None and now - slot.started_at >= self.stable_seconds:
+            slot.failures = 0
+        delay = min(self.backoff_max, self.backoff_initial * (2 ** slot.failures))
+        slot.failures += 1
+        slot.restart_at = now + delay
+        return delay
+
+    def check(self):
+        """
+        Reaps exited workers and starts the ones whose backoff has passed.
+
+        :return: The number of workers running or waiting to restart
+        """
+        now = self.clock()
+        remaining = 0
+        with self._lock:
+            for slot in self._slots:
+                if slot.process is not None:
+                    code = slot.process.poll()
+                    if code is None:
+                        remaining += 1
+                        continue
+                    slot.process = None
+                    self.exits += 1
+                    if self._stopping.is_set():
+                        slot.restart_at = None
+                        continue
+                    if code == 0 and not self.restart_clean_exits:
+                        logger.info("Worker %s finished", slot.index)
+                        slot.restart_at = None
+                        continue
+                    if code != 0:
+                        self.crashes += 1
+                    delay = self._schedule_restart(slot, now)
+                    logger.warning("Worker %s exited with status %s, restarting in %.1fs", slot.index, code, delay)
+                if slot.restart_at is None:
+                    continue
+                remaining += 1
+                if now >= slot.restart_at:
+                    if slot.started_at is not None:
+                        slot.restarts += 1
+                    self._start(slot)
+        return remaining
+
+    def run(self):
+        """
+        Starts the workers and supervises them until stop() or a signal; then shuts them down.
+        """
+        logger.info("Supervisor starting %s workers", self.workers)
+        with self._lock:
+            for slot in self._slots:
+                self._start(slot)
+        while not self._stopping.is_set():
+            if not self.check():
+                break
+            self._stopping.wait(self.POLL_SECONDS)
+        self.shutdown()
+
+    def stop(self):
+        self._stopping.set()
+
+    def shutdown(self):
+        self._stopping.set()
+        with self._lock:
+            running = [slot.process for slot in self._slots if slot.process is not None and slot.process.poll() is None]
+            for slot in self._slots:
+                slot.restart_at = None
+        for process in running:
+            try:
+                process.send_signal(signal.SIGTERM)
+            except OSError:
+                pass
+        deadline = self.clock() + self.shutdown_timeout
+        for process in running:
+            try:
+                process.wait(timeout=max(0.0, deadline - self.clock()))
+            except subprocess.TimeoutExpired:
+                logger.warning("Worker pid %s did not stop in %ss, killing it", process.pid, self.shutdown_timeout)
+                process.kill()
+                process.wait()
+        logger.info("Supervisor stopped %s workers", len(running))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": sum(1 for slot in self._slots if slot.process is not None and slot.process.poll() is None),
+                "exits": self.exits,
+                "crashes": self.crashes,
+                "restarts": sum(slot.restarts for slot in self._slots),
+                "spawn_failures": self.spawn_failures,
+                "pids": [slot.process.pid if slot.process is not None else None for slot in self._slots],
+            }
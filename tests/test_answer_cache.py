@@ -0,0 +1,65 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import kb_events
+from answer_cache import AnswerCache, answer_cache
+from normalize import normalize_question
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNormalizeQuestion(unittest.TestCase):
+    def test_strips_mentions_case_and_punctuation(self):
+        self.assertEqual(
+            normalize_question("<@U123ABC>  How many   Vacation days?!", "U123ABC"),
+            "how many vacation days",
+        )
+
+    def test_empty(self):
+        self.assertEqual(normalize_question(None), "")
+
+
+class TestAnswerCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = AnswerCache(ttl_seconds=10, clock=clock)
+        cache.put("a", "1")
+        clock.now = 11
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_cleared_on_kb_change(self):
+        answer_cache.put("how many vacation days", "20")
+        kb_events.publish("answer_saved")
+        self.assertIsNone(answer_cache.get("how many vacation days"))
+
+    def test_put_from_before_clear_is_dropped(self):
+        cache = AnswerCache()
+        generation = cache.generation()
+        cache.clear()
+        cache.put("a", "stale", generation)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", "fresh", cache.generation())
+        self.assertEqual(cache.get("a"), "fresh")
+        self.assertEqual(cache.stats()["stale_puts"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
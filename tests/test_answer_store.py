@@ -0,0 +1,93 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+from answer_cache import AnswerCache
+from answer_store import SqliteAnswerStore
+
+
+class TestSqliteAnswerStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "answers.sqlite3")
+
+    def test_answers_survive_restart(self):
+        cache = AnswerCache(store=SqliteAnswerStore(self.path))
+        cache.put("how many vacation days", "20 days")
+        cache.store.flush()
+
+        restarted = AnswerCache(store=SqliteAnswerStore(self.path))
+        self.assertEqual(restarted.get("how many vacation days"), "20 days")
+        self.assertEqual(restarted.stats()["store_hits"], 1)
+        # Served from memory the second time
+        self.assertEqual(restarted.get("how many vacation days"), "20 days")
+        self.assertEqual(restarted.store.hits, 1)
+
+    def test_warm_loads_most_recent(self):
+        store = SqliteAnswerStore(self.path, clock=iter(range(1, 100)).__next__)
+        for i in range(5):
+            store.put(f"q{i}", f"a{i}")
+        store.flush()
+        cache = AnswerCache(max_entries=2, store=SqliteAnswerStore(self.path))
+        self.assertEqual(cache.warm(), 2)
+        self.assertEqual(len(cache), 2)
+        cache.store = None
+        self.assertEqual(cache.get("q4"), "a4")
+        self.assertIsNone(cache.get("q0"))
+
+    def test_kb_change_invalidates_older_generation(self):
+        cache = AnswerCache(store=SqliteAnswerStore(self.path))
+        cache.put("q", "old answer")
+        cache.store.flush()
+        other_process = SqliteAnswerStore(self.path)
+
+        cache.clear()
+        cache.store.flush()
+        self.assertIsNone(cache.get("q"))
+        self.assertIsNone(other_process.get("q"))
+        self.assertEqual(cache.store.size(), 0)
+
+    def test_poll_sees_generation_started_by_another_process(self):
+        cache = AnswerCache(store=SqliteAnswerStore(self.path))
+        other_process = AnswerCache(store=SqliteAnswerStore(self.path))
+        other_process.put("q", "old answer")
+        other_process.store.flush()
+        self.assertEqual(other_process.get("q"), "old answer")
+
+        cache.clear()
+        self.assertFalse(cache.store.poll_generation())
+        self.assertTrue(other_process.store.poll_generation())
+        self.assertFalse(other_process.store.poll_generation())
+        other_process.clear(new_generation=False)
+        self.assertIsNone(other_process.get("q"))
+        self.assertEqual(other_process.store.generation, cache.store.generation)
+
+    def test_answer_from_before_peer_change_is_dropped(self):
+        cache = AnswerCache(store=SqliteAnswerStore(self.path))
+        other_process = AnswerCache(store=SqliteAnswerStore(self.path))
+        generation = cache.generation()
+        # Another worker sees a KB change while this one is still querying
+        other_process.clear()
+        cache.put("q", "stale answer", generation)
+        cache.store.flush()
+        self.assertIsNone(other_process.get("q"))
+        self.assertEqual(cache.store.stats()["stale_writes"], 1)
+
+        cache.store.put("q", "fresh answer", cache.store.generation)
+        cache.store.flush()
+        self.assertEqual(other_process.get("q"), "fresh answer")
+
+    def test_eviction_caps_size(self):
+        store = SqliteAnswerStore(self.path, max_entries=10)
+        store.EVICT_EVERY = 5
+        for i in range(30):
+            store.put(f"q{i}", "a")
+        store.flush()
+        self.assertLessEqual(store.size(), 14)
+        self.assertGreater(store.evictions, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
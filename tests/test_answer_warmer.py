@@ -0,0 +1,104 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+import threading
+from answer_cache import AnswerCache
+from answer_warmer import AnswerWarmer, QuestionLog
+
+
+class TestQuestionLog(unittest.TestCase):
+    def test_ranks_by_frequency_and_decays(self):
+        log = QuestionLog(decay_factor=0.5)
+        for _ in range(3):
+            log.record("vacation days", "How many vacation days?")
+        log.record("parking", "Where do I park?")
+        self.assertEqual([key for key, _, _ in log.top(2)], ["vacation days", "parking"])
+        log.decay()
+        log.decay()
+        log.decay()
+        log.decay()
+        self.assertEqual([key for key, _, _ in log.top(2)], ["vacation days"])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "questions.json")
+            log = QuestionLog()
+            log.record("parking", "Where do I park?")
+            log.save(path)
+            restored = QuestionLog()
+            self.assertEqual(restored.load(path), 1)
+            self.assertEqual(restored.top(1), [("parking", "Where do I park?", 1.0)])
+
+
+class TestAnswerWarmer(unittest.TestCase):
+    def make_warmer(self, answers, **kwargs):
+        self.calls = []
+        lock = threading.Lock()
+
+        def answer_fn(key, question):
+            with lock:
+                self.calls.append(key)
+            return answers.get(key, ("", False))
+
+        self.cache = AnswerCache()
+        warmer = AnswerWarmer(object(), self.cache, answer_fn=answer_fn, **kwargs)
+        self.addCleanup(warmer.stop)
+        return warmer
+
+    def test_warms_top_questions_that_are_not_cached(self):
+        warmer = self.make_warmer({"a": ("answer a", True), "b": ("answer b", True)}, top_n=2)
+        for key, times in (("a", 3), ("b", 2), ("c", 1)):
+            for _ in range(times):
+                warmer.observe(key, key, cached=False)
+        self.cache.put("b", "already cached")
+
+        self.assertEqual(warmer.warm_once(), 1)
+        self.assertEqual(self.calls, ["a"])
+        self.assertEqual(self.cache.get("a"), "answer a")
+        self.assertEqual(warmer.stats()["skipped_cached"], 1)
+
+    def test_credits_latency_to_first_cached_ask(self):
+        warmer = self.make_warmer({"a": ("answer a", True)})
+        warmer.observe("a", "a", cached=False)
+        warmer.warm_once()
+        warmer.observe("a", "a", cached=True)
+        warmer.observe("a", "a", cached=True)
+        stats = warmer.stats()
+        self.assertEqual(stats["warm_hits"], 1)
+        self.assertGreaterEqual(stats["latency_saved_seconds"], 0.0)
+        self.assertEqual(stats["warmed_unused"], 0)
+
+    def test_token_budget_stops_run(self):
+        answers = {f"q{i}": ("x" * 400, True) for i in range(5)}
+        # Each call costs 100 context + 1 question + 100 answer tokens
+        warmer = self.make_warmer(answers, concurrency=1, token_budget=450, context_tokens=100)
+        for key in answers:
+            warmer.observe(key, key, cached=False)
+        self.assertEqual(warmer.warm_once(), 2)
+        self.assertEqual(warmer.stats()["budget_exhausted_runs"], 1)
+        self.assertEqual(warmer.stats()["tokens_spent"], 402)
+
+    def test_unanswerable_is_not_cached(self):
+        warmer = self.make_warmer({"a": ("Sorry, I am unable to assist you with this request.", True)})
+        warmer.observe("a", "a", cached=False)
+        self.assertEqual(warmer.warm_once(), 0)
+        self.assertFalse(self.cache.contains("a"))
+
+    def test_known_unanswerable_questions_are_not_requeried(self):
+        unanswerable = AnswerCache()
+        warmer = self.make_warmer({"a": ("Sorry, I am unable to assist you with this request.", True),
+                                   "b": ("answer b", True)}, unanswerable=unanswerable)
+        unanswerable.put("b", True)
+        for key in ("a", "b"):
+            warmer.observe(key, key, cached=False)
+        warmer.warm_once()
+        warmer.warm_once()
+        self.assertEqual(self.calls, ["a"])
+        self.assertTrue(unanswerable.contains("a"))
+        self.assertEqual(warmer.stats()["skipped_unanswerable"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
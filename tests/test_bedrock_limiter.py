@@ -0,0 +1,88 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+from bedrock_limiter import AdaptiveLimiter, BedrockThrottledError, call_bedrock
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_throttle_cuts_limit_once_per_burst(self):
+        limiter = AdaptiveLimiter(initial_limit=10, backoff_ratio=0.5, cooldown_seconds=60)
+        for _ in range(3):
+            self.assertTrue(limiter.acquire(0))
+            limiter.release("throttled")
+        self.assertEqual(limiter.limit, 5)
+        self.assertEqual(limiter.stats()["decreases"], 1)
+
+    def test_success_grows_limit_only_when_saturated(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+        limiter.acquire(0)
+        limiter.release("success")
+        self.assertEqual(limiter.limit, 2)
+        for _ in range(3):
+            limiter.acquire(0)
+            limiter.acquire(0)
+            limiter.release("success")
+            limiter.release("success")
+        self.assertEqual(limiter.limit, 3)
+
+    def test_acquire_times_out_when_full(self):
+        limiter = AdaptiveLimiter(initial_limit=1)
+        self.assertTrue(limiter.acquire(0))
+        self.assertFalse(limiter.acquire(0.01))
+        self.assertEqual(limiter.stats()["acquire_timeouts"], 1)
+
+
+class TestCallBedrock(unittest.TestCase):
+    def test_retries_throttles_then_succeeds(self):
+        limiter = AdaptiveLimiter()
+        fn = MagicMock(side_effect=[client_error("ThrottlingException"), "ok"])
+        self.assertEqual(call_bedrock("test", fn, deadline_seconds=5, limiter=limiter), "ok")
+        self.assertEqual(limiter.stats()["retries"], 1)
+        self.assertEqual(limiter.stats()["in_flight"], 0)
+
+    def test_gives_up_at_deadline(self):
+        limiter = AdaptiveLimiter()
+        fn = MagicMock(side_effect=client_error("ThrottlingException"))
+        with self.assertRaises(BedrockThrottledError):
+            call_bedrock("test", fn, deadline_seconds=0, limiter=limiter)
+        self.assertEqual(limiter.stats()["retries_exhausted"], 1)
+
+    def test_other_errors_are_not_retried(self):
+        limiter = AdaptiveLimiter()
+        fn = MagicMock(side_effect=client_error("ValidationException"))
+        with self.assertRaises(ClientError):
+            call_bedrock("test", fn, deadline_seconds=5, limiter=limiter)
+        fn.assert_called_once()
+        self.assertEqual(limiter.stats()["failures"], 1)
+
+    def test_connection_errors_and_timeouts_are_retried(self):
+        limiter = AdaptiveLimiter(initial_limit=4)
+        fn = MagicMock(side_effect=[
+            EndpointConnectionError(endpoint_url="https://bedrock-runtime.us-east-1.amazonaws.com"),
+            ReadTimeoutError(endpoint_url="https://bedrock-runtime.us-east-1.amazonaws.com"),
+            "ok",
+        ])
+        self.assertEqual(call_bedrock("test", fn, deadline_seconds=5, limiter=limiter), "ok")
+        stats = limiter.stats()
+        self.assertEqual((stats["retries"], stats["failures"], stats["decreases"]), (2, 2, 0))
+        self.assertEqual(limiter.limit, 4)
+
+    def test_transient_errors_give_up_after_max_attempts(self):
+        limiter = AdaptiveLimiter()
+        error = ClientError({"Error": {"Code": "InternalServerException", "Message": "boom"},
+                             "ResponseMetadata": {"HTTPStatusCode": 500}}, "InvokeModel")
+        fn = MagicMock(side_effect=error)
+        with self.assertRaises(ClientError):
+            call_bedrock("test", fn, deadline_seconds=5, limiter=limiter)
+        self.assertEqual(fn.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
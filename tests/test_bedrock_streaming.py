@@ -0,0 +1,49 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import json
+from unittest.mock import patch, MagicMock
+from bedrock_handler import TRUNCATED_NOTICE, build_request_body, stream_claude
+
+
+def _chunk(payload):
+    return {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+
+class TestStreamClaude(unittest.TestCase):
+    def test_build_request_body_folds_system_message(self):
+        body = json.loads(build_request_body(json.dumps([
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Hi"}
+        ])))
+        self.assertEqual(body['messages'], [{"role": "user", "content": "Be brief.\n\nUser: Hi"}])
+
+    @patch('bedrock_handler.get_bedrock_client')
+    def test_yields_text_deltas(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.invoke_model_with_response_stream.return_value = {'body': [
+            _chunk({'type': 'message_start'}),
+            _chunk({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Hel'}}),
+            _chunk({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'lo'}}),
+            _chunk({'type': 'message_stop'}),
+        ]}
+        deltas = list(stream_claude(MagicMock(), json.dumps([{"role": "user", "content": "Hi"}])))
+        self.assertEqual(deltas, ['Hel', 'lo'])
+
+    @patch('bedrock_handler.get_bedrock_client')
+    def test_marks_answer_cut_off_at_max_tokens(self, mock_get_client):
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        mock_client.invoke_model_with_response_stream.return_value = {'body': [
+            _chunk({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': 'Step 1'}}),
+            _chunk({'type': 'message_delta', 'delta': {'stop_reason': 'max_tokens'}, 'usage': {'output_tokens': 1024}}),
+            _chunk({'type': 'message_stop'}),
+        ]}
+        deltas = list(stream_claude(MagicMock(), json.dumps([{"role": "user", "content": "Hi"}])))
+        self.assertEqual(deltas, ['Step 1', TRUNCATED_NOTICE])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from unittest.mock import MagicMock
+from client_registry import ClientRegistry
+
+
+class TestClientRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = ClientRegistry(config=MagicMock())
+
+    def test_reuses_client_per_session_and_service(self):
+        session = MagicMock()
+        first = self.registry.get_client(session, 'bedrock-runtime')
+        second = self.registry.get_client(session, 'bedrock-runtime')
+        self.assertIs(first, second)
+        session.client.assert_called_once_with('bedrock-runtime', config=self.registry.config_for('bedrock-runtime'))
+        self.assertEqual(self.registry.stats()['hits'], 1)
+        self.assertEqual(self.registry.stats()['misses'], 1)
+
+    def test_separate_clients_per_session(self):
+        self.registry.get_client(MagicMock(), 's3')
+        self.registry.get_client(MagicMock(), 's3')
+        self.assertEqual(self.registry.stats()['misses'], 2)
+
+    def test_rotate_drops_clients(self):
+        session = MagicMock()
+        self.registry.get_client(session, 's3')
+        self.registry.rotate()
+        self.registry.get_client(session, 's3')
+        self.assertEqual(session.client.call_count, 2)
+        self.assertEqual(self.registry.generation, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+from conversation_store import ConversationStore, SqliteConversationStore, build_messages, conversation_key, summarize_turns
+
+
+class TestConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+
+    def make_store(self, **kwargs):
+        return ConversationStore(clock=lambda: self.now[0], **kwargs)
+
+    def test_history_and_kb_session_follow_the_thread(self):
+        store = self.make_store()
+        key = conversation_key("C1", "100.1")
+        store.record(key, "How many vacation days?", "Full-timers get 25 days.", kb_session_id="s-1")
+        store.record(conversation_key("C1", "200.2"), "Parking?", "Level -2.")
+
+        self.assertEqual(store.history(key), ("", [("How many vacation days?", "Full-timers get 25 days.")]))
+        self.assertEqual(store.kb_session_id(key), "s-1")
+        store.record(key, "And part-timers?", "Pro rata.")
+        self.assertEqual(store.kb_session_id(key), "s-1")
+        self.assertEqual(store.stats()["follow_ups"], 1)
+        self.assertIsNone(conversation_key("C1", None))
+
+    def test_older_turns_are_summarized_within_budget(self):
+        store = self.make_store(token_budget=60)
+        key = "C1:1"
+        for i in range(6):
+            store.record(key, f"Question {i} about leave?", f"Answer {i}. More detail follows here.")
+
+        summary, turns = store.history(key)
+        self.assertIn("Question 0 about leave?", summary)
+        self.assertNotIn("More detail", summary)
+        self.assertEqual(turns[-1][0], "Question 5 about leave?")
+        self.assertLess(len(turns), 6)
+        self.assertGreater(store.stats()["summaries"], 0)
+
+    def test_failed_summarizer_falls_back(self):
+        def broken(summary, turns):
+            raise RuntimeError("no model")
+
+        store = self.make_store(token_budget=10, summarize_fn=broken)
+        store.record("k", "First question here?", "First answer here.")
+        store.record("k", "Second question here?", "Second answer here.")
+        self.assertIn("First question here?", store.history("k")[0])
+        self.assertEqual(store.stats()["summary_failures"], 1)
+
+    def test_idle_and_capacity_eviction(self):
+        store = self.make_store(idle_seconds=60, max_conversations=2)
+        store.record("a", "q", "a")
+        self.now[0] = 30
+        store.record("b", "q", "a")
+        self.now[0] = 50
+        store.record("c", "q", "a")
+        self.assertIsNone(store.get("a"))
+        self.now[0] = 95
+        self.assertIsNone(store.get("b"))
+        self.assertIsNotNone(store.get("c"))
+        stats = store.stats()
+        self.assertEqual((stats["capacity_evictions"], stats["idle_evictions"]), (1, 1))
+
+    def test_clear_one_conversation(self):
+        store = self.make_store()
+        store.record("a", "q", "a")
+        store.record("b", "q", "a")
+        store.clear("a")
+        self.assertEqual(store.history("a"), ("", []))
+        self.assertIsNotNone(store.get("b"))
+
+    def test_turns_are_clipped(self):
+        store = self.make_store(max_turn_chars=50)
+        store.record("k", "q" * 500, "a" * 500)
+        question, answer = store.history("k")[1][0]
+        self.assertEqual((len(question), len(answer)), (50, 50))
+
+
+class TestSqliteConversationStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "conversations.sqlite3")
+        self.now = [1000.0]
+
+    def make_store(self, **kwargs):
+        return SqliteConversationStore(self.path, clock=lambda: self.now[0], **kwargs)
+
+    def test_turns_are_shared_between_workers(self):
+        worker_a, worker_b = self.make_store(), self.make_store()
+        worker_a.record("C1:1", "Vacation days?", "25 days.", kb_session_id="s-1")
+        worker_b.record("C1:1", "Part-timers?", "Pro rata.")
+        self.assertEqual(worker_a.history("C1:1")[1], [("Vacation days?", "25 days."), ("Part-timers?", "Pro rata.")])
+        self.assertEqual(worker_a.kb_session_id("C1:1"), "s-1")
+        self.assertEqual(worker_b.stats()["follow_ups"], 1)
+
+    def test_summary_is_written_back(self):
+        store = self.make_store(token_budget=60)
+        for i in range(6):
+            store.record("k", f"Question {i} about leave?", f"Answer {i}. More detail follows here.")
+        summary, turns = self.make_store(token_budget=60).history("k")
+        self.assertIn("Question 0 about leave?", summary)
+        self.assertEqual(turns[-1][0], "Question 5 about leave?")
+
+    def test_namespaces_eviction_and_clear(self):
+        threads = self.make_store(idle_seconds=60, max_conversations=2)
+        commands = self.make_store(namespace="commands")
+        commands.record("C1:U1", "q", "a")
+        threads.record("a", "q", "a")
+        threads.record("b", "q", "a")
+        threads.record("c", "q", "a")
+        self.assertIsNone(threads.get("a"))
+        self.now[0] += 61
+        self.assertIsNone(threads.get("b"))
+        threads.clear()
+        self.assertEqual((len(threads), len(commands)), (0, 1))
+
+
+class TestConversationHelpers(unittest.TestCase):
+    def test_build_messages_puts_summary_in_system_message(self):
+        messages = build_messages("Be brief.", "- Asked: a Answered: b", [("q1", "a1")], "q2")
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "user"])
+        self.assertIn("Asked: a", messages[0]["content"])
+        self.assertEqual(messages[-1]["content"], "q2")
+
+    def test_summary_drops_oldest_lines_past_limit(self):
+        summary = summarize_turns("", [(f"question {i}", f"answer {i}.") for i in range(20)], max_chars=120)
+        self.assertLessEqual(len(summary), 120)
+        self.assertIn("question 19", summary)
+        self.assertNotIn("question 0 ", summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+import assume_role
+from assume_role import MIN_REFRESH_LEAD_SECONDS, RoleCredentialProvider
+
+
+def _sts_response(key, lifetime=timedelta(hours=1)):
+    return {"Credentials": {
+        "AccessKeyId": key,
+        "SecretAccessKey": "secret",
+        "SessionToken": "token",
+        "Expiration": datetime.now(timezone.utc) + lifetime,
+    }}
+
+
+class TestRoleCredentialProvider(unittest.TestCase):
+    def setUp(self):
+        self.sts = MagicMock()
+        self.sts.assume_role.side_effect = [_sts_response("first"), _sts_response("second")]
+        self.provider = RoleCredentialProvider(self.sts, "arn:aws:iam::123456789012:role/Test")
+
+    def test_load_returns_refreshable_credentials(self):
+        credentials = self.provider.load()
+        self.assertEqual(credentials.get_frozen_credentials().access_key, "first")
+        stats = self.provider.stats()
+        self.assertGreater(stats["time_to_expiry_seconds"], 3000)
+        self.assertEqual(stats["blocking_refreshes"], 0)
+
+    def test_refresh_uses_prefetched_credentials(self):
+        self.provider.load()
+        self.provider._prefetched = self.provider._assume()
+        self.assertEqual(self.provider.refresh()["access_key"], "second")
+        self.assertEqual(self.sts.assume_role.call_count, 2)
+        self.assertEqual(self.provider.stats()["blocking_refreshes"], 0)
+
+    def test_lead_inside_botocore_window_is_raised(self):
+        provider = RoleCredentialProvider(self.sts, "arn:aws:iam::123456789012:role/Test", refresh_lead_seconds=600)
+        self.assertEqual(provider.refresh_lead_seconds, MIN_REFRESH_LEAD_SECONDS)
+        self.assertEqual(self.provider.refresh_lead_seconds, 1200)
+
+    def test_short_duration_does_not_spin_on_sts(self):
+        sts = MagicMock()
+        sts.assume_role.side_effect = lambda **kwargs: _sts_response("key", timedelta(seconds=900))
+        provider = RoleCredentialProvider(sts, "arn:aws:iam::123456789012:role/Test", duration_seconds=900,
+                                          refresh_lead_seconds=1200)
+        self.assertEqual(provider.refresh_lead_seconds, 450)
+
+        # Expiring credentials leave no time before the next prefetch
+        sts.assume_role.side_effect = lambda **kwargs: _sts_response("key", timedelta(seconds=10))
+        provider.MIN_REFRESH_INTERVAL_SECONDS = 0.2
+        provider.start()
+        time.sleep(0.5)
+        provider.stop()
+        self.assertLessEqual(sts.assume_role.call_count, 4)
+
+
+class TestAssumeRole(unittest.TestCase):
+    @patch('assume_role.boto3.Session')
+    def test_caller_identity_is_looked_up_once(self, mock_session):
+        sts = mock_session.return_value.client.return_value
+        sts.get_caller_identity.return_value = {"Account": "123456789012"}
+        with patch.dict(os.environ, {"ASSUME_ROLE_ARN": ""}), \
+                patch('assume_role.botocore.session.get_session'), \
+                patch.object(RoleCredentialProvider, 'start'):
+            assume_role.assume_role()
+        self.assertEqual(sts.get_caller_identity.call_count, 1)
+        self.assertIn("123456789012", assume_role._active_provider.role_arn)
+
+
+if __name__ == '__main__':
+    unittest.main()
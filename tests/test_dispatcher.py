@@ -0,0 +1,35 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import threading
+from dispatcher import MessageDispatcher
+
+
+class TestMessageDispatcher(unittest.TestCase):
+    def test_rejects_when_queue_full(self):
+        dispatcher = MessageDispatcher(workers=1, max_queue=1, per_user_limit=1, per_channel_limit=1)
+        release = threading.Event()
+        self.assertTrue(dispatcher.submit("U1", "C1", release.wait))
+        self.assertTrue(dispatcher.submit("U1", "C1", lambda: None))
+        self.assertFalse(dispatcher.submit("U2", "C2", lambda: None))
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(dispatcher.stats()["rejected"], 1)
+
+    def test_other_users_overtake_capped_user(self):
+        dispatcher = MessageDispatcher(workers=2, max_queue=10, per_user_limit=1, per_channel_limit=10)
+        release = threading.Event()
+        other_ran = threading.Event()
+        dispatcher.submit("U1", "C1", release.wait)
+        dispatcher.submit("U1", "C1", lambda: None)
+        dispatcher.submit("U2", "C1", other_ran.set)
+        self.assertTrue(other_ran.wait(2))
+        self.assertEqual(dispatcher.stats()["queue_depth"], 1)
+        release.set()
+        dispatcher.shutdown()
+        self.assertEqual(dispatcher.stats()["completed"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+import time
+from event_dedupe import EventDeduplicator, MemoryDedupeStore, SqliteDedupeStore, dedupe_key
+
+
+def mention(event_id, client_msg_id=None):
+    event = {"type": "app_mention", "text": "hi", "user": "U1"}
+    if client_msg_id:
+        event["client_msg_id"] = client_msg_id
+    return {"type": "event_callback", "event_id": event_id, "event": event}
+
+
+class TestDedupeKey(unittest.TestCase):
+    def test_prefers_client_msg_id(self):
+        self.assertEqual(dedupe_key(mention("Ev1", "m1")), "app_mention:m1")
+        self.assertEqual(dedupe_key(mention("Ev1")), "app_mention:Ev1")
+
+    def test_commands_and_ignored_deliveries(self):
+        self.assertEqual(dedupe_key({"command": "/use_claude", "trigger_id": "t1"}), "command:t1")
+        self.assertIsNone(dedupe_key({"type": "event_callback", "event": {"type": "reaction_added"}}))
+        self.assertIsNone(dedupe_key({"type": "event_callback", "event": {"type": "message", "bot_id": "B1"}}))
+
+
+class TestEventDeduplicator(unittest.TestCase):
+    def test_duplicate_after_completion_is_dropped(self):
+        dedupe = EventDeduplicator(MemoryDedupeStore())
+        self.assertTrue(dedupe.claim("k"))
+        dedupe.complete("k")
+        self.assertFalse(dedupe.claim("k"))
+        self.assertEqual(dedupe.stats()["duplicates"], 1)
+
+    def test_window_expiry_and_capacity(self):
+        now = [0.0]
+        store = MemoryDedupeStore(max_entries=2, clock=lambda: now[0])
+        dedupe = EventDeduplicator(store, window_seconds=10)
+        for key in ("a", "b", "c"):
+            dedupe.claim(key)
+            dedupe.complete(key)
+        self.assertEqual(store.size(), 2)
+        self.assertTrue(dedupe.claim("a"))
+        now[0] = 11
+        self.assertTrue(dedupe.claim("c"))
+
+    def test_in_flight_duplicate_is_dropped_without_waiting(self):
+        dedupe = EventDeduplicator(MemoryDedupeStore())
+        self.assertTrue(dedupe.claim("k"))
+        started = time.monotonic()
+        self.assertFalse(dedupe.claim("k"))
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(dedupe.stats()["in_flight_duplicates"], 1)
+
+    def test_released_key_can_be_claimed_again(self):
+        dedupe = EventDeduplicator(MemoryDedupeStore())
+        self.assertTrue(dedupe.claim("k"))
+        dedupe.release("k")
+        self.assertTrue(dedupe.claim("k"))
+
+    def test_sqlite_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dedupe.sqlite3")
+            first = EventDeduplicator(SqliteDedupeStore(path))
+            second = EventDeduplicator(SqliteDedupeStore(path))
+            self.assertTrue(first.claim("k"))
+            first.complete("k")
+            self.assertFalse(second.claim("k"))
+            self.assertTrue(second.claim("other"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from health import HealthState
+
+
+class TestHealthState(unittest.TestCase):
+    def test_ready_requires_live_and_all_checks(self):
+        state = HealthState(required_checks=("aws_role", "slack_auth"))
+        state.set_check("aws_role", True)
+        state.set_check("slack_auth", True)
+        self.assertFalse(state.ready)
+        state.mark_live()
+        self.assertTrue(state.ready)
+        state.set_check("slack_auth", False, "invalid_auth")
+        self.assertFalse(state.ready)
+        self.assertTrue(state.live)
+
+    def test_check_status_pending(self):
+        state = HealthState(required_checks=("aws_role",))
+        self.assertIsNone(state.check_status("aws_role"))
+
+    def test_time_stage_records_timing(self):
+        state = HealthState()
+        with state.time_stage("slack_connect"):
+            pass
+        self.assertIn("slack_connect", state.snapshot()["timings_seconds"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import tempfile
+from hr_escalation import EscalationQueue, SqliteEscalationStore
+
+
+class TestEscalationQueue(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.posts = []
+        self.updates = []
+        self.queue = EscalationQueue(
+            post_fn=lambda channel, text: self.posts.append((channel, text)) or f"ts{len(self.posts)}",
+            update_fn=lambda channel, ts, text: self.updates.append((channel, ts, text)),
+            hr_channel_id="CHR", window_seconds=60, clock=lambda: self.now
+        )
+        # Keep the background thread out of the way; the tests drive flush() directly
+        self.queue._ensure_thread = lambda: None
+
+    def test_similar_questions_share_one_digest(self):
+        self.queue.escalate("How many vacation days do I get?", "U1", "C1")
+        self.queue.escalate("how many vacation days do I get", "U2", "C2")
+        self.queue.escalate("How many vacation days do interns get?", "U3", "C3")
+        self.queue.escalate("Is there a gym at the office?", "U4", "C4")
+        self.assertEqual(self.queue.flush(), 60)
+        self.assertEqual(self.posts, [])
+
+        self.now = 61
+        self.queue.flush()
+        self.assertEqual(len(self.posts), 3)
+        self.assertIn("asked by 2 employees", self.posts[0][1])
+        self.assertIn("asked by 1 employee)", self.posts[1][1])
+        self.assertIn("interns", self.posts[1][1])
+        self.assertEqual(self.queue.stats()["grouped"], 1)
+
+    def test_digest_lists_every_phrasing(self):
+        self.queue.similarity_threshold = 0.7
+        self.queue.escalate("How many vacation days do I get?", "U1", "C1")
+        self.queue.escalate("How many vacation days do I get in total?", "U2", "C2")
+        self.now = 61
+        self.queue.flush()
+        self.assertEqual(len(self.posts), 1)
+        self.assertIn("• How many vacation days do I get in total?", self.posts[0][1])
+
+    def test_new_askers_edit_the_posted_digest(self):
+        self.queue.escalate("Can I carry over vacation days?", "U1", "C1")
+        self.now = 61
+        self.queue.flush()
+        self.queue.escalate("can i carry over vacation days", "U2", "C2")
+        self.now = 200
+        self.queue.flush()
+        self.assertEqual(len(self.posts), 1)
+        self.assertEqual(self.updates[0][1], "ts1")
+        self.assertIn("asked by 2 employees", self.updates[0][2])
+
+    def test_stop_posts_groups_still_in_their_window(self):
+        self.queue.escalate("Can I carry over vacation days?", "U1", "C1")
+        self.now = 61
+        self.queue.flush()
+        self.now = 65
+        self.queue.escalate("can i carry over vacation days", "U2", "C2")
+        self.queue.escalate("Can I bring my dog to work?", "U3", "C3")
+        self.now = 70
+        self.queue.stop()
+        self.assertEqual(len(self.posts), 2)
+        self.assertIn("dog", self.posts[1][1])
+        self.assertEqual(len(self.updates), 1)
+        self.assertIn("asked by 2 employees", self.updates[0][2])
+        self.assertEqual(self.queue.stats()["pending_digests"], 0)
+
+    def test_resolve_notifies_everyone_waiting(self):
+        self.queue.escalate("What is the parental leave policy?", "U1", "D1")
+        self.queue.escalate("what is the parental leave policy", "U2", "D2")
+        notified = self.queue.resolve("#1", "Sixteen weeks, fully paid.")
+        self.assertEqual(notified, 2)
+        self.assertEqual({channel for channel, _ in self.posts}, {"D1", "D2"})
+        self.assertIn("Sixteen weeks", self.posts[0][1])
+        self.assertEqual(self.queue.stats()["open_groups"], 0)
+        self.assertEqual(self.queue.resolve("#1", "again"), 0)
+
+    def test_question_text_never_notifies(self):
+        self.queue.escalate("Do we get a home office budget?", "U1", "D1")
+        self.assertEqual(self.queue.resolve("Do we get a home office budget", "Yes, 500 EUR."), 0)
+        self.assertEqual(self.queue.find("Do we get a home office budget").group_id, 1)
+        self.assertIsNone(self.queue.find("Do we get a home office budget for printers"))
+        self.assertEqual(self.posts, [])
+
+
+class TestSharedEscalations(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "escalations.sqlite3")
+        self.now = 0.0
+        self.posts = []
+
+    def make_worker(self):
+        queue = EscalationQueue(
+            post_fn=lambda channel, text: self.posts.append((channel, text)) or f"ts{len(self.posts)}",
+            hr_channel_id="CHR", window_seconds=60, store=SqliteEscalationStore(self.path), clock=lambda: self.now
+        )
+        queue._ensure_thread = lambda: None
+        return queue
+
+    def test_workers_share_groups_ids_and_digests(self):
+        first, second = self.make_worker(), self.make_worker()
+        first.escalate("Is there a gym at the office?", "U1", "D1")
+        self.assertEqual(second.escalate("is there a gym at the office", "U2", "D2"), 2)
+        self.assertEqual(second.escalate("What is the dress code?", "U3", "D3"), 1)
+        self.assertIsNotNone(first.find("#2"))
+
+        self.now = 61
+        first.flush()
+        second.flush()
+        self.assertEqual(len(self.posts), 2)
+        self.assertIn("asked by 2 employees", self.posts[0][1])
+
+        self.assertEqual(second.resolve("#1", "Yes, on the 3rd floor."), 2)
+        self.assertEqual(first.resolve("#1", "again"), 0)
+        self.assertEqual(first.stats()["open_groups"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
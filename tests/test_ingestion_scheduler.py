@@ -0,0 +1,146 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import threading
+import time
+from unittest.mock import patch, MagicMock
+import tempfile
+from ingestion_scheduler import IngestionScheduler, SqliteIngestionLease
+from bedrock_kb_handler import start_ingestion_job, sync_knowledge_base
+
+
+class TestIngestionScheduler(unittest.TestCase):
+    @patch('ingestion_scheduler.get_ingestion_job_status', return_value="COMPLETE")
+    @patch('ingestion_scheduler.start_ingestion_job', return_value="job-1")
+    def test_batches_changes_into_one_job(self, mock_start, mock_status):
+        notifier = MagicMock()
+        done = threading.Event()
+        results = []
+
+        def on_complete(ok):
+            results.append(ok)
+            if len(results) == 3:
+                done.set()
+
+        scheduler = IngestionScheduler(MagicMock(), window_seconds=0.05, poll_interval_seconds=0.01, notifier=notifier)
+        for _ in range(3):
+            scheduler.request_sync(on_complete)
+        self.assertTrue(done.wait(2))
+        scheduler.stop()
+
+        mock_start.assert_called_once()
+        self.assertEqual(results, [True, True, True])
+        notifier.assert_called_once()
+        self.assertIn("3 new answer(s)", notifier.call_args[0][0])
+        self.assertEqual(scheduler.stats()["pending_changes"], 0)
+
+    @patch('ingestion_scheduler.get_ingestion_job_status')
+    @patch('ingestion_scheduler.start_ingestion_job')
+    def test_workers_take_turns_with_a_shared_lease(self, mock_start, mock_status):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "lease.sqlite3")
+        running = []
+        overlaps = []
+        jobs = iter(range(100))
+
+        def start(session):
+            overlaps.append(len(running))
+            job_id = f"job-{next(jobs)}"
+            running.append(job_id)
+            return job_id
+
+        def status(session, job_id):
+            running.remove(job_id)
+            return "COMPLETE"
+
+        mock_start.side_effect = start
+        mock_status.side_effect = status
+        done = threading.Barrier(3, timeout=5)
+        schedulers = [IngestionScheduler(MagicMock(), window_seconds=0, poll_interval_seconds=0.02,
+                                         lease=SqliteIngestionLease(path)) for _ in range(2)]
+        for scheduler in schedulers:
+            scheduler.request_sync(lambda ok: done.wait())
+        done.wait()
+        for scheduler in schedulers:
+            scheduler.stop()
+        self.assertEqual(overlaps, [0, 0])
+
+    def test_lease_expires_when_not_renewed(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        now = [0.0]
+        lease = SqliteIngestionLease(os.path.join(tmp.name, "lease.sqlite3"), clock=lambda: now[0])
+        self.assertTrue(lease.acquire("a", 60))
+        self.assertFalse(lease.acquire("b", 60))
+        self.assertTrue(lease.acquire("a", 60))
+        now[0] = 61
+        self.assertTrue(lease.acquire("b", 60))
+        lease.release("b")
+        self.assertTrue(lease.acquire("a", 60))
+
+    @patch('ingestion_scheduler.get_ingestion_job_status', return_value="FAILED")
+    @patch('ingestion_scheduler.start_ingestion_job', return_value="job-2")
+    def test_reports_failed_job(self, mock_start, mock_status):
+        done = threading.Event()
+        results = []
+        scheduler = IngestionScheduler(MagicMock(), window_seconds=0, poll_interval_seconds=0.01)
+        scheduler.request_sync(lambda ok: (results.append(ok), done.set()))
+        self.assertTrue(done.wait(2))
+        scheduler.stop()
+        self.assertEqual(results, [False])
+        self.assertEqual(scheduler.stats()["jobs_failed"], 1)
+
+    @patch('ingestion_scheduler.get_ingestion_job_status', side_effect=RuntimeError("throttled"))
+    @patch('ingestion_scheduler.start_ingestion_job', return_value="job-3")
+    def test_repeated_poll_failures_fail_the_job(self, mock_start, mock_status):
+        done = threading.Event()
+        results = []
+        scheduler = IngestionScheduler(MagicMock(), window_seconds=0, poll_interval_seconds=0.01, max_poll_failures=3)
+        scheduler.request_sync(lambda ok: (results.append(ok), done.set()))
+        self.assertTrue(done.wait(2))
+        scheduler.stop()
+        self.assertEqual(results, [False])
+        self.assertEqual(mock_status.call_count, 3)
+
+    @patch('ingestion_scheduler.get_ingestion_job_status', return_value="IN_PROGRESS")
+    @patch('ingestion_scheduler.start_ingestion_job', return_value="job-4")
+    def test_job_past_max_wait_counts_as_failed(self, mock_start, mock_status):
+        done = threading.Event()
+        results = []
+        scheduler = IngestionScheduler(MagicMock(), window_seconds=0, poll_interval_seconds=0.01, max_wait_seconds=0.1)
+        scheduler.request_sync(lambda ok: (results.append(ok), done.set()))
+        self.assertTrue(done.wait(2))
+        scheduler.stop()
+        self.assertEqual(results, [False])
+        self.assertEqual(scheduler.stats()["jobs_failed"], 1)
+
+    @patch('ingestion_scheduler.get_ingestion_job_status', return_value="IN_PROGRESS")
+    @patch('ingestion_scheduler.start_ingestion_job', return_value="job-5")
+    def test_stop_interrupts_the_wait(self, mock_start, mock_status):
+        callback = MagicMock()
+        scheduler = IngestionScheduler(MagicMock(), window_seconds=0, poll_interval_seconds=30)
+        scheduler.request_sync(callback)
+        deadline = time.monotonic() + 2
+        while not mock_start.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+        started = time.monotonic()
+        scheduler.stop()
+        scheduler._thread.join(2)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertFalse(scheduler._thread.is_alive())
+        callback.assert_not_called()
+
+
+class TestStartIngestionJob(unittest.TestCase):
+    @patch.dict(os.environ, {"BEDROCK_KB_ID": "kb-1", "BEDROCK_DATA_SOURCE_ID": "ds-1"})
+    @patch('bedrock_kb_handler.get_client')
+    def test_missing_job_id_means_no_job(self, mock_get_client):
+        mock_get_client.return_value.start_ingestion_job.return_value = {"ingestionJob": {}}
+        self.assertIsNone(start_ingestion_job(MagicMock()))
+        self.assertFalse(sync_knowledge_base(MagicMock()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import io
+import json
+from unittest.mock import patch, MagicMock
+import kb_events
+from answer_cache import retrieval_cache
+from botocore.exceptions import ClientError
+from bedrock_kb_handler import retrieval_key, prepare_context, retrieve_then_generate, query_bedrock_kb_in_session, UNABLE_TO_ASSIST
+
+
+def _chunk(text, score):
+    return {'text': text, 'score': score, 'uri': None}
+
+
+def _claude_response(text):
+    payload = {"content": [{"type": "text", "text": text}], "stop_reason": "end_turn",
+               "usage": {"input_tokens": 10, "output_tokens": 5}}
+    return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+class TestPrepareContext(unittest.TestCase):
+    def test_drops_duplicates_and_low_scores(self):
+        context = prepare_context([
+            _chunk("Employees get 20 vacation days.  Unused days roll over.", 0.9),
+            _chunk("Unused days roll over.", 0.8),
+            _chunk("The cafeteria opens at 8am.", 0.1),
+        ], max_chars=1000, min_score=0.3)
+        self.assertEqual(context.count("<excerpt>"), 1)
+        self.assertIn("Employees get 20 vacation days. Unused days roll over.", context)
+
+    def test_trims_to_budget(self):
+        context = prepare_context([_chunk("word " * 100, 0.9), _chunk("other text", 0.8)], max_chars=50, min_score=0)
+        self.assertEqual(context.count("<excerpt>"), 1)
+        self.assertLessEqual(len(context.replace("<excerpt>\n", "").replace("\n</excerpt>", "")), 50)
+
+
+class TestRetrieveThenGenerate(unittest.TestCase):
+    def setUp(self):
+        retrieval_cache.clear()
+        self.agent_runtime = MagicMock()
+        self.agent_runtime.retrieve.return_value = {"retrievalResults": [
+            {"content": {"text": "Employees get 20 vacation days."}, "score": 0.9,
+             "location": {"s3Location": {"uri": "s3://kb/vacation.json"}}},
+        ]}
+        self.runtime = MagicMock()
+        self.runtime.invoke_model.side_effect = lambda **kwargs: _claude_response("You get 20 days.")
+        patchers = [
+            patch('bedrock_kb_handler.get_bedrock_agent_runtime_client', return_value=self.agent_runtime),
+            patch('bedrock_kb_handler.get_bedrock_client', return_value=self.runtime),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_reworded_question_reuses_retrieval(self):
+        self.assertEqual(retrieval_key("How many vacation days do I get?"),
+                         retrieval_key("vacation days: how many do I get"))
+        self.assertEqual(retrieve_then_generate(MagicMock(), "How many vacation days do I get?"),
+                         ("You get 20 days.", True))
+        retrieve_then_generate(MagicMock(), "vacation days: how many do I get")
+        self.assertEqual(self.agent_runtime.retrieve.call_count, 1)
+        self.assertEqual(self.runtime.invoke_model.call_count, 2)
+        prompt = json.loads(self.runtime.invoke_model.call_args.kwargs["body"])["messages"][0]["content"]
+        self.assertIn("Employees get 20 vacation days.", prompt)
+
+    def test_kb_change_clears_retrieval_cache(self):
+        retrieve_then_generate(MagicMock(), "How many vacation days do I get?")
+        kb_events.publish("ingestion_complete")
+        retrieve_then_generate(MagicMock(), "How many vacation days do I get?")
+        self.assertEqual(self.agent_runtime.retrieve.call_count, 2)
+
+    def test_no_chunks_skips_generation(self):
+        self.agent_runtime.retrieve.return_value = {"retrievalResults": []}
+        self.assertEqual(retrieve_then_generate(MagicMock(), "Where is the moon base?"), (UNABLE_TO_ASSIST, True))
+        self.runtime.invoke_model.assert_not_called()
+
+    def test_follow_up_sends_history(self):
+        history = ("", [("How many vacation days do I get?", "You get 20 days.")])
+        retrieve_then_generate(MagicMock(), "and part-timers?", history)
+        self.assertIn("vacation", self.agent_runtime.retrieve.call_args.kwargs["retrievalQuery"]["text"])
+        messages = json.loads(self.runtime.invoke_model.call_args.kwargs["body"])["messages"]
+        self.assertEqual([m["role"] for m in messages], ["user", "assistant", "user"])
+        self.assertEqual(messages[-1]["content"], "and part-timers?")
+
+
+class TestKbSessions(unittest.TestCase):
+    def setUp(self):
+        self.agent_runtime = MagicMock()
+        p = patch('bedrock_kb_handler.get_bedrock_agent_runtime_client', return_value=self.agent_runtime)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_session_id_is_passed_and_returned(self):
+        self.agent_runtime.retrieve_and_generate.return_value = {"output": {"text": "12 days."}, "sessionId": "s-2"}
+        self.assertEqual(query_bedrock_kb_in_session(MagicMock(), "and part-timers?", "s-1"), ("12 days.", True, "s-2"))
+        self.assertEqual(self.agent_runtime.retrieve_and_generate.call_args.kwargs["sessionId"], "s-1")
+
+    def test_expired_session_is_dropped(self):
+        expired = ClientError({"Error": {"Code": "ValidationException", "Message": "Session s-1 has expired"}},
+                              "RetrieveAndGenerate")
+        self.agent_runtime.retrieve_and_generate.side_effect = [
+            expired, {"output": {"text": "12 days."}, "sessionId": "s-3"}
+        ]
+        self.assertEqual(query_bedrock_kb_in_session(MagicMock(), "and part-timers?", "s-1"), ("12 days.", True, "s-3"))
+        self.assertNotIn("sessionId", self.agent_runtime.retrieve_and_generate.call_args.kwargs)
+
+    def test_without_session_previous_question_is_in_query(self):
+        self.agent_runtime.retrieve_and_generate.return_value = {"output": {"text": "12 days."}, "sessionId": "s-4"}
+        query_bedrock_kb_in_session(MagicMock(), "and part-timers?", history=("", [("Vacation days?", "20.")]))
+        text = self.agent_runtime.retrieve_and_generate.call_args.kwargs["input"]["text"]
+        self.assertEqual(text, "Earlier question: Vacation days?\nFollow-up question: and part-timers?")
+
+
+if __name__ == '__main__':
+    unittest.main()
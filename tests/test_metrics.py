@@ -0,0 +1,55 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import json
+import urllib.request
+import urllib.error
+from metrics import Histogram, MetricsRegistry, registry, start_metrics_server, timer
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "Test", labelnames=("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "kb")
+        histogram.observe(0.5, "kb")
+        histogram.observe(5, "kb")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="kb",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="kb",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="kb",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="kb"} 3', lines)
+
+    def test_timer_counts_errors(self):
+        with self.assertRaises(ValueError):
+            with timer("test.failing_stage"):
+                raise ValueError("boom")
+        self.assertEqual(registry.stage_duration.snapshot("test.failing_stage")["count"], 1)
+        self.assertIn('slackbot_stage_errors_total{stage="test.failing_stage"} 1', registry.render())
+
+    def test_collectors_become_gauges(self):
+        metrics = MetricsRegistry(prefix="bot")
+        metrics.register_collector("cache", lambda: {"size": 3, "ready": True, "label": "x", "lag": None})
+        text = metrics.render()
+        self.assertIn("bot_cache_size 3", text)
+        self.assertIn("bot_cache_ready 1", text)
+        self.assertNotIn("bot_cache_label", text)
+
+    def test_http_endpoint(self):
+        server = start_metrics_server(port=18765, host="127.0.0.1",
+                                      health_fn=lambda: {"live": True, "ready": False})
+        try:
+            with urllib.request.urlopen("http://127.0.0.1:18765/metrics") as response:
+                self.assertIn("slackbot_stage_duration_seconds", response.read().decode())
+            with urllib.request.urlopen("http://127.0.0.1:18765/healthz") as response:
+                self.assertTrue(json.loads(response.read())["live"])
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                urllib.request.urlopen("http://127.0.0.1:18765/readyz")
+            self.assertEqual(ctx.exception.code, 503)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
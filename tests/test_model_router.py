@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import io
+import json
+from unittest.mock import patch, MagicMock
+from model_router import DEFAULT_ROUTES, ModelRoute, ModelRouter
+import bedrock_handler
+
+
+def make_router():
+    routes = {name: ModelRoute(name, **config) for name, config in DEFAULT_ROUTES.items()}
+    return ModelRouter(routes)
+
+
+def user(content):
+    return [{"role": "system", "content": "Be helpful."}, {"role": "user", "content": content}]
+
+
+def invoke_response(text, stop_reason="end_turn", input_tokens=20, output_tokens=10):
+    body = {"content": [{"type": "text", "text": text}], "stop_reason": stop_reason,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens}}
+    return {"body": io.BytesIO(json.dumps(body).encode("utf-8"))}
+
+
+class TestModelRouter(unittest.TestCase):
+    def test_short_question_uses_fast_route_with_sized_budget(self):
+        decision = make_router().route(user("When is payday?"))
+        self.assertEqual(decision.route.name, "fast")
+        self.assertEqual(decision.reason, "simple_prompt")
+        self.assertEqual(decision.max_tokens, 512)
+        self.assertTrue(decision.can_escalate)
+
+    def test_max_tokens_grows_with_the_request_up_to_the_route_cap(self):
+        router = make_router()
+        self.assertEqual(router.route(user("x" * 300)).max_tokens, 600)
+        self.assertEqual(router.route(user("Write a note about payday")).max_tokens, 4096)
+        self.assertEqual(router.route(user("--fast Give a detailed list of holidays")).max_tokens, 1024)
+        self.assertEqual(router.route(user("y " * 2000)).max_tokens, 4096)
+
+    def test_complex_or_long_prompts_use_large_route(self):
+        router = make_router()
+        self.assertEqual(router.route(user("Explain how our bonus is calculated")).route.name, "large")
+        self.assertEqual(router.route(user("x " * 300)).reason, "long_prompt")
+        self.assertEqual(router.route(user("Please draft a welcome email")).max_tokens, 4096)
+
+    def test_explicit_route_is_stripped_from_prompt(self):
+        decision = make_router().route(user("--large When is payday?"))
+        self.assertEqual(decision.route.name, "large")
+        self.assertEqual(decision.messages[-1]["content"], "When is payday?")
+        self.assertFalse(decision.can_escalate)
+
+    def test_only_self_referential_hedging_escalates(self):
+        router = make_router()
+        decision = router.route(user("Are contractors covered?"))
+        self.assertFalse(router.needs_escalation(decision, "The policy is unclear about contractors; see section 4.", "end_turn"))
+        self.assertTrue(router.needs_escalation(decision, "I'm not certain, but probably not.", "end_turn"))
+        self.assertTrue(router.needs_escalation(decision, "Contractors are", "max_tokens"))
+
+    def test_record_tracks_tokens_and_cost(self):
+        router = make_router()
+        decision = router.route(user("When is payday?"))
+        router.record(decision, 0.2, {"input_tokens": 4000, "output_tokens": 800})
+        stats = router.stats()
+        self.assertEqual(stats["fast_input_tokens"], 4000)
+        self.assertAlmostEqual(stats["fast_cost_usd"], 0.002)
+
+
+class TestQueryClaudeRouting(unittest.TestCase):
+    @patch('bedrock_handler.get_bedrock_client')
+    def test_hedging_fast_answer_is_escalated(self, mock_get_client):
+        router = make_router()
+        client = MagicMock()
+        client.invoke_model.side_effect = [invoke_response("I'm not sure."), invoke_response("On the 25th.")]
+        mock_get_client.return_value = client
+        with patch.object(bedrock_handler, 'model_router', router):
+            answer = bedrock_handler.query_claude(MagicMock(), json.dumps(user("When is payday?")))
+        self.assertEqual(answer, "On the 25th.")
+        models = [call.kwargs["modelId"] for call in client.invoke_model.call_args_list]
+        self.assertEqual(models, [DEFAULT_ROUTES["fast"]["model_id"], DEFAULT_ROUTES["large"]["model_id"]])
+        self.assertEqual(router.stats()["escalations"], 1)
+        self.assertEqual(json.loads(client.invoke_model.call_args.kwargs["body"])["max_tokens"], 4096)
+
+    @patch('bedrock_handler.get_bedrock_client')
+    def test_answer_cut_off_on_the_large_route_is_marked(self, mock_get_client):
+        client = MagicMock()
+        client.invoke_model.return_value = invoke_response("Step 1", stop_reason="max_tokens")
+        mock_get_client.return_value = client
+        with patch.object(bedrock_handler, 'model_router', make_router()):
+            answer = bedrock_handler.query_claude(MagicMock(), json.dumps(user("Explain the bonus")))
+        self.assertEqual(answer, "Step 1" + bedrock_handler.TRUNCATED_NOTICE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from qa_index import QAIndex, tokenize
+
+
+class TestQAIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = QAIndex(min_confidence=0.6)
+        self.index.build([
+            {"question": "How many vacation days do I get?", "answer": "25 days per year."},
+            {"question": "What is the parental leave policy?", "answer": "16 weeks paid."},
+            {"question": "How do I submit travel expenses?", "answer": "Use the expenses portal."},
+        ])
+
+    def test_tokenize_stems_and_adds_bigrams(self):
+        terms = tokenize("Vacation days?")
+        self.assertIn("vacation", terms)
+        self.assertIn("day", terms)
+        self.assertIn("vacation_day", terms)
+
+    def test_confident_match(self):
+        self.assertEqual(self.index.lookup("how many vacation days do i get"), "25 days per year.")
+
+    def test_unrelated_question_falls_through(self):
+        self.assertIsNone(self.index.lookup("Can I bring my dog to the office?"))
+
+    def test_add_replaces_answer_for_same_question(self):
+        self.index.add("How many vacation days do I get?", "30 days per year.")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.lookup("How many vacation days do I get?"), "30 days per year.")
+
+    def test_pruned_search_matches_full_search(self):
+        query = "parental leave policy"
+        full = self.index.search(query, limit=1)
+        pruned = self.index.search(query, limit=1, min_confidence=0.6)
+        self.assertEqual(full[0][2], pruned[0][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import json
+import tempfile
+import threading
+from qa_storage import LocalBackend, QAStorage, default_prefix
+
+
+class TestQAStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.backend = LocalBackend(self.tmp.name)
+        self.storage = QAStorage(self.backend, compaction_threshold=3)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_concurrent_adds_are_not_lost(self):
+        threads = [
+            threading.Thread(target=self.storage.add, args=(f"q{i}", f"a{i}"))
+            for i in range(20)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.storage.list_entries()), 20)
+
+    def test_compaction_rolls_entries_into_segment(self):
+        for i in range(3):
+            self.storage.add(f"q{i}", f"a{i}")
+        self.assertEqual(self.storage.compact(), 3)
+        self.assertEqual(self.backend.list(self.storage.entries_prefix), [])
+        self.assertEqual(len(self.backend.list(self.storage.segments_prefix)), 1)
+        self.storage.add("q3", "a3")
+        questions = [e["question"] for e in self.storage.list_entries()]
+        self.assertEqual(questions, ["q0", "q1", "q2", "q3"])
+
+    def test_failed_segment_write_keeps_entries(self):
+        for i in range(3):
+            self.storage.add(f"q{i}", f"a{i}")
+        put_if_absent = self.backend.put_if_absent
+        self.backend.put_if_absent = lambda key, body: (
+            False if key.startswith(self.storage.segments_prefix) else put_if_absent(key, body))
+        self.assertEqual(self.storage.compact(), 0)
+        self.assertEqual(len(self.backend.list(self.storage.entries_prefix)), 3)
+        self.assertEqual(len(self.storage.list_entries()), 3)
+
+    def test_crash_before_deletes_does_not_duplicate_entries(self):
+        for i in range(3):
+            self.storage.add(f"q{i}", f"a{i}")
+        delete = self.backend.delete
+        self.backend.delete = lambda key: None if key.startswith(self.storage.entries_prefix) else delete(key)
+        self.storage.compact()
+        self.assertEqual([e["question"] for e in self.storage.list_entries()], ["q0", "q1", "q2"])
+
+        self.backend.delete = delete
+        self.storage.add("q3", "a3")
+        self.assertEqual(self.storage.compact(force=True), 4)
+        self.assertEqual(self.backend.list(self.storage.entries_prefix), [])
+        self.assertEqual(len(self.backend.list(self.storage.segments_prefix)), 2)
+        self.assertEqual([e["question"] for e in self.storage.list_entries()], ["q0", "q1", "q2", "q3"])
+
+    def test_compaction_skipped_while_lease_held(self):
+        for i in range(3):
+            self.storage.add(f"q{i}", f"a{i}")
+        self.assertTrue(self.storage._acquire_lease())
+        self.assertEqual(QAStorage(self.backend, compaction_threshold=3).compact(), 0)
+
+    def test_reads_legacy_file(self):
+        self.backend.put_if_absent("kb.json", json.dumps([{"question": "old", "answer": "x"}]).encode())
+        storage = QAStorage(self.backend, legacy_key="kb.json")
+        storage.add("new", "y")
+        self.assertEqual([e["question"] for e in storage.list_entries()], ["old", "new"])
+
+    def test_default_prefix_follows_legacy_file(self):
+        self.assertEqual(default_prefix("hr/kb/answers.json"), "hr/kb/")
+        self.assertEqual(default_prefix("answers.json"), "")
+        self.assertEqual(default_prefix(None), "qa/")
+
+    def test_only_documents_are_written_under_the_ingested_prefix(self):
+        storage = QAStorage(self.backend, prefix="hr/kb/", compaction_threshold=3)
+        for i in range(3):
+            storage.add(f"q{i}", f"a{i}")
+        storage.compact()
+        storage.add("q3", "a3")
+        self.assertTrue(storage._acquire_lease())
+
+        keys = self.backend.list("hr/kb/")
+        self.assertEqual(len(keys), 2)
+        for key in keys:
+            self.assertTrue(key.endswith(".json"), key)
+            json.loads(self.backend.get(key)[0].decode("utf-8"))
+        self.assertFalse(storage.lease_key.startswith("hr/kb"))
+
+    def test_reads_jsonl_segments(self):
+        self.backend.put_if_absent(f"{self.storage.segments_prefix}old.jsonl",
+                                   b'{"question": "q0", "answer": "a0"}\n{"question": "q1", "answer": "a1"}\n')
+        self.storage.add("q2", "a2")
+        self.assertEqual([e["question"] for e in self.storage.list_entries()], ["q0", "q1", "q2"])
+
+    def test_put_if_match_rejects_stale_etag(self):
+        self.backend.put_if_absent("lease", b"one")
+        _, etag = self.backend.get("lease")
+        self.assertTrue(self.backend.put_if_match("lease", b"two", etag))
+        self.assertFalse(self.backend.put_if_match("lease", b"three", etag))
+
+
+if __name__ == '__main__':
+    unittest.main()
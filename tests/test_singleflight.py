@@ -0,0 +1,118 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import asyncio
+import threading
+from singleflight import AsyncSingleFlight, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def _run_concurrently(self, flight, fn, count):
+        results = []
+        errors = []
+
+        def worker():
+            try:
+                results.append(flight.do("key", fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for t in threads:
+            t.start()
+        return threads, results, errors
+
+    def test_concurrent_callers_share_one_execution(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "answer"
+
+        leader = threading.Thread(target=flight.do, args=("key", slow))
+        leader.start()
+        started.wait()
+        threads, results, _ = self._run_concurrently(flight, slow, 4)
+        while flight._calls["key"].waiters < 4:
+            pass
+        release.set()
+        for t in threads + [leader]:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["answer"] * 4)
+        self.assertEqual(flight.stats()["calls_saved"], 4)
+
+    def test_error_is_shared_with_waiters(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait()
+            raise RuntimeError("throttled")
+
+        leader_threads, _, leader_errors = self._run_concurrently(flight, failing, 1)
+        started.wait()
+        threads, _, errors = self._run_concurrently(flight, failing, 2)
+        while flight._calls["key"].waiters < 2:
+            pass
+        release.set()
+        for t in threads + leader_threads:
+            t.join()
+        self.assertEqual([str(e) for e in leader_errors + errors], ["throttled"] * 3)
+        self.assertEqual(flight.stats()["executions"], 1)
+
+    def test_waiter_times_out_and_runs_directly(self):
+        flight = SingleFlight(timeout_seconds=0.01)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("key", release.wait))
+        leader.start()
+        while "key" not in flight._calls:
+            pass
+        self.assertEqual(flight.do("key", lambda: "direct"), "direct")
+        release.set()
+        leader.join()
+        self.assertEqual(flight.stats()["timeouts"], 1)
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    def test_concurrent_coroutines_share_one_execution(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value * 2
+
+        async def main():
+            return await asyncio.gather(*(flight.do("key", slow, 21) for _ in range(50)))
+
+        self.assertEqual(asyncio.run(main()), [42] * 50)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()["calls_saved"], 49)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_waiters_receive_leader_error(self):
+        flight = AsyncSingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def main():
+            return await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(main())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,263 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import threading
+import kb_events
+from answer_cache import answer_cache, unanswerable_cache
+from bedrock_kb_handler import UNABLE_TO_ASSIST
+from bedrock_limiter import BedrockThrottledError
+from slack_outbox import SlackOutbox
+from slack_handler import SlackHandler, STREAM_INTERRUPTED_NOTICE
+import time
+import tempfile
+
+
+def _event(user, text="Is there a pet insurance plan?"):
+    return {"user": user, "channel": f"D{user}", "text": text}
+
+
+class TestUnanswerableCache(unittest.TestCase):
+    def setUp(self):
+        answer_cache.clear()
+        unanswerable_cache.clear()
+        env = patch.dict(os.environ, {"HR_CHANNEL_ID": "CHR"})
+        env.start()
+        self.addCleanup(env.stop)
+        self.handler = SlackHandler("xoxb-test", "xapp-test", defer_auth=True)
+        self.handler.aws_session = MagicMock()
+        self.handler.escalations.post_fn = MagicMock(return_value="1.0")
+        self.addCleanup(self.handler.escalations.stop)
+        self.addCleanup(self.handler.dispatcher.shutdown, False)
+        self.addCleanup(self.handler.outbox.stop, False)
+
+    @patch('slack_handler.query_bedrock_kb', return_value=(UNABLE_TO_ASSIST, True))
+    def test_repeat_question_skips_bedrock_and_joins_escalation(self, mock_query):
+        self.handler.handle_message(_event("U1"), MagicMock())
+        say = MagicMock()
+        self.handler.handle_message(_event("U2", "is there a PET insurance plan"), say)
+
+        self.handler.outbox.stop(wait=True)
+        self.assertEqual(mock_query.call_count, 1)
+        self.assertEqual(unanswerable_cache.stats()["hits"], 1)
+        group = self.handler.escalations.find("Is there a pet insurance plan?")
+        self.assertEqual(set(group.askers), {"U1", "U2"})
+        say.assert_called_once()
+
+    @patch('slack_handler.query_bedrock_kb', return_value=(UNABLE_TO_ASSIST, True))
+    def test_kb_change_clears_negative_entries(self, mock_query):
+        self.handler.handle_message(_event("U1"), MagicMock())
+        kb_events.publish("ingestion_complete")
+        self.handler.handle_message(_event("U2"), MagicMock())
+        self.assertEqual(mock_query.call_count, 2)
+
+    def test_kb_change_during_query_is_not_overwritten(self):
+        def query(session, text):
+            kb_events.publish("answer_saved")
+            return (UNABLE_TO_ASSIST, True) if "pet" in text else ("Old answer.", True)
+
+        stale_puts = answer_cache.stats()["stale_puts"]
+        with patch('slack_handler.query_bedrock_kb', side_effect=query):
+            self.handler.handle_message(_event("U1"), MagicMock())
+            self.handler.handle_message(_event("U2", "How many vacation days?"), MagicMock())
+        self.assertEqual(len(unanswerable_cache), 0)
+        self.assertIsNone(answer_cache.get("how many vacation days"))
+        self.assertEqual(answer_cache.stats()["stale_puts"], stale_puts + 1)
+
+    def test_errors_and_malformed_responses_are_not_cached(self):
+        with patch('slack_handler.query_bedrock_kb', side_effect=BedrockThrottledError("slow down")):
+            self.handler.handle_message(_event("U1"), MagicMock())
+        with patch('slack_handler.query_bedrock_kb', return_value=("", False)):
+            self.handler.handle_message(_event("U2"), MagicMock())
+        self.assertEqual(len(unanswerable_cache), 0)
+
+
+class TestThreadConversations(unittest.TestCase):
+    def setUp(self):
+        answer_cache.clear()
+        unanswerable_cache.clear()
+        self.handler = SlackHandler("xoxb-test", "xapp-test", defer_auth=True)
+        self.handler.aws_session = MagicMock()
+        self.addCleanup(self.handler.escalations.stop)
+        self.addCleanup(self.handler.dispatcher.shutdown, False)
+        self.addCleanup(self.handler.outbox.stop, False)
+
+    @patch('slack_handler.query_bedrock_kb_in_session', return_value=("Part-timers get 12 days.", True, "s-1"))
+    @patch('slack_handler.query_bedrock_kb', return_value=("Full-timers get 25 days.", True))
+    def test_follow_up_in_thread_carries_context(self, mock_query, mock_session_query):
+        first = {"user": "U1", "channel": "C1", "ts": "100.1", "text": "How many vacation days do I get?"}
+        self.handler.handle_message(first, MagicMock())
+        say = MagicMock()
+        follow_up = {"user": "U1", "channel": "C1", "ts": "100.5", "thread_ts": "100.1", "text": "and part-timers?"}
+        self.handler.handle_message(follow_up, say)
+        self.handler.handle_message(dict(follow_up, ts="100.9", text="what about contractors?"), say)
+
+        self.handler.outbox.stop(wait=True)
+        first_call, second_call = mock_session_query.call_args_list
+        _, query, session_id, history = first_call.args
+        self.assertEqual((query, session_id), ("and part-timers?", None))
+        self.assertEqual(history[1], [("How many vacation days do I get?", "Full-timers get 25 days.")])
+        self.assertEqual(second_call.args[1:3], ("what about contractors?", "s-1"))
+        self.assertIn("Part-timers get 12 days.", say.call_args.args[0])
+        self.assertEqual(say.call_args.kwargs, {"thread_ts": "100.1"})
+        # Follow-up answers depend on the thread and are never cached
+        self.assertIsNone(answer_cache.get("part timers"))
+        self.assertEqual(mock_query.call_count, 1)
+
+    @patch('slack_handler.query_bedrock_kb_in_session', return_value=("Part-timers get 12 days.", True, "s-2"))
+    @patch('slack_handler.query_bedrock_kb', return_value=("Full-timers get 25 days.", True))
+    def test_follow_up_on_another_worker_carries_context(self, mock_query, mock_session_query):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        env = patch.dict(os.environ, {"CONVERSATION_BACKEND": "sqlite",
+                                      "CONVERSATION_SQLITE_PATH": os.path.join(tmp.name, "conversations.sqlite3")})
+        env.start()
+        self.addCleanup(env.stop)
+        first_worker = SlackHandler("xoxb-test", "xapp-test", defer_auth=True)
+        second_worker = SlackHandler("xoxb-test", "xapp-test", defer_auth=True)
+        for handler in (first_worker, second_worker):
+            handler.aws_session = MagicMock()
+            self.addCleanup(handler.escalations.stop)
+            self.addCleanup(handler.dispatcher.shutdown, False)
+            self.addCleanup(handler.outbox.stop, False)
+
+        first_worker.handle_message({"user": "U1", "channel": "C1", "ts": "200.1",
+                                     "text": "How many vacation days do I get?"}, MagicMock())
+        say = MagicMock()
+        second_worker.handle_message({"user": "U1", "channel": "C1", "ts": "200.5", "thread_ts": "200.1",
+                                      "text": "and part-timers?"}, say)
+
+        second_worker.outbox.stop(wait=True)
+        _, query, _, history = mock_session_query.call_args.args
+        self.assertEqual(query, "and part-timers?")
+        self.assertEqual(history[1], [("How many vacation days do I get?", "Full-timers get 25 days.")])
+        self.assertIn("Part-timers get 12 days.", say.call_args.args[0])
+        self.assertEqual(first_worker.conversations.stats()["active"], 1)
+
+class TestAsyncFrontEnd(unittest.TestCase):
+    def setUp(self):
+        from slack_sdk.web.async_client import AsyncWebClient
+        from slack_sdk.web.async_slack_response import AsyncSlackResponse
+        from async_slack_handler import AsyncSlackHandler
+
+        answer_cache.clear()
+        unanswerable_cache.clear()
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.addCleanup(self.loop.call_soon_threadsafe, self.loop.stop)
+        client = AsyncWebClient(token="xoxb-test")
+        # Bolt checks the token and says through its own per-request clients
+        auth = AsyncSlackResponse(client=client, http_verb="POST", api_url="", req_args={}, headers={}, status_code=200,
+                                  data={"ok": True, "user_id": "UBOT", "bot_id": "BBOT", "team_id": "T1"})
+        self.post = AsyncMock(return_value={"ok": True, "ts": "1.0"})
+        for name, mock in (("auth_test", AsyncMock(return_value=auth)), ("chat_postMessage", self.post)):
+            patcher = patch(f"slack_sdk.web.async_client.AsyncWebClient.{name}", mock)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        async def create():
+            return AsyncSlackHandler("xoxb-test", "xapp-test", client=client)
+        self.handler = asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+        self.handler.loop = self.loop
+        self.addCleanup(lambda: asyncio.run_coroutine_threadsafe(
+            self.handler.socket_mode_handler.close_async(), self.loop).result())
+        self.handler.aws_session = MagicMock()
+        self.addCleanup(self.handler.escalations.stop)
+        self.addCleanup(self.handler.dispatcher.shutdown, False)
+        self.addCleanup(self.handler.outbox.stop, False)
+
+    def dispatch(self, event_id, event):
+        from slack_bolt.request.async_request import AsyncBoltRequest
+
+        body = {"type": "event_callback", "team_id": "T1", "api_app_id": "A1", "event_id": event_id, "event": event}
+        request = AsyncBoltRequest(body=body, mode="socket_mode")
+        return asyncio.run_coroutine_threadsafe(self.handler.app.async_dispatch(request), self.loop).result()
+
+    def wait_for_dispatcher(self, completed):
+        deadline = time.monotonic() + 5
+        while self.handler.dispatcher.stats()["completed"] < completed and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    @patch('slack_handler.query_bedrock_kb_in_session', return_value=("Part-timers get 12 days.", True, "s-3"))
+    @patch('slack_handler.query_bedrock_kb', return_value=("Full-timers get 25 days.", True))
+    def test_follow_up_in_thread_goes_through_the_dispatcher(self, mock_query, mock_session_query):
+        self.dispatch("Ev1", {"type": "app_mention", "user": "U1", "channel": "C1", "ts": "300.1",
+                              "text": "<@UBOT> How many vacation days do I get?"})
+        self.wait_for_dispatcher(1)
+        self.dispatch("Ev2", {"type": "app_mention", "user": "U1", "channel": "C1", "ts": "300.5",
+                              "thread_ts": "300.1", "text": "<@UBOT> and part-timers?"})
+        self.wait_for_dispatcher(2)
+        self.handler.outbox.stop(wait=True)
+
+        _, query, _, history = mock_session_query.call_args.args
+        self.assertIn("and part-timers?", query)
+        self.assertEqual(len(history[1]), 1)
+        reply = self.post.call_args.kwargs
+        self.assertEqual(reply["thread_ts"], "300.1")
+        self.assertIn("Part-timers get 12 days.", reply["text"])
+        self.assertEqual(self.handler.deduplicator.stats()["claimed"], 2)
+
+
+def _slow_stream(*deltas, error=None):
+    def stream(session, messages):
+        for delta in deltas:
+            time.sleep(0.02)
+            yield delta
+        if error is not None:
+            raise error
+    return stream
+
+
+class TestStreamingReplies(unittest.TestCase):
+    def setUp(self):
+        self.handler = SlackHandler("xoxb-test", "xapp-test", defer_auth=True)
+        self.handler.aws_session = MagicMock()
+        self.handler.stream_update_interval = 0
+        self.handler.outbox = SlackOutbox(channel_rate=1000, channel_burst=1000, method_limits={})
+        self.addCleanup(self.handler.escalations.stop)
+        self.addCleanup(self.handler.dispatcher.shutdown, False)
+        self.addCleanup(self.handler.outbox.stop, False)
+        self.command = {"channel_id": "C1", "user_id": "U1", "response_url": "https://hooks.slack.test/1"}
+
+    @patch('slack_handler.query_claude')
+    def test_answer_replaces_the_ephemeral_placeholder(self, mock_query):
+        respond = MagicMock()
+        with patch('slack_handler.stream_claude', _slow_stream("Pay", "day is ", "the 25th.")):
+            text = self.handler.respond_streaming(self.command, "[]", respond)
+
+        self.assertEqual(text, "Payday is the 25th.")
+        self.assertLessEqual(respond.call_count, 5)
+        self.assertTrue(all(call.kwargs.get("replace_original") for call in respond.call_args_list))
+        self.assertEqual(respond.call_args.kwargs["text"], "Payday is the 25th.")
+        mock_query.assert_not_called()
+
+    @patch('slack_handler.query_claude')
+    def test_interrupted_stream_is_marked_incomplete(self, mock_query):
+        respond = MagicMock()
+        with patch('slack_handler.stream_claude', _slow_stream("Step one.", error=RuntimeError("stream reset"))):
+            text = self.handler.respond_streaming(self.command, "[]", respond)
+
+        self.assertEqual(text, "Step one." + STREAM_INTERRUPTED_NOTICE)
+        self.assertEqual(respond.call_args.kwargs["text"], text)
+        mock_query.assert_not_called()
+
+    def test_failed_update_does_not_end_the_stream(self):
+        calls = []
+
+        def respond(text=None, replace_original=False):
+            calls.append(text)
+            if len(calls) == 2:
+                raise RuntimeError("invalid_blocks")
+
+        with patch('slack_handler.stream_claude', _slow_stream("a", "b", "c", "d", "e")):
+            text = self.handler.respond_streaming(self.command, "[]", respond)
+
+        self.assertEqual(text, "abcde")
+        self.assertEqual(calls[-1], "abcde")
+        self.assertEqual(len(calls), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import threading
+import time
+from slack_outbox import SlackOutbox, SlackOutboxFull, SlackRateLimited, TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refills_at_rate_and_pauses(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=2.0, burst=1, clock=lambda: now[0])
+        self.assertEqual(bucket.wait_time(0.0), 0.0)
+        bucket.take()
+        self.assertAlmostEqual(bucket.wait_time(0.0), 0.5)
+        self.assertEqual(bucket.wait_time(0.5), 0.0)
+        bucket.pause(3.0)
+        self.assertAlmostEqual(bucket.wait_time(1.0), 2.0)
+
+
+class TestSlackOutbox(unittest.TestCase):
+    def make_outbox(self, **kwargs):
+        kwargs.setdefault("channel_rate", 1000.0)
+        kwargs.setdefault("channel_burst", 1000)
+        kwargs.setdefault("method_limits", {})
+        outbox = SlackOutbox(**kwargs)
+        self.addCleanup(outbox.stop, False)
+        return outbox
+
+    def test_merges_texts_queued_for_the_same_conversation(self):
+        outbox = self.make_outbox(workers=1)
+        release = threading.Event()
+        sent = []
+
+        def send(text):
+            release.wait(5)
+            sent.append(text)
+            return "ok"
+
+        first = outbox.submit("chat.postMessage", "C1", send, "busy", merge_key="C1:1.0")
+        time.sleep(0.05)
+        futures = [outbox.submit("chat.postMessage", "C1", send, text, merge_key="C1:1.0") for text in ("one", "two")]
+        other_thread = outbox.submit("chat.postMessage", "C1", send, "threaded", merge_key="C1:2.0")
+        release.set()
+
+        for future in [first, other_thread] + futures:
+            self.assertEqual(future.result(5), "ok")
+        self.assertEqual(sorted(sent), sorted(["busy", "one\n\ntwo", "threaded"]))
+        self.assertEqual(outbox.stats()["merged"], 1)
+
+    def test_messages_without_merge_key_are_sent_alone(self):
+        outbox = self.make_outbox(workers=1)
+        release = threading.Event()
+        sent = []
+
+        def send(text):
+            release.wait(5)
+            sent.append(text)
+
+        outbox.submit("chat.postMessage", "C1", send, "busy")
+        time.sleep(0.05)
+        # e.g. top-level replies to two different users
+        outbox.submit("chat.postMessage", "C1", send, "a")
+        outbox.submit("chat.postMessage", "C1", send, "b")
+        release.set()
+        outbox.stop(wait=True)
+        self.assertEqual(sent, ["busy", "a", "b"])
+
+    def test_retries_after_rate_limit(self):
+        outbox = self.make_outbox()
+        calls = []
+
+        def send(text):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise SlackRateLimited(0.2)
+            return "ok"
+
+        self.assertEqual(outbox.submit("chat.postMessage", "C1", send, "hi").result(5), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+        stats = outbox.stats()
+        self.assertEqual((stats["rate_limited"], stats["retried"], stats["sent"]), (1, 1, 1))
+
+    def test_gives_up_after_max_attempts(self):
+        outbox = self.make_outbox(max_attempts=2)
+
+        def send(text):
+            raise SlackRateLimited(0.01)
+
+        with self.assertRaises(SlackRateLimited):
+            outbox.submit("chat.postMessage", "C1", send, "hi").result(5)
+        self.assertEqual(outbox.stats()["dropped_attempts"], 1)
+
+    def test_drops_when_queue_is_full(self):
+        outbox = self.make_outbox(workers=1, max_queue=1)
+        release = threading.Event()
+        outbox.submit("chat.postMessage", "C1", lambda text: release.wait(5), "busy")
+        time.sleep(0.05)
+        outbox.submit("chat.postMessage", "C2", lambda text: None, "queued")
+        dropped = outbox.submit("chat.postMessage", "C3", lambda text: None, "dropped")
+        release.set()
+        with self.assertRaises(SlackOutboxFull):
+            dropped.result(1)
+        self.assertEqual(outbox.stats()["dropped_full"], 1)
+
+    def test_channel_rate_keeps_order_without_blocking_other_channels(self):
+        outbox = self.make_outbox(channel_rate=5.0, channel_burst=1)
+        sent = []
+        lock = threading.Lock()
+
+        def send(text):
+            with lock:
+                sent.append((text, time.monotonic()))
+
+        started = time.monotonic()
+        for i in range(3):
+            outbox.submit("chat.postMessage", "C1", send, f"c1-{i}")
+        outbox.submit("chat.postMessage", "C2", send, "c2")
+        outbox.stop(wait=True)
+
+        order = [text for text, _ in sent]
+        self.assertEqual([text for text in order if text.startswith("c1")], ["c1-0", "c1-1", "c1-2"])
+        self.assertLess(order.index("c2"), order.index("c1-1"))
+        self.assertGreaterEqual(sent[-1][1] - started, 0.35)
+
+
+if __name__ == '__main__':
+    unittest.main()
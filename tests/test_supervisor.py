@@ -0,0 +1,133 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import subprocess
+import time
+from supervisor import WorkerSupervisor, worker_environment
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+        self.signals = []
+
+    def poll(self):
+        return self.returncode
+
+    def send_signal(self, sig):
+        self.signals.append(sig)
+        self.returncode = 0
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+
+class TestWorkerSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.spawned = []
+
+    def spawn(self, index):
+        process = FakeProcess(len(self.spawned) + 1)
+        self.spawned.append((index, process))
+        return process
+
+    def make_supervisor(self, **kwargs):
+        kwargs.setdefault("backoff_initial", 1.0)
+        kwargs.setdefault("backoff_max", 4.0)
+        kwargs.setdefault("stable_seconds", 10.0)
+        supervisor = WorkerSupervisor(self.spawn, clock=lambda: self.now[0], **kwargs)
+        for slot in supervisor._slots:
+            supervisor._start(slot)
+        return supervisor
+
+    def test_restarts_crashed_worker_with_doubling_backoff(self):
+        supervisor = self.make_supervisor(workers=2)
+        restart_times = []
+        for _ in range(4):
+            self.spawned[-1][1].returncode = 1 if self.spawned[-1][0] == 1 else None
+            crashed_at = self.now[0]
+            supervisor.check()
+            while self.spawned[-1][1].returncode is not None:
+                self.now[0] += 0.5
+                supervisor.check()
+            restart_times.append(self.now[0] - crashed_at)
+        self.assertEqual(restart_times, [1.0, 2.0, 4.0, 4.0])
+        self.assertTrue(all(index == 1 for index, _ in self.spawned[2:]))
+        stats = supervisor.stats()
+        self.assertEqual((stats["crashes"], stats["restarts"], stats["running"]), (4, 4, 2))
+
+    def test_backoff_resets_after_stable_run(self):
+        supervisor = self.make_supervisor(workers=1)
+        self.spawned[-1][1].returncode = 1
+        supervisor.check()
+        self.now[0] += 1.0
+        supervisor.check()
+        self.now[0] += 30.0
+        self.spawned[-1][1].returncode = 1
+        supervisor.check()
+        self.now[0] += 1.0
+        supervisor.check()
+        self.assertEqual(len(self.spawned), 3)
+
+    def test_clean_exits_finish_when_not_restarting(self):
+        supervisor = self.make_supervisor(workers=2, restart_clean_exits=False)
+        for _, process in self.spawned:
+            process.returncode = 0
+        self.assertEqual(supervisor.check(), 0)
+        self.assertEqual(len(self.spawned), 2)
+
+    def test_shutdown_signals_workers_and_stops_restarts(self):
+        supervisor = self.make_supervisor(workers=2)
+        self.spawned[0][1].returncode = 1
+        supervisor.check()
+        supervisor.shutdown()
+        self.assertEqual(len(self.spawned[1][1].signals), 1)
+        self.now[0] += 60.0
+        self.assertEqual(supervisor.check(), 0)
+        self.assertEqual(len(self.spawned), 2)
+
+    def test_kills_worker_that_ignores_sigterm(self):
+        code = "import signal, sys, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('ready', flush=True); time.sleep(30)"
+        processes = []
+
+        def spawn(index):
+            process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+            process.stdout.readline()
+            processes.append(process)
+            return process
+
+        supervisor = WorkerSupervisor(spawn, workers=1, shutdown_timeout=0.3)
+        supervisor._start(supervisor._slots[0])
+        started = time.monotonic()
+        supervisor.shutdown()
+        processes[0].stdout.close()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(processes[0].returncode, -9)
+
+
+class TestWorkerEnvironment(unittest.TestCase):
+    def test_shares_state_and_separates_ports(self):
+        env = worker_environment(2, {"METRICS_PORT": "9100", "PREWARM_LOG_PATH": "/tmp/questions.json"})
+        self.assertEqual(env["BOT_WORKER_INDEX"], "2")
+        self.assertEqual(env["DEDUPE_BACKEND"], "sqlite")
+        self.assertEqual(env["HR_ESCALATION_BACKEND"], "sqlite")
+        self.assertEqual(env["CONVERSATION_BACKEND"], "sqlite")
+        self.assertTrue(env["INGESTION_LEASE_PATH"])
+        self.assertTrue(env["ANSWER_STORE_PATH"])
+        self.assertEqual(env["METRICS_PORT"], "9103")
+        self.assertEqual(env["PREWARM_LOG_PATH"], "/tmp/questions.json.2")
+
+    def test_keeps_explicit_settings(self):
+        env = worker_environment(0, {"DEDUPE_BACKEND": "memory", "METRICS_PORT": "0"})
+        self.assertEqual(env["DEDUPE_BACKEND"], "memory")
+        self.assertEqual(env["METRICS_PORT"], "0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,19 +3,34 @@ import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 import json
+import importlib
 from unittest.mock import patch, MagicMock
 import signal
-from src.server import flask_app, main
-from src.assume_role import get_session, assume_role, check_assumed_role
-from src.bedrock_kb_handler import get_bedrock_agent_runtime_client, query_bedrock_kb, get_kb_info
-from src.bedrock_handler import get_bedrock_client, query_claude
-from src.bot_handler import BotHandler
+from assume_role import get_session, assume_role, check_assumed_role
+from bedrock_kb_handler import get_bedrock_agent_runtime_client, query_bedrock_kb, get_kb_info
+from bedrock_handler import get_bedrock_client, query_claude
 import logging 
 from botocore.exceptions import ClientError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# server.py exits at import when these are missing
+SERVER_ENV = {
+    'SLACK_BOT_TOKEN': 'xoxb-test',
+    'SLACK_APP_TOKEN': 'xapp-test',
+    'SLACK_SIGNING_SECRET': 'test_secret',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'BEDROCK_KB_ID': 'kb-test',
+    'BEDROCK_MODEL_ARN': 'arn:aws:bedrock:us-east-1::foundation-model/test',
+}
+
+
+def import_server():
+    with patch.dict(os.environ, SERVER_ENV):
+        return importlib.import_module('server')
+
+
 class TestAssumeRole(unittest.TestCase):
     @patch('boto3.Session')
     def test_get_session(self, mock_session):
@@ -23,11 +38,11 @@ class TestAssumeRole(unittest.TestCase):
         session = get_session()
         self.assertIsNotNone(session)
 
-    @patch('assume_role.get_session')
+    @patch('assume_role.RoleCredentialProvider.start')
     @patch('boto3.Session')
-    def test_assume_role(self, mock_boto_session, mock_get_session):
-        mock_get_session.return_value.client.return_value.get_caller_identity.return_value = {"Account": "123456789012"}
-        mock_get_session.return_value.client.return_value.assume_role.return_value = {
+    def test_assume_role(self, mock_boto_session, mock_start):
+        mock_boto_session.return_value.client.return_value.get_caller_identity.return_value = {"Account": "123456789012"}
+        mock_boto_session.return_value.client.return_value.assume_role.return_value = {
             "Credentials": {
                 "AccessKeyId": "test_key",
                 "SecretAccessKey": "test_secret",
@@ -83,86 +98,32 @@ class TestBedrockHandler(unittest.TestCase):
         response = query_claude(mock_session, json.dumps([{"role": "user", "content": "Test message"}]))
         self.assertEqual(response, 'Test response')
 
-class TestBotHandler(unittest.TestCase):
-    @patch('bot_handler.App')
-    def test_bot_handler_initialization(self, mock_app):
-        handler = BotHandler("test_token", "test_secret")
-        self.assertIsNotNone(handler)
-        self.assertIsNotNone(handler.get_handler())
-
-    @patch('bot_handler.App')
-    def test_set_aws_session(self, mock_app):
-        handler = BotHandler("test_token", "test_secret")
-        mock_session = MagicMock()
-        handler.set_aws_session(mock_session)
-        self.assertEqual(handler.aws_session, mock_session)
-
-
 
 class TestServer(unittest.TestCase):
     def setUp(self):
-        self.app = flask_app
-        self.app.config['TESTING'] = True
-        self.client = self.app.test_client()
-
-    def test_health_check(self):
-        response = self.client.get('/')
-        self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.json, {"status": "healthy"})
-
-    @patch('server.assume_role')
-    @patch('server.check_assumed_role')
-    @patch('server.BotHandler')
-    @patch('server.flask_app.run')
-    def test_main_success(self, mock_run, mock_bot_handler_class, mock_check_assumed_role, mock_assume_role):
-        mock_assume_role.return_value = MagicMock()
-        mock_check_assumed_role.return_value = True
-
-        mock_handler = MagicMock()
-        mock_handler.handle = lambda: None
-        mock_handler.handle.__name__ = 'handle'
-
-        mock_bot_handler = MagicMock()
-        mock_bot_handler.get_handler.return_value = mock_handler
-        mock_bot_handler_class.return_value = mock_bot_handler
-
-        main()
-
-        mock_run.assert_called_once()
-        flask_app.add_url_rule.assert_called_once_with(
-            '/slack/events', 
-            view_func=mock_handler.handle, 
-            methods=['POST']
-        )
-
-    @patch('server.assume_role', return_value=None)
-    @patch('server.check_assumed_role', return_value=False)
-    @patch('server.BotHandler')
-    @patch('server.flask_app.run')
-    def test_main_role_assumption_failure(self, mock_run, mock_bot_handler_class, mock_check_assumed_role, mock_assume_role):
-        with patch('sys.exit') as mock_exit:
-            main()
-            mock_exit.assert_called_once_with(1)
-            mock_run.assert_not_called()
-
-    @patch('server.assume_role')
-    @patch('server.check_assumed_role')
-    @patch('server.BotHandler')
-    @patch('server.flask_app.run')
-    def test_main_exception_handling(self, mock_run, mock_bot_handler_class, mock_check_assumed_role, mock_assume_role):
-        mock_assume_role.side_effect = Exception("Test exception")
-
-        with patch('sys.exit') as mock_exit:
-            main()
-            mock_exit.assert_called_once_with(1)
-            mock_run.assert_not_called()
-
-    def test_signal_handling(self):
-        with patch('server.signal.signal') as mock_signal:
-            import server  # This will trigger the signal handlers to be set up
-            mock_signal.assert_any_call(signal.SIGINT, server.signal_handler)
-            mock_signal.assert_any_call(signal.SIGTERM, server.signal_handler)
-
+        self.server = import_server()
+
+    def test_parse_args_defaults(self):
+        with patch.dict(os.environ, {}, clear=True):
+            args = self.server.parse_args([])
+        self.assertEqual((args.startup_mode, args.mode, args.workers), ("fast", "sync", 1))
+
+    @patch('log_setup.configure_logging')
+    def test_main_exits_when_startup_fails(self, mock_configure_logging):
+        with patch.object(self.server, 'start_metrics_server'), \
+                patch.object(self.server, 'watch_peer_changes'), \
+                patch.object(self.server, 'answer_cache'), \
+                patch.object(self.server, 'fast_start', side_effect=Exception("Test exception")), \
+                patch.object(self.server.signal, 'signal') as mock_signal, \
+                patch('sys.exit') as mock_exit:
+            self.server.main([])
+        mock_exit.assert_called_once_with(1)
+        mock_signal.assert_any_call(signal.SIGINT, self.server.signal_handler)
+        mock_signal.assert_any_call(signal.SIGTERM, self.server.signal_handler)
+
+
+@unittest.skipUnless(os.getenv('RUN_AWS_TESTS'), "set RUN_AWS_TESTS=1 to run against a real AWS account")
+class TestAWSConnection(unittest.TestCase):
     def test_aws_connection(self):
         try:
             assumed_session = assume_role()